@@ -2,10 +2,11 @@ import os
 import logging
 import uuid
 import re
+import hmac
 import glob
 from functools import wraps
 from datetime import datetime, timedelta
-from flask import Flask, Blueprint, request, render_template, redirect, url_for, flash, jsonify, session, abort, send_from_directory
+from flask import Flask, Blueprint, Response, request, render_template, redirect, url_for, flash, jsonify, session, abort, send_from_directory
 from werkzeug.utils import secure_filename
 import json
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
@@ -17,7 +18,11 @@ from wtforms import BooleanField, StringField, PasswordField, TextAreaField, Sel
 from wtforms.validators import DataRequired, Length, Email, EqualTo, Optional
 
 from utils.pdf_processor import extract_text_from_pdf
-from utils.ai_search_gemini import search_documents
+from utils.search_jobs import start_search_job, get_search_job, JOB_COMPLETE
+from utils.search_index import index_document, remove_document_from_index
+from utils.vector_index import get_vector_index, update_document_vectors, update_document_metadata, remove_document_vectors
+from utils.chunk_store import build_document_chunks
+from utils.fulltext_search import filter_documents_by_text
 from utils.gemini_ai import generate_document_summary, generate_friendly_name
 from utils.relevance_generator_gemini import generate_relevance_reasons
 from utils.badge_service import BadgeService
@@ -25,6 +30,7 @@ from utils.recommendation_service import get_user_recommendations, dismiss_recom
 from utils.text_processor import clean_html, format_timestamp
 from utils.thumbnail_routes import thumbnail_bp
 from utils.auth_decorators import admin_required, approved_required
+from utils.llm_metrics import llm_metrics, track_document
 from models import db, Document, User, Badge, UserActivity, SearchLog, TeamResponsibility, UserDismissedRecommendation, DocumentLike
 from statistics import mean
 
@@ -101,6 +107,28 @@ def nl2br(value):
     
     return Markup(value)
 
+# Add custom Jinja filter for search passages with highlighted query terms
+@app.template_filter('highlight_passage')
+def highlight_passage(passage):
+    """
+    Render a search passage with its highlight offsets wrapped in <mark> tags
+    - Text is escaped; passages without highlights render as plain text
+    """
+    from markupsafe import Markup, escape
+    
+    text = passage.get('text') or ''
+    parts = []
+    position = 0
+    for start, end in sorted(passage.get('highlights') or []):
+        if start < position or end > len(text):
+            continue
+        parts.append(escape(text[position:start]))
+        parts.append(Markup('<mark>') + escape(text[start:end]) + Markup('</mark>'))
+        position = end
+    parts.append(escape(text[position:]))
+    
+    return Markup('').join(parts)
+
 # Add custom Jinja filter for humanized timestamps
 @app.template_filter('humanize')
 def humanize_timestamp(dt):
@@ -181,6 +209,52 @@ with app.app_context():
     except Exception as e:
         logger.error(f"Error setting up document content type columns: {str(e)}")
     
+    # Run search cache migration to add corpus versioning and cache tracking columns
+    try:
+        from migrate_search_cache import run_migration as run_search_cache_migration
+        if run_search_cache_migration():
+            logger.info("Search cache columns set up successfully")
+    except Exception as e:
+        logger.error(f"Error setting up search cache columns: {str(e)}")
+    
+    # Run search termination migration to record how each search ended
+    try:
+        from migrate_search_termination import run_migration as run_search_termination_migration
+        if run_search_termination_migration():
+            logger.info("Search termination column set up successfully")
+    except Exception as e:
+        logger.error(f"Error setting up search termination column: {str(e)}")
+    
+    # Run search vector migration to add PostgreSQL full-text search on documents
+    try:
+        from migrate_search_vector import run_migration as run_search_vector_migration
+        if run_search_vector_migration():
+            logger.info("Document search vector set up successfully")
+    except Exception as e:
+        logger.error(f"Error setting up document search vector: {str(e)}")
+    
+    # Run LLM cache migration to store responses shared by all AI features
+    try:
+        from migrate_llm_cache import run_migration as run_llm_cache_migration
+        if run_llm_cache_migration():
+            logger.info("LLM response cache set up successfully")
+    except Exception as e:
+        logger.error(f"Error setting up LLM response cache: {str(e)}")
+    
+    # Drop relevance verdicts that are too old to be reused
+    try:
+        from utils.relevance_memo import prune_relevance_memo
+        prune_relevance_memo()
+    except Exception as e:
+        logger.error(f"Error pruning relevance memo: {str(e)}")
+    
+    # Evict cached LLM responses beyond the size limit
+    try:
+        from utils.llm_cache import prune_llm_cache
+        prune_llm_cache()
+    except Exception as e:
+        logger.error(f"Error pruning LLM response cache: {str(e)}")
+    
     # Check if any admin users exist, if not create one
     admin_exists = User.query.filter_by(is_admin=True).first()
     if not admin_exists:
@@ -489,11 +563,16 @@ def library():
     # Get filter parameters
     category_filter = request.args.get('category', 'all')
     type_filter = request.args.get('type', 'all')
-    sort_by = request.args.get('sort', 'date_desc')
+    search_text = request.args.get('q', '').strip()
+    sort_by = request.args.get('sort', 'relevance' if search_text else 'date_desc')
     
     # Query base
     query = Document.query
     
+    # Apply keyword search, ranked in the database when full-text search is available
+    if search_text:
+        query = filter_documents_by_text(query, search_text, order_by_rank=(sort_by == 'relevance'))
+    
     # Apply category filter if not 'all'
     if category_filter != 'all':
         query = query.filter_by(category=category_filter)
@@ -524,6 +603,7 @@ def library():
                           categories=categories,
                           category_filter=category_filter,
                           type_filter=type_filter,
+                          search_text=search_text,
                           sort_by=sort_by)
 
 @app.route('/chunked_upload', methods=['POST'])
@@ -854,32 +934,37 @@ def _process_uploaded_document(document, user_id, earned_badges):
         user_id: ID of the current user
         earned_badges: Set to add earned badges to
     """
-    # Generate relevance reasons
-    try:
-        from utils.relevance_generator import generate_relevance_reasons
-        relevance_reasons = generate_relevance_reasons(document)
-        document.relevance_reasons = relevance_reasons
-        db.session.commit()
-        logger.info(f"Generated relevance reasons for document {document.id}")
-    except Exception as e:
-        logger.error(f"Error generating relevance reasons: {str(e)}")
-    
-    # Generate summary
-    try:
-        if document.content_type == Document.TYPE_PDF:
-            # Use document_ai for PDFs
-            from utils.document_ai import generate_document_summary
-            summary_result = generate_document_summary(document.id)
-            if summary_result and summary_result.get('success'):
-                logger.info(f"Generated summary for document {document.id}")
-        else:
-            # Use content_processor for web links and YouTube videos
-            from utils.content_processor import generate_content_summary
-            summary_result = generate_content_summary(document, db)
-            if summary_result:
-                logger.info(f"Generated summary for document {document.id}")
-    except Exception as e:
-        logger.error(f"Error generating document summary: {str(e)}")
+    # Attribute the LLM calls below to this document in the LLM metrics
+    with track_document(document.id):
+        # Generate relevance reasons
+        try:
+            from utils.relevance_generator import generate_relevance_reasons
+            relevance_reasons = generate_relevance_reasons(document)
+            document.relevance_reasons = relevance_reasons
+            db.session.commit()
+            logger.info(f"Generated relevance reasons for document {document.id}")
+        except Exception as e:
+            logger.error(f"Error generating relevance reasons: {str(e)}")
+        
+        # Generate summary
+        try:
+            if document.content_type == Document.TYPE_PDF:
+                # Use document_ai for PDFs
+                from utils.document_ai import generate_document_summary
+                summary_result = generate_document_summary(document.id)
+                if summary_result and summary_result.get('success'):
+                    logger.info(f"Generated summary for document {document.id}")
+            else:
+                # Use content_processor for web links and YouTube videos
+                from utils.content_processor import generate_content_summary
+                summary_result = generate_content_summary(document, db)
+                if summary_result:
+                    logger.info(f"Generated summary for document {document.id}")
+        except Exception as e:
+            logger.error(f"Error generating document summary: {str(e)}")
+        
+    # Add the document to the search indexes now that its summary exists
+    _update_search_indexes(document)
     
     # Track badge activity
     try:
@@ -897,11 +982,38 @@ def _process_uploaded_document(document, user_id, earned_badges):
     except Exception as e:
         logger.error(f"Error tracking badge activity: {str(e)}")
 
+def _update_search_indexes(document, text_changed=True):
+    """
+    Refresh the stored chunks and the lexical and semantic search indexes after a document changes
+    
+    Chunks and their vectors only depend on the document text, so edits that
+    leave the text alone (name, category, summary) skip rechunking and only
+    refresh the document's title chunk and category in the vector index.
+    """
+    if text_changed:
+        build_document_chunks(document)
+        index_document(document)
+        update_document_vectors([document])
+    else:
+        index_document(document)
+        update_document_metadata(document)
+
+def _remove_from_search_indexes(doc_id):
+    """Remove a deleted document from the lexical and semantic search indexes"""
+    remove_document_from_index(doc_id)
+    remove_document_vectors(doc_id)
+
+# Longest time the results page waits for a search to produce its final results.
+# The request holds a server thread while it waits; gunicorn.conf.py sizes the thread pool for this.
+SEARCH_PAGE_WAIT_SECONDS = int(os.environ.get("SEARCH_PAGE_WAIT_SECONDS", 120))
+
 @app.route('/search', methods=['GET'])
 @login_required
 def search():
     query = request.args.get('query', '')
     category_filter = request.args.get('category', 'all')
+    # full=1 skips the navigational fast path and always runs the AI search
+    full_search = request.args.get('full') == '1'
     
     logger.info(f"Search request received - Query: '{query}', Category filter: '{category_filter}'")
     
@@ -912,21 +1024,6 @@ def search():
         return render_template('search_results.html', results=[], query='', categories=categories)
     
     try:
-        # Check if the Gemini API key exists
-        if not os.environ.get("GEMINI_API_KEY"):
-            logger.error("Gemini API key is missing")
-            raise Exception("Gemini API key is not configured")
-        
-        logger.info("Building document repository for search")
-        # Get document repository for search
-        document_repository = {
-            'get_all_documents': lambda: [doc.to_dict() for doc in Document.query.all()],
-            'get_documents_by_category': lambda category: [
-                doc.to_dict() for doc in Document.query.filter_by(category=category).all()
-            ],
-            'get_document': lambda doc_id: Document.query.get(doc_id).to_dict() if Document.query.get(doc_id) else None
-        }
-        
         # Get the document count
         if category_filter and category_filter.lower() != "all":
             doc_count = Document.query.filter_by(category=category_filter).count()
@@ -946,27 +1043,36 @@ def search():
                                   selected_category=category_filter,
                                   categories=categories)
         
-        logger.info("Performing search using Gemini API")
         try:
-            search_result = search_documents(query, document_repository, category_filter)
-            results = search_result['results']
-            search_info = search_result['search_info']
-            
-            logger.info(f"Search complete - Results found: {search_info['results_found']}, Time: {search_info['elapsed_time']}s")
+            # Reuse the background search job started from the search overlay, or start one
+            search_job = get_search_job(request.args.get('query_id'))
+            if not (search_job and search_job.user_id == current_user.id
+                    and search_job.query == query and search_job.category_filter == category_filter
+                    and search_job.allow_navigational != full_search):
+                search_job = start_search_job(app, query, category_filter, current_user.id,
+                                              allow_navigational=not full_search)
             
-            # Debug log to check the structure
-            if results:
-                logger.debug(f"First result structure: {json.dumps(results[0], default=str)}")
-                
-            # Generate AI response based on search results
-            try:
-                logger.info(f"Generating AI response for query: '{query}'")
-                from utils.ai_search_gemini import generate_search_response
-                ai_response = generate_search_response(query, search_result)
-                logger.info(f"AI response generated successfully ({len(ai_response)} characters)")
-            except Exception as ai_error:
-                logger.error(f"Error generating AI response: {str(ai_error)}")
-                ai_response = "I couldn't generate a response based on the search results at this time. Please review the document excerpts below for relevant information."
+            # Render as soon as the results are final; the answer then streams into the page
+            answer_started = search_job.wait_for_event('answer_started', SEARCH_PAGE_WAIT_SECONDS)
+            answer_stream = None
+            if search_job.status == JOB_COMPLETE:
+                results = search_job.outcome['results']
+                search_info = search_job.outcome['search_info']
+                ai_response = search_job.outcome['ai_response']
+                cache_hit = search_job.outcome['cache_hit']
+            elif answer_started is not None:
+                results = answer_started['data']['results']
+                search_info = answer_started['data']['search_info']
+                cache_hit = answer_started['data']['cache_hit']
+                ai_response = None
+                # Navigational searches write no answer
+                if not search_info.get('navigational'):
+                    answer_stream = {
+                        'url': url_for('search_progress.api_search_job_events', query_id=search_job.query_id),
+                        'last_event_id': answer_started['id']
+                    }
+            else:
+                raise Exception(search_job.error or "Search did not produce results in time")
         except Exception as search_error:
             logger.error(f"Error during document search: {str(search_error)}")
             import traceback
@@ -997,7 +1103,9 @@ def search():
                 duration_seconds=search_info.get('elapsed_time'),
                 documents_searched=search_info.get('documents_searched'),
                 highest_relevance_score=highest_relevance_score,
-                avg_relevance_score=avg_relevance_score
+                avg_relevance_score=avg_relevance_score,
+                cache_hit=cache_hit,
+                termination=search_info.get('termination')
             )
             
             db.session.add(search_log)
@@ -1034,7 +1142,8 @@ def search():
                               selected_category=category_filter,
                               categories=categories,
                               search_info=search_info,
-                              ai_response=ai_response)
+                              ai_response=ai_response,
+                              answer_stream=answer_stream)
     except Exception as e:
         logger.error(f"Search error: {str(e)}")
         
@@ -1193,30 +1302,32 @@ def chunked_reupload(doc_id):
                 
                 # Regenerate AI insights if requested
                 if regenerate_insights:
-                    try:
-                        logger.info(f"Regenerating document insights...")
-                        if document.text:
-                            # Generate summary and key points
-                            summary_results = generate_document_summary(document.text)
-                            if summary_results:
-                                document.summary = summary_results.get('summary', '')
-                                document.key_points = summary_results.get('key_points', '')
-                                document.summary_generated_at = datetime.utcnow()
-                                
-                            # Generate relevance reasons
-                            relevance_reasons = generate_relevance_reasons(
-                                document.text, 
-                                document.category,
-                                document.friendly_name or document.filename
-                            )
-                            if relevance_reasons:
-                                document.relevance_reasons = relevance_reasons
-                    except Exception as e:
-                        logger.error(f"Error regenerating insights: {str(e)}")
-                        return jsonify({
-                            'status': 'warning',
-                            'message': f'File was uploaded but AI insights regeneration failed: {str(e)}'
-                        }), 200
+                    # Attribute the LLM calls below to this document in the LLM metrics
+                    with track_document(document.id):
+                        try:
+                            logger.info(f"Regenerating document insights...")
+                            if document.text:
+                                # Generate summary and key points
+                                summary_results = generate_document_summary(document.text)
+                                if summary_results:
+                                    document.summary = summary_results.get('summary', '')
+                                    document.key_points = summary_results.get('key_points', '')
+                                    document.summary_generated_at = datetime.utcnow()
+                                    
+                                # Generate relevance reasons
+                                relevance_reasons = generate_relevance_reasons(
+                                    document.text, 
+                                    document.category,
+                                    document.friendly_name or document.filename
+                                )
+                                if relevance_reasons:
+                                    document.relevance_reasons = relevance_reasons
+                        except Exception as e:
+                            logger.error(f"Error regenerating insights: {str(e)}")
+                            return jsonify({
+                                'status': 'warning',
+                                'message': f'File was uploaded but AI insights regeneration failed: {str(e)}'
+                            }), 200
                 
                 # Update document record
                 document.filepath = relative_filepath
@@ -1227,6 +1338,7 @@ def chunked_reupload(doc_id):
                     document.friendly_name = friendly_name
                 
                 db.session.commit()
+                _update_search_indexes(document)
                 
                 return jsonify({
                     'status': 'success',
@@ -1329,27 +1441,29 @@ def reupload_document_post(doc_id):
             
             # Regenerate AI insights if requested
             if form.regenerate_insights.data:
-                try:
-                    logger.info(f"Regenerating document insights...")
-                    if document.text:
-                        # Generate summary and key points
-                        summary_results = generate_document_summary(document.text)
-                        if summary_results:
-                            document.summary = summary_results.get('summary', '')
-                            document.key_points = summary_results.get('key_points', '')
-                            document.summary_generated_at = datetime.utcnow()
-                            
-                        # Generate relevance reasons
-                        relevance_reasons = generate_relevance_reasons(
-                            document.text, 
-                            document.category,
-                            document.friendly_name or document.filename
-                        )
-                        if relevance_reasons:
-                            document.relevance_reasons = relevance_reasons
-                except Exception as e:
-                    logger.error(f"Error regenerating insights: {str(e)}")
-                    flash(f'Warning: Could not regenerate AI insights: {str(e)}', 'warning')
+                # Attribute the LLM calls below to this document in the LLM metrics
+                with track_document(document.id):
+                    try:
+                        logger.info(f"Regenerating document insights...")
+                        if document.text:
+                            # Generate summary and key points
+                            summary_results = generate_document_summary(document.text)
+                            if summary_results:
+                                document.summary = summary_results.get('summary', '')
+                                document.key_points = summary_results.get('key_points', '')
+                                document.summary_generated_at = datetime.utcnow()
+                                
+                            # Generate relevance reasons
+                            relevance_reasons = generate_relevance_reasons(
+                                document.text, 
+                                document.category,
+                                document.friendly_name or document.filename
+                            )
+                            if relevance_reasons:
+                                document.relevance_reasons = relevance_reasons
+                    except Exception as e:
+                        logger.error(f"Error regenerating insights: {str(e)}")
+                        flash(f'Warning: Could not regenerate AI insights: {str(e)}', 'warning')
             
             # Update document record
             document.filepath = relative_filepath
@@ -1363,6 +1477,7 @@ def reupload_document_post(doc_id):
                 flash(f"Document name updated to '{form.friendly_name.data}'", 'info')
                 
             db.session.commit()
+            _update_search_indexes(document)
             
             # Log success message
             logger.info(f"Successfully reuploaded document: {doc_id}")
@@ -1462,6 +1577,7 @@ def edit_document(doc_id):
         
         # Save changes
         db.session.commit()
+        _update_search_indexes(document, text_changed=False)
         
         # Log and notify of update
         logger.info(f"Updated document {doc_id} metadata: '{old_name}' -> '{document.friendly_name}'")
@@ -1598,6 +1714,9 @@ def get_categories():
     categories = db.session.query(Document.category).distinct().all()
     return jsonify([category[0] for category in categories])
     
+# Minimum semantic similarity for a curated topic to be suggested
+TOPIC_MIN_SIMILARITY = 0.3
+
 @app.route('/api/document-topics')
 @login_required
 def get_document_topics():
@@ -1676,8 +1795,16 @@ def get_document_topics():
         "Digital engagement", "Virtual agents"
     ]
     
-    for term in pm_terms:
-        if term not in popular_topics:
+    # Only suggest the curated terms the library actually covers
+    try:
+        index = get_vector_index()
+        term_scores = index.best_match_scores(pm_terms) if index is not None else [1.0] * len(pm_terms)
+    except Exception as e:
+        app.logger.warning(f"Error scoring suggested topics against the vector index: {e}")
+        term_scores = [1.0] * len(pm_terms)
+    
+    for term, score in zip(pm_terms, term_scores):
+        if term not in popular_topics and score >= TOPIC_MIN_SIMILARITY:
             popular_topics.append(term)
     
     # Shuffle the topics for variety
@@ -1733,8 +1860,11 @@ def generate_document_summary_api(doc_id):
         if document.user_id != current_user.id and not current_user.is_admin:
             return jsonify({'success': False, 'error': 'Permission denied'}), 403
         
-        # Generate summary using our AI utility
-        result = generate_document_summary(doc_id)
+        # Generate summary using our AI utility, attributing its LLM calls to this document
+        with track_document(document.id):
+            result = generate_document_summary(doc_id)
+        if result.get('success'):
+            _update_search_indexes(document, text_changed=False)
         
         # Track summarize activity for badge
         try:
@@ -1797,6 +1927,7 @@ def delete_document(doc_id):
         # Delete from database
         db.session.delete(document)
         db.session.commit()
+        _remove_from_search_indexes(doc_id)
         
         flash(f'Document "{document.filename}" deleted successfully', 'success')
     except Exception as e:
@@ -1965,6 +2096,43 @@ def admin_search_analytics():
                           current_page=page,
                           total_pages=pagination.pages or 1)
 
+@app.route('/admin/llm-metrics')
+@login_required
+@admin_required
+def admin_llm_metrics():
+    """Admin page for LLM latency, token and cost statistics of this worker"""
+    snapshot = llm_metrics.snapshot()
+    if request.args.get('format') == 'json':
+        return jsonify(snapshot)
+    
+    totals = {
+        'calls': sum(item['calls'] for item in snapshot['features']),
+        'input_tokens': sum(item['input_tokens'] for item in snapshot['features']),
+        'output_tokens': sum(item['output_tokens'] for item in snapshot['features']),
+        'cost_usd': sum(item['cost_usd'] for item in snapshot['features'])
+    }
+    
+    return render_template('admin/llm_metrics.html',
+                          totals=totals,
+                          features=snapshot['features'],
+                          series=snapshot['series'],
+                          documents=snapshot['documents'][:50],
+                          providers=snapshot['providers'],
+                          started_at=snapshot['started_at'])
+
+# Bearer token that lets a Prometheus scraper read /metrics without an admin session
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """LLM call metrics in the Prometheus text format"""
+    authorized = current_user.is_authenticated and current_user.is_admin
+    if not authorized and METRICS_TOKEN:
+        authorized = hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}")
+    if not authorized:
+        abort(403)
+    return Response(llm_metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/admin/users')
 @login_required
 @admin_required
@@ -0,0 +1,87 @@
+"""
+Benchmark loading the search corpus with Document.to_dict() against the
+lightweight column projection used by the search document repository.
+
+Usage:
+    python benchmark_search_repository.py [--sizes 1000 10000] [--database-url URL]
+
+Uses a throwaway in-memory SQLite database unless a database URL is given;
+against a real database the synthetic documents are rolled back afterwards.
+"""
+import os
+import time
+import uuid
+import argparse
+import logging
+import tracemalloc
+
+from flask import Flask
+
+from models import db, Document
+from utils.search_service import get_search_documents
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DOCUMENT_TEXT = "Mechanical ventilation settings and weaning protocols for adult patients. " * 400
+
+def create_app(database_url):
+    """Create a minimal app bound to the benchmark database"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+def add_documents(count):
+    """Add synthetic PDF documents pointing at files that do not exist"""
+    for index in range(count):
+        db.session.add(Document(
+            id=str(uuid.uuid4()),
+            filename=f"benchmark_{index}.pdf",
+            friendly_name=f"Benchmark document {index}",
+            filepath=f"./uploads/benchmark_{index}.pdf",
+            text=DOCUMENT_TEXT,
+            category=['Protocols', 'Guidelines', 'Research'][index % 3],
+            content_type=Document.TYPE_PDF
+        ))
+    db.session.flush()
+
+def measure(label, load):
+    """Time a corpus load and record its peak Python memory"""
+    db.session.expire_all()
+    tracemalloc.start()
+    start = time.perf_counter()
+    documents = load()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    logging.info(f"{label:<12} {len(documents):>6} docs  {elapsed * 1000:>9.1f} ms  peak {peak / 1024 / 1024:>7.1f} MiB")
+    return elapsed
+
+def run_benchmark(sizes, database_url):
+    """Run the benchmark for each corpus size"""
+    app = create_app(database_url)
+    with app.app_context():
+        db.create_all()
+        for size in sorted(sizes):
+            try:
+                add_documents(size)
+                logging.info(f"Corpus of {size} documents")
+                full = measure("to_dict", lambda: [doc.to_dict() for doc in Document.query.all()])
+                light = measure("projection", get_search_documents)
+                logging.info(f"Projection is {full / light:.1f}x faster")
+            finally:
+                # Discard the synthetic documents and any flags to_dict() set on them
+                db.session.rollback()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the search document repository")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help="Corpus sizes to test")
+    parser.add_argument('--database-url', default=os.environ.get("BENCHMARK_DATABASE_URL", "sqlite://"),
+                        help="Database to run against (default: in-memory SQLite)")
+    args = parser.parse_args()
+    run_benchmark(args.sizes, args.database_url)
+
+if __name__ == "__main__":
+    main()
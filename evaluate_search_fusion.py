@@ -0,0 +1,167 @@
+"""
+Offline evaluation of candidate selection strategies on logged search queries
+
+For each recent SearchLog query the script builds the shortlist each strategy
+would send to Gemini and measures:
+- fan-out: documents sent for LLM scoring
+- recall: share of the known relevant documents the shortlist contains
+
+Relevance labels come from the relevance memo (verdicts Gemini already gave
+for the same query and document text). With --judge, pooled documents
+without a stored verdict are scored with Gemini and memoized first, so later
+runs are free.
+
+Usage:
+    python evaluate_search_fusion.py [--queries 50] [--relative-scores 0.3 0.5 0.7] [--judge]
+"""
+import os
+import sys
+import argparse
+import logging
+from flask import Flask
+from models import db, SearchLog
+from utils.search_service import get_search_documents, get_document_texts
+from utils.ai_search_gemini import (retrieval_scores, prepare_chunk_excerpts, judge_document, build_search_result,
+                                     CANDIDATE_LIMIT, RELEVANCE_MEMO_MODEL)
+from utils.rank_fusion import fuse_rankings, SHORTLIST_MIN
+from utils.relevance_memo import content_hash, get_memoized_verdicts, save_verdicts
+
+# Set up logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def create_app():
+    """Create Flask app for database access"""
+    app = Flask(__name__)
+    
+    # Configure database
+    DATABASE_URL = os.environ.get('DATABASE_URL')
+    if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
+        DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+    app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_pre_ping': True,
+        'pool_recycle': 300
+    }
+    db.init_app(app)
+    
+    return app
+
+def round_robin_shortlist(score_sets, doc_ids, limit):
+    """The previous strategy: interleave each source's ranking, then fill in repository order"""
+    rankings = [sorted(scores, key=scores.get, reverse=True) for scores in score_sets.values()]
+    selected = []
+    for position in range(max((len(ranking) for ranking in rankings), default=0)):
+        for ranking in rankings:
+            if position < len(ranking) and ranking[position] not in selected:
+                selected.append(ranking[position])
+    selected.extend(doc_id for doc_id in doc_ids if doc_id not in selected)
+    return selected[:limit]
+
+def load_logged_queries(limit):
+    """Get the most recent distinct (query, category) pairs from the search log"""
+    seen = set()
+    pairs = []
+    # SearchLog.query is a column here, so select through the session
+    rows = db.session.query(SearchLog.query, SearchLog.category_filter).order_by(SearchLog.executed_at.desc())
+    for query, category_filter in rows.yield_per(500):
+        key = (query.strip().lower(), (category_filter or 'all').lower())
+        if key[0] and key not in seen:
+            seen.add(key)
+            pairs.append((query.strip(), category_filter or 'all'))
+            if len(pairs) >= limit:
+                break
+    return pairs
+
+def label_documents(query, documents, judge):
+    """
+    Get relevance labels for documents from the relevance memo
+    
+    Args:
+        query: Search query
+        documents: Document dictionaries to label
+        judge: Score unlabelled documents with Gemini and memoize the verdicts
+    
+    Returns:
+        dict: Mapping of doc_id to True/False for labelled documents
+    """
+    prepared, _ = prepare_chunk_excerpts(query, documents, get_document_texts)
+    hashes = {doc['id']: content_hash(doc.get('text') or '') for doc in prepared}
+    verdicts = get_memoized_verdicts(query, RELEVANCE_MEMO_MODEL, hashes.values())
+    
+    if judge:
+        new_verdicts = {}
+        for doc in prepared:
+            if hashes[doc['id']] not in verdicts:
+                verdict = judge_document(doc, query)
+                if verdict is not None:
+                    new_verdicts[hashes[doc['id']]] = verdict
+        save_verdicts(query, RELEVANCE_MEMO_MODEL, new_verdicts)
+        verdicts.update(new_verdicts)
+    
+    return {doc['id']: build_search_result(doc, verdicts[hashes[doc['id']]]) is not None
+            for doc in prepared if hashes[doc['id']] in verdicts}
+
+def evaluate(query_limit, relative_scores, judge):
+    """Run the evaluation and print one line per strategy"""
+    strategies = ['round_robin', 'rrf_fixed'] + [f"rrf_adaptive@{value}" for value in relative_scores]
+    totals = {name: {'fan_out': 0, 'found': 0} for name in strategies}
+    relevant_total = 0
+    evaluated = 0
+    
+    for query, category_filter in load_logged_queries(query_limit):
+        category = category_filter if category_filter.lower() != 'all' else None
+        documents = get_search_documents(category)
+        if len(documents) <= CANDIDATE_LIMIT:
+            continue
+        
+        doc_ids = [doc['id'] for doc in documents]
+        score_sets = retrieval_scores(query, documents, CANDIDATE_LIMIT, category)
+        shortlists = {
+            'round_robin': round_robin_shortlist(score_sets, doc_ids, CANDIDATE_LIMIT),
+            'rrf_fixed': fuse_rankings(score_sets, doc_ids, CANDIDATE_LIMIT, adaptive=False)
+        }
+        for value in relative_scores:
+            shortlists[f"rrf_adaptive@{value}"] = fuse_rankings(
+                score_sets, doc_ids, CANDIDATE_LIMIT, adaptive=True, relative_score=value)
+        
+        # Pool every strategy's shortlist so recall is measured against the same labelled set
+        documents_by_id = {doc['id']: doc for doc in documents}
+        pool = {doc_id for shortlist in shortlists.values() for doc_id in shortlist}
+        labels = label_documents(query, [documents_by_id[doc_id] for doc_id in pool], judge)
+        relevant = {doc_id for doc_id, is_relevant in labels.items() if is_relevant}
+        
+        evaluated += 1
+        relevant_total += len(relevant)
+        for name, shortlist in shortlists.items():
+            totals[name]['fan_out'] += len(shortlist)
+            totals[name]['found'] += len(relevant.intersection(shortlist))
+        logger.info(f"'{query}': {len(relevant)} relevant of {len(labels)} labelled, "
+                    + ", ".join(f"{name}={len(shortlist)}" for name, shortlist in shortlists.items()))
+    
+    if not evaluated:
+        logger.warning(f"No logged queries ran against more than {CANDIDATE_LIMIT} documents")
+        return False
+    
+    print(f"\n{evaluated} queries, {relevant_total} relevant documents, shortlist min {SHORTLIST_MIN} max {CANDIDATE_LIMIT}")
+    print(f"{'strategy':<22}{'mean fan-out':>14}{'recall':>10}")
+    for name in strategies:
+        recall = totals[name]['found'] / relevant_total if relevant_total else 0.0
+        print(f"{name:<22}{totals[name]['fan_out'] / evaluated:>14.1f}{recall:>10.1%}")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate candidate selection on logged search queries")
+    parser.add_argument('--queries', type=int, default=50, help="Number of recent distinct queries to evaluate")
+    parser.add_argument('--relative-scores', type=float, nargs='+', default=[0.3, 0.5, 0.7],
+                        help="Adaptive shortlist thresholds to compare")
+    parser.add_argument('--judge', action='store_true',
+                        help="Score unlabelled pooled documents with Gemini (costs API calls)")
+    args = parser.parse_args()
+    
+    app = create_app()
+    with app.app_context():
+        success = evaluate(args.queries, args.relative_scores, args.judge)
+    sys.exit(0 if success else 1)
@@ -1,11 +1,18 @@
 # Gunicorn configuration file for large file uploads
+import os
 
 # Binding
 bind = "0.0.0.0:5000"
 
 # Worker processes
+# Search jobs and their progress events live in process memory (utils/search_jobs.py),
+# so every request for a job must reach the worker that started it: keep one worker.
 workers = 1
-threads = 2
+# Each search in progress holds a thread for its progress stream, another for the
+# results page or answer stream, and no-JS searches block the results request for up to
+# SEARCH_PAGE_WAIT_SECONDS. Size threads to at least twice the expected concurrent
+# searches plus headroom for regular page loads and uploads.
+threads = int(os.environ.get("GUNICORN_THREADS", 32))
 
 # Timeouts 
 timeout = 300  # 5 minutes - increased for large file uploads
@@ -37,4 +44,11 @@ worker_connections = 1000
 
 # Python-specific settings for large file handling
 post_fork = lambda server, worker: worker.log.info("Worker spawned (pid: %s)", worker.pid)
-post_worker_init = lambda worker: worker.log.info("Worker initialized with large file support")
\ No newline at end of file
+
+def post_worker_init(worker):
+    worker.log.info("Worker initialized with large file support")
+    # Chunk documents stored before the chunk store existed; search reads their full text until then
+    from main import start_chunk_backfill, start_vector_index_warmup
+    start_chunk_backfill()
+    # Searches run on lexical scores alone until the vector index is ready
+    start_vector_index_warmup()
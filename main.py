@@ -1,4 +1,5 @@
 import logging
+import threading
 from app import app
 from models import db, Badge, Document
 from utils.document_ai import generate_friendly_name
@@ -304,6 +305,35 @@ def setup_featured_documents():
     except Exception as e:
         logging.error(f"Error setting up featured document columns: {str(e)}")
 
+def setup_document_chunks():
+    """Create the chunk store and chunk any documents that do not have chunks yet"""
+    try:
+        with app.app_context():
+            from migrate_document_chunks import run_migration
+            if run_migration():
+                logging.info("Document chunk store set up successfully")
+            else:
+                logging.error("Failed to set up document chunk store")
+    except Exception as e:
+        logging.error(f"Error setting up document chunk store: {str(e)}")
+
+def start_chunk_backfill():
+    """Chunk documents that do not have chunks yet in a background thread, so startup is not delayed"""
+    def backfill():
+        try:
+            with app.app_context():
+                from utils.chunk_store import backfill_document_chunks
+                backfill_document_chunks()
+        except Exception as e:
+            logging.error(f"Error backfilling document chunks: {str(e)}")
+    
+    threading.Thread(target=backfill, name="chunk-backfill", daemon=True).start()
+
+def start_vector_index_warmup():
+    """Build the vector index in a background thread when none exists yet, so no request builds it"""
+    from utils.vector_index import get_vector_index, start_vector_index_build
+    if get_vector_index() is None:
+        start_vector_index_build(app)
 
 def run_dev_initializations():
     # Initialize badges
@@ -324,6 +354,9 @@ def run_dev_initializations():
     # Set up featured document columns
     setup_featured_documents()
     
+    # Chunk documents for passage-level search
+    setup_document_chunks()
+    
     # Fix relevance format issues
     fix_relevance_format()
     
@@ -0,0 +1,41 @@
+"""
+Migration script for the passage-level chunk store
+This adds:
+- the document_chunk table
+- chunks for every existing document that does not have any yet
+"""
+import sys
+import logging
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, DocumentChunk
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def run_migration():
+    """Create the document_chunk table and chunk existing documents"""
+    try:
+        engine = db.engine
+        inspector = db.inspect(engine)
+        
+        if 'document_chunk' not in inspector.get_table_names():
+            DocumentChunk.__table__.create(engine)
+            logging.info("Created document_chunk table")
+        else:
+            logging.info("document_chunk table already exists")
+        
+        # Import here to avoid circular imports
+        from utils.chunk_store import backfill_document_chunks
+        count = backfill_document_chunks()
+        logging.info(f"Chunked {count} existing documents")
+        
+        return True
+    except SQLAlchemyError as e:
+        logging.error(f"Error running document chunk migration: {str(e)}")
+        return False
+
+if __name__ == "__main__":
+    from main import app
+    with app.app_context():
+        success = run_migration()
+    sys.exit(0 if success else 1)
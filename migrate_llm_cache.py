@@ -0,0 +1,28 @@
+"""
+Migration script for the LLM response cache
+This adds:
+- the llm_response_cache table (responses shared by all AI features, keyed by request hash)
+"""
+from sqlalchemy.exc import SQLAlchemyError
+import logging
+from models import db, LLMResponseCache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def run_migration():
+    """Create the LLM response cache table"""
+    try:
+        engine = db.engine
+        inspector = db.inspect(engine)
+        
+        if 'llm_response_cache' not in inspector.get_table_names():
+            LLMResponseCache.__table__.create(engine)
+            logging.info("Created llm_response_cache table")
+        else:
+            logging.info("llm_response_cache table already exists")
+            
+        return True
+    except SQLAlchemyError as e:
+        logging.error(f"Error running LLM cache migration: {str(e)}")
+        return False
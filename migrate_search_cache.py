@@ -0,0 +1,54 @@
+"""
+Migration script for the search result cache
+This adds:
+- updated_at on the Document table (drives the corpus version used in cache keys)
+- cache_hit on the SearchLog table
+- the search_result_cache table
+"""
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+import logging
+from models import db, SearchResultCache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def run_migration():
+    """Add search result cache columns and table"""
+    try:
+        engine = db.engine
+        inspector = db.inspect(engine)
+        
+        # Add updated_at to document, backfilled from the last known change
+        document_columns = [col['name'] for col in inspector.get_columns('document')]
+        if 'updated_at' not in document_columns:
+            with engine.connect() as conn:
+                conn.execute(text("ALTER TABLE document ADD COLUMN updated_at TIMESTAMP"))
+                conn.execute(text("UPDATE document SET updated_at = COALESCE(summary_generated_at, uploaded_at)"))
+                conn.commit()
+                logging.info("Added updated_at column to document table")
+        else:
+            logging.info("updated_at column already exists in document table")
+        
+        # Add cache_hit to search_log
+        if 'search_log' in inspector.get_table_names():
+            search_log_columns = [col['name'] for col in inspector.get_columns('search_log')]
+            if 'cache_hit' not in search_log_columns:
+                with engine.connect() as conn:
+                    conn.execute(text("ALTER TABLE search_log ADD COLUMN cache_hit BOOLEAN DEFAULT FALSE"))
+                    conn.commit()
+                    logging.info("Added cache_hit column to search_log table")
+            else:
+                logging.info("cache_hit column already exists in search_log table")
+        
+        # Create the cache table
+        if 'search_result_cache' not in inspector.get_table_names():
+            SearchResultCache.__table__.create(engine)
+            logging.info("Created search_result_cache table")
+        else:
+            logging.info("search_result_cache table already exists")
+            
+        return True
+    except SQLAlchemyError as e:
+        logging.error(f"Error running search cache migration: {str(e)}")
+        return False
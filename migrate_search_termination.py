@@ -0,0 +1,36 @@
+"""
+Migration script to record how each search ended
+This adds:
+- termination on the SearchLog table (complete, deadline or early_exit)
+"""
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+import logging
+from models import db
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def run_migration():
+    """Add the termination column to the search_log table"""
+    try:
+        engine = db.engine
+        inspector = db.inspect(engine)
+        
+        if 'search_log' not in inspector.get_table_names():
+            logging.info("search_log table does not exist yet")
+            return True
+        
+        search_log_columns = [col['name'] for col in inspector.get_columns('search_log')]
+        if 'termination' not in search_log_columns:
+            with engine.connect() as conn:
+                conn.execute(text("ALTER TABLE search_log ADD COLUMN termination VARCHAR(20)"))
+                conn.commit()
+                logging.info("Added termination column to search_log table")
+        else:
+            logging.info("termination column already exists in search_log table")
+            
+        return True
+    except SQLAlchemyError as e:
+        logging.error(f"Error running search termination migration: {str(e)}")
+        return False
@@ -0,0 +1,59 @@
+"""
+Migration script for PostgreSQL full-text search on documents
+This adds:
+- search_vector on the Document table, a generated tsvector weighting
+  friendly_name (A), summary (B), key_points (C) and text (D)
+- a GIN index on search_vector
+
+Other databases are left unchanged; search falls back to the local BM25 index.
+"""
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+import logging
+from models import db
+from utils.fulltext_search import SEARCH_VECTOR_CONFIG, SEARCH_VECTOR_TEXT_LIMIT
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def run_migration():
+    """Add the search_vector column and its GIN index to the document table"""
+    try:
+        engine = db.engine
+        inspector = db.inspect(engine)
+        
+        if engine.dialect.name != 'postgresql':
+            logging.info(f"Full-text search column skipped on {engine.dialect.name}")
+            return True
+        
+        document_columns = [col['name'] for col in inspector.get_columns('document')]
+        if 'search_vector' not in document_columns:
+            # Generated columns need PostgreSQL 12+; text is capped so the vector stays under the 1MB tsvector limit
+            with engine.connect() as conn:
+                conn.execute(text(f"""
+                    ALTER TABLE document ADD COLUMN search_vector tsvector
+                    GENERATED ALWAYS AS (
+                        setweight(to_tsvector('{SEARCH_VECTOR_CONFIG}', coalesce(friendly_name, '')), 'A') ||
+                        setweight(to_tsvector('{SEARCH_VECTOR_CONFIG}', coalesce(summary, '')), 'B') ||
+                        setweight(to_tsvector('{SEARCH_VECTOR_CONFIG}', coalesce(key_points, '')), 'C') ||
+                        setweight(to_tsvector('{SEARCH_VECTOR_CONFIG}', left(coalesce(text, ''), {SEARCH_VECTOR_TEXT_LIMIT})), 'D')
+                    ) STORED
+                """))
+                conn.commit()
+                logging.info("Added search_vector column to document table")
+        else:
+            logging.info("search_vector column already exists in document table")
+        
+        document_indexes = [index['name'] for index in inspector.get_indexes('document')]
+        if 'ix_document_search_vector' not in document_indexes:
+            with engine.connect() as conn:
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_document_search_vector ON document USING GIN (search_vector)"))
+                conn.commit()
+                logging.info("Created GIN index on document.search_vector")
+        else:
+            logging.info("GIN index on document.search_vector already exists")
+        
+        return True
+    except SQLAlchemyError as e:
+        logging.error(f"Error running search vector migration: {str(e)}")
+        return False
@@ -175,6 +175,7 @@ class Document(db.Model):
     text = db.Column(db.Text, nullable=True)
     category = db.Column(db.String(100), nullable=False)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Any change bumps the corpus version
     file_available = db.Column(db.Boolean, default=True)  # Flag to indicate if the file is available
     
     # Content type and source information
@@ -204,6 +205,12 @@ class Document(db.Model):
     activities = db.relationship('UserActivity', backref='document', 
                                cascade='all, delete-orphan', 
                                passive_deletes=True)
+    
+    # Passage-level chunks built at ingest for search
+    chunks = db.relationship('DocumentChunk', backref='document',
+                             cascade='all, delete-orphan',
+                             passive_deletes=True,
+                             order_by='DocumentChunk.chunk_index')
                                
     def check_file_exists(self, update_path=False):
         """
@@ -396,6 +403,12 @@ class SearchLog(db.Model):
     highest_relevance_score = db.Column(db.Float, nullable=True)
     avg_relevance_score = db.Column(db.Float, nullable=True)
     
+    # Whether the results were served from the search result cache
+    cache_hit = db.Column(db.Boolean, default=False)
+    
+    # How scoring ended: complete, deadline or early_exit
+    termination = db.Column(db.String(20), nullable=True)
+    
     # Relationship with user
     user = db.relationship('User', backref=db.backref('searches', lazy='dynamic'))
     
@@ -422,6 +435,8 @@ class SearchLog(db.Model):
             'documents_searched': self.documents_searched,
             'highest_relevance_score': self.highest_relevance_score,
             'avg_relevance_score': self.avg_relevance_score,
+            'cache_hit': self.cache_hit,
+            'termination': self.termination,
             'user': user_data
         }
         
@@ -513,4 +528,94 @@ class DocumentLike(db.Model):
             'user_id': self.user_id,
             'document_id': self.document_id,
             'created_at': self.created_at.isoformat() if self.created_at else None
-        }
\ No newline at end of file
+        }
+
+
+class SearchResultCache(db.Model):
+    """Cached search results shared across workers and restarts"""
+    __tablename__ = 'search_result_cache'
+    
+    # SHA-256 of the normalized query, category filter and corpus version
+    cache_key = db.Column(db.String(64), primary_key=True)
+    query_text = db.Column(db.String(255), nullable=False)
+    category_filter = db.Column(db.String(100), nullable=True)
+    corpus_version = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.JSON, nullable=False)  # results, search_info and ai_response
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_accessed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    hit_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f"<SearchResultCache {self.query_text!r} ({self.category_filter or 'all'})>"
+
+
+class RelevanceJudgment(db.Model):
+    """Memoized Gemini relevance verdict for one (query, document content) pair"""
+    __tablename__ = 'relevance_judgment'
+    
+    # SHA-256 of the normalized query and scoring model
+    query_hash = db.Column(db.String(64), primary_key=True)
+    # SHA-256 of the document text that was sent for scoring
+    content_hash = db.Column(db.String(64), primary_key=True)
+    query_text = db.Column(db.String(255), nullable=False)
+    model = db.Column(db.String(64), nullable=False)
+    is_relevant = db.Column(db.Boolean, default=False, nullable=False)
+    relevance_score = db.Column(db.Integer, default=0, nullable=False)
+    passages = db.Column(db.JSON, nullable=True)
+    summary = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    def to_verdict(self):
+        """Convert the stored judgment to the verdict format used by search"""
+        return {
+            'is_relevant': self.is_relevant,
+            'relevance_score': self.relevance_score,
+            'passages': self.passages or [],
+            'summary': self.summary or ''
+        }
+    
+    def __repr__(self):
+        return f"<RelevanceJudgment {self.query_text!r} {self.content_hash[:8]}>"
+
+
+class LLMResponseCache(db.Model):
+    """Stored LLM response, reused when the exact same request is made again"""
+    __tablename__ = 'llm_response_cache'
+    
+    # SHA-256 of the provider, model, generation settings, system instruction and prompt
+    cache_key = db.Column(db.String(64), primary_key=True)
+    task = db.Column(db.String(64), nullable=True)
+    provider = db.Column(db.String(32), nullable=False)
+    model = db.Column(db.String(64), nullable=False)
+    response_text = db.Column(db.Text, nullable=False)
+    input_tokens = db.Column(db.Integer, nullable=True)
+    output_tokens = db.Column(db.Integer, nullable=True)
+    size_bytes = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_accessed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    hit_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f"<LLMResponseCache {self.task} {self.provider}/{self.model} {self.cache_key[:8]}>"
+
+
+class DocumentChunk(db.Model):
+    """Passage of a document's text, built at ingest for search and answer generation"""
+    __tablename__ = 'document_chunk'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.String(36), db.ForeignKey('document.id', ondelete='CASCADE'), nullable=False, index=True)
+    chunk_index = db.Column(db.Integer, nullable=False)  # Position of the chunk within the document
+    text = db.Column(db.Text, nullable=False)
+    start_offset = db.Column(db.Integer, nullable=False)  # Character offsets into Document.text
+    end_offset = db.Column(db.Integer, nullable=False)
+    page_start = db.Column(db.Integer, nullable=True)  # 1-based PDF pages, when known
+    page_end = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('document_id', 'chunk_index', name='uq_document_chunk_index'),
+    )
+    
+    def __repr__(self):
+        return f"<DocumentChunk {self.document_id} #{self.chunk_index}>"
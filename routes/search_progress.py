@@ -1,67 +1,156 @@
 """
-API routes for search progress
+API routes for search progress and search-box suggestions
 """
-import time
+import json
 import logging
-import random
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, current_app, url_for
 from flask_login import login_required, current_user
 
+from utils.search_jobs import start_search_job, get_search_job, JOB_COMPLETE, JOB_FAILED
+from utils.title_index import suggest_documents
+
 # Set up logger
 logger = logging.getLogger(__name__)
 
 # Create Blueprint
 search_progress_bp = Blueprint('search_progress', __name__)
 
+# Seconds between keep-alive comments on an idle event stream
+SSE_KEEPALIVE_SECONDS = 15
+
+def _get_own_job(query_id):
+    """Get a search job if it belongs to the current user"""
+    job = get_search_job(query_id)
+    if job is None or job.user_id != current_user.id:
+        return None
+    return job
+
+def _format_sse(item):
+    """Format a job event as a server-sent event"""
+    return f"id: {item['id']}\nevent: {item['event']}\ndata: {json.dumps(item['data'], default=str)}\n\n"
+
+@search_progress_bp.route('/api/search/jobs', methods=['POST'])
+@login_required
+def api_start_search_job():
+    """
+    Start a search as a background job
+
+    Returns the query_id used to stream progress and to render the results page.
+    Pass full=true to skip the navigational fast path and always run the AI search.
+    """
+    data = request.get_json(silent=True) or request.form
+    query = (data.get('query') or '').strip()
+    category_filter = data.get('category') or 'all'
+    full_search = str(data.get('full', '')).lower() in ('1', 'true')
+
+    if not query:
+        return jsonify({'success': False, 'error': 'Query is required'}), 400
+
+    job = start_search_job(current_app._get_current_object(), query, category_filter, current_user.id,
+                           allow_navigational=not full_search)
+    return jsonify({
+        'success': True,
+        'query_id': job.query_id,
+        'events_url': f"/api/search/jobs/{job.query_id}/events"
+    })
+
+@search_progress_bp.route('/api/search/jobs/<query_id>/events', methods=['GET'])
+@login_required
+def api_search_job_events(query_id):
+    """
+    Stream a search job's progress as server-sent events
+
+    Events: scheduled, scored, result, answer_started, answer_token, answer_reset, complete and error.
+    Reconnecting clients resume after the Last-Event-ID they received; pages
+    joining a job part-way through pass the last event they rendered as the
+    last_event_id query parameter.
+    """
+    job = _get_own_job(query_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Search not found'}), 404
+
+    try:
+        start = int(request.headers.get('Last-Event-ID', request.args.get('last_event_id', -1))) + 1
+    except ValueError:
+        start = 0
+
+    def generate():
+        position = start
+        yield "retry: 2000\n\n"
+        while True:
+            events = job.wait_for_events(position, SSE_KEEPALIVE_SECONDS)
+            if not events:
+                if job.finished:
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            for item in events:
+                yield _format_sse(item)
+            position += len(events)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @search_progress_bp.route('/api/search/progress', methods=['GET'])
 @login_required
 def api_search_progress():
     """
-    API endpoint to provide real-time search progress updates
-    This simulates the thinking process of the AI by providing stage updates
+    API endpoint to provide search progress for a running search job
     """
     query_id = request.args.get('query_id')
-    
-    # In a real implementation, we would look up the actual search progress
-    # For now, we'll return a simulated progress based on the current time
-    current_time = time.time()
-    seed = int(current_time) % 10  # Use current time to create different responses
-    
-    # Calculate a progress percentage (0-100)
-    progress_percent = min(95, (current_time % 30) * 3.33)
-    
-    # Determine which stage we're in based on progress
-    stage = "searching"
-    detail = "Scanning document library..."
-    
-    if progress_percent > 25:
+    job = _get_own_job(query_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Search not found'}), 404
+
+    last = job.last_event()
+    last_type = last['event'] if last else None
+    results_found = len(job.events_of('result'))
+
+    if job.status == JOB_FAILED:
+        stage, detail, progress_percent = "finalizing", "Search failed", 100
+    elif job.status == JOB_COMPLETE:
+        stage, detail, progress_percent = "finalizing", f"Found {results_found} relevant documents", 100
+    elif last_type in ('answer_started', 'answer_token', 'answer_reset'):
+        stage, detail, progress_percent = "generating", "Writing the answer...", 80
+    elif last_type in ('scored', 'result'):
+        scored = job.events_of('scored')
+        completed = scored[-1]['data']['completed'] if scored else 0
+        total = scored[-1]['data']['total'] if scored else 0
+        stage = "analyzing"
+        detail = f"Scored {completed} of {total} documents, {results_found} relevant"
+        progress_percent = 25 + (50 * completed / total if total else 0)
+    elif last_type == 'scheduled':
         stage = "analyzing"
-        detail = "Processing document content..."
-        
-    if progress_percent > 50:
-        stage = "generating"
-        details = [
-            "Consolidating information from multiple sources...",
-            "Synthesizing key insights from relevant documents...",
-            "Evaluating document relevance to your query...",
-            "Identifying patterns across documents...",
-            "Extracting the most valuable information..."
-        ]
-        detail = details[seed % len(details)]
-        
-    if progress_percent > 75:
-        stage = "finalizing"
-        details = [
-            "Preparing comprehensive response...",
-            "Organizing insights for presentation...",
-            "Formatting final results...",
-            "Validating generated response..."
-        ]
-        detail = details[seed % len(details)]
-    
+        detail = f"Scoring {last['data']['documents_to_score']} of {last['data']['documents_searched']} documents..."
+        progress_percent = 25
+    else:
+        stage, detail, progress_percent = "searching", "Scanning document library...", 10
+
     return jsonify({
         'success': True,
+        'status': job.status,
         'stage': stage,
         'detail': detail,
-        'progress': progress_percent
-    })
\ No newline at end of file
+        'progress': progress_percent,
+        'results_found': results_found
+    })
+
+@search_progress_bp.route('/api/search/suggest', methods=['GET'])
+@login_required
+def api_search_suggest():
+    """
+    Suggest documents by name while a query is being typed
+    """
+    prefix = request.args.get('q', '')
+    category_filter = request.args.get('category', 'all')
+    if not prefix.strip():
+        return jsonify({'success': True, 'suggestions': []})
+
+    suggestions = suggest_documents(prefix, category_filter)
+    return jsonify({
+        'success': True,
+        'suggestions': [dict(suggestion, url=url_for('view_document', doc_id=suggestion['id']))
+                        for suggestion in suggestions]
+    })
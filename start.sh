@@ -17,6 +17,5 @@ exec gunicorn --bind 0.0.0.0:5000 --reuse-port --reload \
   --limit-request-fields 0 \
   --limit-request-field-size 0 \
   --worker-class gthread \
-  --threads 4 \
   --config gunicorn.conf.py \
   main:app
\ No newline at end of file
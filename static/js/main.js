@@ -26,7 +26,7 @@ document.addEventListener('DOMContentLoaded', function() {
         searchInProgressOverlay.style.visibility = 'hidden';
         
         // Define the global showAISearchOverlay function
-        window.showAISearchOverlay = function(query) {
+        window.showAISearchOverlay = function(query, form) {
             console.log('Showing AI search overlay for query:', query);
             // Update the query text
             const searchQueryElement = searchInProgressOverlay.querySelector('.search-query');
@@ -41,7 +41,7 @@ document.addEventListener('DOMContentLoaded', function() {
             
             // Start AI thinking process
             if (window.aiThinking) {
-                window.aiThinking.start(query);
+                window.aiThinking.start(query, form);
             }
         };
         
@@ -50,12 +50,13 @@ document.addEventListener('DOMContentLoaded', function() {
             /**
              * Start the AI thinking process with animated stages
              * @param {string} query - The search query
+             * @param {HTMLFormElement} form - The search form, submitted normally if streaming is unavailable
              */
-            start: function(query) {
-                // Clear any existing progress interval
-                if (this.progressInterval) {
-                    clearInterval(this.progressInterval);
-                    this.progressInterval = null;
+            start: function(query, form) {
+                // Close any stream from a previous search
+                if (this.eventSource) {
+                    this.eventSource.close();
+                    this.eventSource = null;
                 }
                 
                 // Reset stages
@@ -63,6 +64,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     stage.classList.remove('active', 'completed');
                 });
                 document.querySelector('.timeline-progress').style.width = '0%';
+                searchInProgressOverlay.querySelector('.search-hits').innerHTML = '';
                 
                 // Start with first stage
                 const firstStage = document.getElementById('stage-searching');
@@ -74,39 +76,104 @@ document.addEventListener('DOMContentLoaded', function() {
                 // Add detail to first stage
                 firstStage.querySelector('.stage-detail').textContent = 'Scanning document library...';
                 
-                // Set up progression through stages
-                this.simulateProgress();
+                if (form) {
+                    this.streamSearch(query, form);
+                } else {
+                    this.fallbackSimulatedProgress();
+                }
             },
             
             /**
-             * Get real-time search progress updates from the server
+             * Run the search as a server job and follow its progress events
+             * @param {string} query - The search query
+             * @param {HTMLFormElement} form - The search form
              */
-            simulateProgress: function() {
-                // Generate a query ID for this search session
-                const queryId = Date.now().toString(36) + Math.random().toString(36).substr(2, 5);
+            streamSearch: function(query, form) {
+                const categorySelect = form.querySelector('[name="category"]');
+                const category = categorySelect ? categorySelect.value : 'all';
+                // Forms with full=1 skip the navigational fast path
+                const fullInput = form.querySelector('[name="full"]');
+                const fullSearch = fullInput ? fullInput.value === '1' : false;
                 
-                // Start polling for progress updates
-                this.progressInterval = setInterval(() => {
-                    fetch(`/api/search/progress?query_id=${queryId}`)
-                        .then(response => response.json())
-                        .then(data => {
-                            if (data.success) {
-                                // Update the UI with the current stage information
-                                this.updateStage(data.stage, data.detail, data.progress);
-                                
-                                // If we're at 100%, stop polling
-                                if (data.progress >= 95) {
-                                    clearInterval(this.progressInterval);
-                                }
-                            }
-                        })
-                        .catch(error => {
-                            console.error('Error getting search progress:', error);
-                            // Fall back to simulated progress on error
-                            clearInterval(this.progressInterval);
-                            this.fallbackSimulatedProgress();
-                        });
-                }, 1000); // Poll every second
+                fetch('/api/search/jobs', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                        'X-Requested-With': 'XMLHttpRequest'
+                    },
+                    body: JSON.stringify({ query: query, category: category, full: fullSearch })
+                })
+                .then(response => response.json())
+                .then(data => {
+                    if (!data.success) {
+                        throw new Error(data.error || 'Could not start search');
+                    }
+                    
+                    const source = new EventSource(data.events_url);
+                    this.eventSource = source;
+                    const parse = event => JSON.parse(event.data);
+                    
+                    source.addEventListener('scheduled', event => {
+                        const info = parse(event);
+                        this.updateStage('analyzing', `Scoring ${info.documents_to_score} of ${info.documents_searched} documents...`, 25);
+                    });
+                    
+                    source.addEventListener('scored', event => {
+                        const info = parse(event);
+                        this.updateStage('analyzing', `Scored ${info.completed} of ${info.total} documents`, 25 + 50 * info.completed / info.total);
+                    });
+                    
+                    source.addEventListener('result', event => {
+                        this.addHit(parse(event).result);
+                    });
+                    
+                    // The results are final once the answer starts; the results page streams the answer itself
+                    const openResults = () => {
+                        source.close();
+                        const params = new URLSearchParams({ query: query, category: category, query_id: data.query_id });
+                        if (fullSearch) {
+                            params.set('full', '1');
+                        }
+                        window.location.href = `${form.getAttribute('action')}?${params.toString()}`;
+                    };
+                    
+                    source.addEventListener('answer_started', event => {
+                        const info = parse(event);
+                        this.updateStage('finalizing', `Found ${info.results_found} relevant documents`, 100);
+                        openResults();
+                    });
+                    
+                    source.addEventListener('complete', openResults);
+                    
+                    // Server-side failure or lost connection: fall back to a regular search request
+                    source.addEventListener('error', event => {
+                        if (source.readyState === EventSource.CLOSED || event.data) {
+                            source.close();
+                            form.submit();
+                        }
+                    });
+                })
+                .catch(error => {
+                    console.error('Error starting streamed search:', error);
+                    form.submit();
+                });
+            },
+            
+            /**
+             * Show a relevant document in the overlay as soon as it is found
+             * @param {Object} result - Search result from the server
+             */
+            addHit: function(result) {
+                const hits = searchInProgressOverlay.querySelector('.search-hits');
+                const doc = result.document || {};
+                const hit = document.createElement('div');
+                hit.className = 'search-hit';
+                hit.dataset.score = result.relevance_score;
+                hit.textContent = `${doc.friendly_name || doc.filename} (${result.relevance_score}/10)`;
+                
+                // Keep hits ordered by relevance
+                const next = Array.from(hits.children).find(el => Number(el.dataset.score) < result.relevance_score);
+                hits.insertBefore(hit, next || null);
             },
             
             /**
@@ -198,7 +265,8 @@ document.addEventListener('DOMContentLoaded', function() {
             if (query) {
                 // Use the showAISearchOverlay function
                 if (window.showAISearchOverlay) {
-                    window.showAISearchOverlay(query);
+                    e.preventDefault();
+                    window.showAISearchOverlay(query, mainSearchForm);
                 }
             }
         });
@@ -213,7 +281,127 @@ document.addEventListener('DOMContentLoaded', function() {
             if (query) {
                 // Use the showAISearchOverlay function
                 if (window.showAISearchOverlay) {
-                    window.showAISearchOverlay(query);
+                    e.preventDefault();
+                    window.showAISearchOverlay(query, searchResultsForm);
+                }
+            }
+        });
+    }
+    
+    // Run the full AI search for a query that was answered by document name
+    const fullSearchForm = document.getElementById('fullSearchForm');
+    if (fullSearchForm) {
+        fullSearchForm.addEventListener('submit', function(e) {
+            const query = fullSearchForm.querySelector('[name="query"]').value;
+            if (query && window.showAISearchOverlay) {
+                e.preventDefault();
+                window.showAISearchOverlay(query, fullSearchForm);
+            }
+        });
+    }
+    
+    // Suggest documents by name as the user types a query
+    const setupSearchSuggestions = function(input) {
+        if (!input) {
+            return;
+        }
+        
+        const list = document.createElement('div');
+        list.className = 'search-suggestions list-group d-none';
+        // Placed outside the search container, which clips its overflow
+        const anchor = input.closest('.modern-search-container') || input.parentElement;
+        anchor.parentElement.classList.add('position-relative');
+        anchor.insertAdjacentElement('afterend', list);
+        
+        let timer = null;
+        let latest = 0;
+        const hide = () => list.classList.add('d-none');
+        
+        input.setAttribute('autocomplete', 'off');
+        input.addEventListener('input', function() {
+            clearTimeout(timer);
+            const prefix = input.value;
+            if (!prefix.trim()) {
+                hide();
+                return;
+            }
+            
+            timer = setTimeout(() => {
+                const request = ++latest;
+                const categorySelect = input.form ? input.form.querySelector('[name="category"]') : null;
+                const params = new URLSearchParams({ q: prefix, category: categorySelect ? categorySelect.value : 'all' });
+                fetch(`/api/search/suggest?${params.toString()}`, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+                    .then(response => response.json())
+                    .then(data => {
+                        // Ignore answers to earlier keystrokes
+                        if (request !== latest) {
+                            return;
+                        }
+                        list.innerHTML = '';
+                        (data.suggestions || []).forEach(suggestion => {
+                            const item = document.createElement('a');
+                            item.className = 'list-group-item list-group-item-action';
+                            item.href = suggestion.url;
+                            item.textContent = suggestion.title;
+                            const category = document.createElement('small');
+                            category.className = 'text-muted ms-2';
+                            category.textContent = suggestion.category || '';
+                            item.appendChild(category);
+                            list.appendChild(item);
+                        });
+                        list.classList.toggle('d-none', !list.children.length);
+                    })
+                    .catch(() => hide());
+            }, 150);
+        });
+        
+        input.addEventListener('keydown', function(e) {
+            if (e.key === 'Escape') {
+                hide();
+            }
+        });
+        
+        // Delay hiding so a click on a suggestion still follows its link
+        input.addEventListener('blur', () => setTimeout(hide, 200));
+        input.form?.addEventListener('submit', hide);
+    };
+    
+    setupSearchSuggestions(document.getElementById('mainSearchInput'));
+    setupSearchSuggestions(document.getElementById('searchResultsInput'));
+    
+    // Stream the AI answer into the results page while it is being written
+    const streamedAnswer = document.querySelector('.ai-response[data-stream-url]');
+    if (streamedAnswer) {
+        const answerSource = new EventSource(streamedAnswer.dataset.streamUrl);
+        let answerText = '';
+        
+        // Same formatting as the nl2br template filter, applied to escaped text
+        const formatAnswer = text => {
+            const escaped = text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+            return escaped.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>').replace(/\n/g, '<br>');
+        };
+        
+        answerSource.addEventListener('answer_token', event => {
+            answerText += JSON.parse(event.data).text;
+            streamedAnswer.innerHTML = formatAnswer(answerText);
+        });
+        
+        // A speculative answer was abandoned and is being written again
+        answerSource.addEventListener('answer_reset', () => {
+            answerText = '';
+            streamedAnswer.innerHTML = '';
+        });
+        
+        answerSource.addEventListener('complete', event => {
+            answerSource.close();
+            streamedAnswer.innerHTML = formatAnswer(JSON.parse(event.data).ai_response || answerText);
+        });
+        
+        answerSource.addEventListener('error', event => {
+            if (answerSource.readyState === EventSource.CLOSED || event.data) {
+                answerSource.close();
+                if (!answerText) {
+                    streamedAnswer.textContent = 'The answer could not be generated. Please review the document excerpts below.';
                 }
             }
         });
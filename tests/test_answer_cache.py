@@ -0,0 +1,21 @@
+"""
+Regression tests for reusing generated answers across similar queries
+"""
+from utils.answer_cache import AnswerCache
+
+
+def test_negated_query_does_not_reuse_answer():
+    """A query that negates a cached one gets a miss even though it resolves to the same evidence"""
+    cache = AnswerCache(max_entries=10, ttl_seconds=60, similarity=0.75)
+    cache.set('why do agents quit', 'evidence', 'Agents quit because of schedule pressure.')
+
+    assert cache.get('why do agents not quit', 'evidence') is None
+    assert cache.get('reduce churn without coaching', 'evidence') is None
+
+def test_rephrased_query_reuses_answer():
+    """A rephrasing with the same question words and mostly the same terms is served from the cache"""
+    cache = AnswerCache(max_entries=10, ttl_seconds=60, similarity=0.75)
+    cache.set('how to reduce agent churn', 'evidence', 'Coach new agents weekly.')
+
+    found = cache.get('how to reduce churn of agents quickly', 'evidence')
+    assert found is not None and found[0] == 'Coach new agents weekly.'
@@ -0,0 +1,47 @@
+"""
+Regression tests for the passage model stage of the search cascade
+
+The stage only runs when local snippets are turned off (SEARCH_LOCAL_SNIPPETS=false),
+so it is exercised here against the stub LLM adapters.
+"""
+import os
+
+os.environ.setdefault("LLM_STUB_LATENCY_MS", "1")
+os.environ.setdefault("LLM_STUB_ERROR_RATE", "0")
+
+import pytest
+
+from utils.llm_gateway import llm_gateway, configure_adapters, LLM_MODE_STUB, LLM_MODE
+from utils.ai_search_gemini import PassageExtractor
+
+
+@pytest.fixture(autouse=True)
+def stub_llm():
+    configure_adapters(llm_gateway, LLM_MODE_STUB)
+    yield
+    configure_adapters(llm_gateway, LLM_MODE)
+
+def _document(doc_id, text):
+    return {'id': doc_id, 'filename': f"{doc_id}.pdf", 'friendly_name': None, 'category': 'Billing', 'text': text}
+
+def _screened(doc):
+    return {
+        'document': {'id': doc['id'], 'filename': doc['filename'], 'friendly_name': None, 'category': doc['category']},
+        'relevance_score': 8,
+        'passages': [],
+        'summary': 'Screened as relevant'
+    }
+
+def test_passage_extractor_reads_top_results():
+    """Screened results get the passage model's passages; results it rejects are dropped"""
+    refunds = _document('refunds', "Refunds for annual plans are issued within five business days of approval.")
+    parking = _document('parking', "Visitors park in the north lot and sign in at reception.")
+    results = [_screened(refunds), _screened(parking)]
+
+    extractor = PassageExtractor('annual plan refunds', {'refunds': refunds, 'parking': parking}, {},
+                                 {'refunds': 'refunds-hash', 'parking': 'parking-hash'})
+    extractor.finish(results)
+
+    assert [result['document']['id'] for result in results] == ['refunds']
+    assert 'five business days' in results[0]['passages'][0]['text']
+    assert set(extractor.verdicts) == {'refunds-hash', 'parking-hash'}
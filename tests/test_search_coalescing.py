@@ -0,0 +1,47 @@
+"""
+Regression tests for identical searches attaching to the one already running
+"""
+import time
+import threading
+
+from utils import search_service
+
+
+def test_follower_replays_leader_events_and_shares_its_outcome(monkeypatch):
+    """A second identical search never runs its own search, however long the first one takes"""
+    calls = []
+    release = threading.Event()
+
+    def slow_search(query, category_filter, progress_callback):
+        calls.append(query)
+        progress_callback('scheduled', {'documents_to_score': 2, 'documents_searched': 2})
+        release.wait(5)
+        progress_callback('answer_token', {'text': 'Coach agents weekly.'})
+        return {'results': [], 'search_info': {}, 'ai_response': 'Coach agents weekly.', 'cache_hit': False}
+
+    monkeypatch.setattr(search_service, 'execute_search', slow_search)
+
+    leader_outcome = {}
+    leader = threading.Thread(target=lambda: leader_outcome.update(
+        search_service.run_search('reduce churn', allow_navigational=False)))
+    leader.start()
+    while not calls:
+        time.sleep(0.01)
+
+    follower_events = []
+    follower = threading.Thread(target=lambda: follower_events.append(search_service.run_search(
+        'Reduce  churn', progress_callback=lambda event, data: follower_events.append(event),
+        allow_navigational=False)))
+    follower.start()
+    follower.join(0.2)
+    assert follower.is_alive()
+
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    outcome = follower_events.pop()
+    assert calls == ['reduce churn']
+    assert follower_events == ['scheduled', 'answer_token']
+    assert outcome['ai_response'] == leader_outcome['ai_response']
+    assert outcome['search_info']['coalesced'] is True
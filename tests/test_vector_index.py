@@ -0,0 +1,123 @@
+"""
+Regression tests for semantic retrieval over the vector index
+"""
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+# The index location is read when the search modules are imported
+os.environ.setdefault("SEARCH_INDEX_DIR", tempfile.mkdtemp(prefix='search-index-'))
+
+import numpy as np
+import pytest
+from flask import Flask
+
+from models import db, Document
+from utils import vector_index
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def test_semantic_scores_embeds_unindexed_projection(app, monkeypatch):
+    """A search projection without text for a document missing from the index is loaded and embedded"""
+    monkeypatch.setattr(vector_index, '_index', None)
+    monkeypatch.setattr(vector_index, '_index_mtime', None)
+
+    indexed = Document(id='indexed', filename='onboarding.pdf', category='Guides',
+                       text='Onboarding checklist for new support agents and their first week.')
+    db.session.add(indexed)
+    db.session.commit()
+    vector_index.rebuild_vector_index()
+
+    unindexed = Document(id='unindexed', filename='escalations.pdf', category='Guides',
+                         text='How to escalate a billing dispute to the finance team quickly.')
+    db.session.add(unindexed)
+    db.session.commit()
+    assert 'unindexed' not in vector_index.get_vector_index().doc_ids()
+
+    # Search passes lightweight projections without summary or text
+    projection = {'id': 'unindexed', 'filename': 'escalations.pdf', 'category': 'Guides'}
+    scores = vector_index.semantic_scores('escalate billing dispute', [projection])
+
+    assert 'unindexed' in vector_index.get_vector_index().doc_ids()
+    assert set(scores) == {'unindexed'}
+
+def test_update_document_metadata_keeps_text_chunks(app, monkeypatch):
+    """A metadata edit re-embeds only the title chunk and moves every chunk to the new category"""
+    monkeypatch.setattr(vector_index, '_index', None)
+    monkeypatch.setattr(vector_index, '_index_mtime', None)
+
+    document = Document(id='policy', filename='refunds.pdf', category='Guides',
+                        text='Refunds are issued within five business days of approval. ' * 80)
+    db.session.add(document)
+    db.session.commit()
+    vector_index.rebuild_vector_index()
+    index = vector_index.get_vector_index()
+    before = np.array(index.vectors)
+    chunk_count = len(index.rows)
+    assert chunk_count > 2
+
+    document.friendly_name = 'Chargebacks and disputes'
+    document.category = 'Billing'
+    db.session.commit()
+    assert vector_index.update_document_metadata(document)
+
+    index = vector_index.get_vector_index()
+    after = np.asarray(index.vectors)
+    assert len(index.rows) == chunk_count
+    assert {row['category'] for row in index.rows} == {'Billing'}
+    assert not np.allclose(after[0], before[0])
+    assert np.array_equal(after[1:], before[1:])
+
+def test_semantic_scores_builds_missing_index_in_background(app, monkeypatch, tmp_path):
+    """Without an index on disk, search gets no semantic scores while the index is built off the request"""
+    monkeypatch.setattr(vector_index, '_index', None)
+    monkeypatch.setattr(vector_index, '_index_mtime', None)
+    monkeypatch.setattr(vector_index, 'METADATA_PATH', str(tmp_path / 'chunk_vectors.json'))
+    monkeypatch.setattr(vector_index, 'VECTORS_PATH', str(tmp_path / 'chunk_vectors.npy'))
+    monkeypatch.setattr(vector_index, 'PROJECTION_PATH', str(tmp_path / 'lsa_projection.npy'))
+    monkeypatch.setattr(vector_index, 'IDF_PATH', str(tmp_path / 'hashed_idf.npy'))
+
+    db.session.add(Document(id='refunds', filename='refunds.pdf', category='Billing',
+                            text='Refunds for annual plans are issued within five business days.'))
+    db.session.commit()
+
+    assert vector_index.semantic_scores('annual plan refunds', [{'id': 'refunds'}]) is None
+    vector_index._rebuild_thread.join(10)
+
+    assert vector_index.get_vector_index().doc_ids() == {'refunds'}
+    assert set(vector_index.semantic_scores('annual plan refunds', [{'id': 'refunds'}])) == {'refunds'}
+
+def test_load_waits_for_writer_in_another_process(app, monkeypatch):
+    """Loading the index waits while another process holds the index file lock for a save"""
+    monkeypatch.setattr(vector_index, '_index', None)
+    monkeypatch.setattr(vector_index, '_index_mtime', None)
+    db.session.add(Document(id='refunds', filename='refunds.pdf', category='Billing', text='Refund policy.'))
+    db.session.commit()
+    vector_index.rebuild_vector_index()
+
+    writer = subprocess.Popen([sys.executable, '-c', (
+        "import fcntl, sys, time\n"
+        "lock = open(sys.argv[1], 'a')\n"
+        "fcntl.flock(lock, fcntl.LOCK_EX)\n"
+        "print('locked', flush=True)\n"
+        "time.sleep(0.5)\n"
+    ), vector_index.LOCK_PATH], stdout=subprocess.PIPE, text=True)
+    try:
+        assert writer.stdout.readline().strip() == 'locked'
+        started = time.monotonic()
+        vector_index._load_index()
+        assert time.monotonic() - started >= 0.3
+    finally:
+        writer.wait(5)
@@ -2,15 +2,12 @@ import os
 import json
 import time
 import logging
-from openai import OpenAI
 from collections import defaultdict
+from utils.llm_gateway import complete, PROVIDER_OPENAI
+from utils.model_routing import TASK_SEARCH_SCREENING, TASK_SEARCH_ANSWER, TASK_CATEGORIZATION
 
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-openai = OpenAI(api_key=OPENAI_API_KEY)
-
 # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
 # do not change this unless explicitly requested by the user
 MODEL = "gpt-4o"
@@ -87,16 +84,12 @@ def search_documents(query, document_repository, category_filter="all"):
             """
             
             # Call OpenAI API
-            response = openai.chat.completions.create(
-                model=MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                response_format={"type": "json_object"},
-                temperature=0.2
-            )
+            response = complete(PROVIDER_OPENAI, prompt, MODEL, json_output=True, temperature=0.2,
+                                task=TASK_SEARCH_SCREENING)
             
             # Parse response
             try:
-                result_content = json.loads(response.choices[0].message.content)
+                result_content = json.loads(response.text)
                 
                 # Only include relevant documents
                 if result_content.get("is_relevant", False) and result_content.get("relevance_score", 0) > 3:
@@ -173,15 +166,11 @@ def categorize_content(text):
         """
         
         # Call OpenAI API
-        response = openai.chat.completions.create(
-            model=MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"},
-            temperature=0.2
-        )
+        response = complete(PROVIDER_OPENAI, prompt, MODEL, json_output=True, temperature=0.2,
+                            task=TASK_CATEGORIZATION)
         
         # Parse response
-        result = json.loads(response.choices[0].message.content)
+        result = json.loads(response.text)
         
         logger.debug(f"Categorized document as: {result.get('category')} with confidence {result.get('confidence')}")
         return result.get("category", "Uncategorized")
@@ -249,14 +238,10 @@ def generate_search_response(query, search_results):
         """
         
         # Call OpenAI API for answer generation
-        response = openai.chat.completions.create(
-            model=MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,
-            max_tokens=800
-        )
+        response = complete(PROVIDER_OPENAI, prompt, MODEL, temperature=0.3, max_tokens=800,
+                            task=TASK_SEARCH_ANSWER)
         
-        ai_response = response.choices[0].message.content.strip()
+        ai_response = response.text.strip()
         logger.debug(f"Generated AI response of {len(ai_response)} characters")
         
         return ai_response
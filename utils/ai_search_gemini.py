@@ -6,57 +6,318 @@ import json
 import time
 import logging
 import re
+import copy
+import threading
 import concurrent.futures
-from functools import partial
-import google.generativeai as genai
+from utils.search_index import lexical_scores
+from utils.fulltext_search import fulltext_candidates
+from utils.vector_index import semantic_scores
+from utils.rank_fusion import fuse_rankings, FUSION_DEPTH
+from utils.llm_gateway import complete, submit_completion, PROVIDER_GEMINI, LLMCancelledError
+from utils.model_routing import (get_model_for_task, TASK_SEARCH_SCREENING, TASK_PASSAGE_EXTRACTION,
+                                  TASK_SEARCH_ANSWER)
+from utils.chunk_store import get_document_chunks, build_excerpt, locate_passage
+from utils.context_builder import estimate_tokens, build_context
+from utils.snippet_extractor import term_weights, extract_snippets
+from utils.relevance_memo import content_hash, get_memoized_verdicts, save_verdicts
+from utils.answer_cache import get_cached_answer, store_answer
 
 logger = logging.getLogger(__name__)
 
-# Initialize Gemini client
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
+# Model configuration - a fast model screens every candidate, the pro model reads only the best ones
+SCREENING_MODEL = get_model_for_task(TASK_SEARCH_SCREENING)
+PASSAGE_MODEL = get_model_for_task(TASK_PASSAGE_EXTRACTION)
+ANSWER_MODEL = get_model_for_task(TASK_SEARCH_ANSWER)
+ENABLE_MODEL_CASCADE = os.environ.get("SEARCH_MODEL_CASCADE", "true").lower() == "true"
+PASSAGE_EXTRACTION_LIMIT = int(os.environ.get("SEARCH_PASSAGE_EXTRACTION_LIMIT", 3))                # Top results sent to the passage model
+PASSAGE_EXTRACTION_GRACE_SECONDS = float(os.environ.get("SEARCH_PASSAGE_EXTRACTION_GRACE", 4))    # Extra time allowed after the deadline
+PASSAGE_EXTRACTION_MAX_CALLS = 2 * PASSAGE_EXTRACTION_LIMIT                                          # Passage model calls per search
 
-# Model configuration
-GEMINI_MODEL = "gemini-1.5-pro"
+# Result passages are cut from the scored text locally, so Gemini only returns a score and a one-line summary
+ENABLE_LOCAL_SNIPPETS = os.environ.get("SEARCH_LOCAL_SNIPPETS", "true").lower() == "true"
+ENABLE_PASSAGE_MODEL = ENABLE_MODEL_CASCADE and not ENABLE_LOCAL_SNIPPETS      # Second cascade stage reads the top results; opt in with SEARCH_LOCAL_SNIPPETS=false
+SCREENING_EXTRACTS_PASSAGES = not (ENABLE_MODEL_CASCADE or ENABLE_LOCAL_SNIPPETS)
+
+# Model name stored with memoized verdicts, so changing the routing does not reuse old verdicts
+if ENABLE_PASSAGE_MODEL:
+    RELEVANCE_MEMO_MODEL = f"{SCREENING_MODEL}>{PASSAGE_MODEL}"
+else:
+    RELEVANCE_MEMO_MODEL = SCREENING_MODEL if ENABLE_MODEL_CASCADE else PASSAGE_MODEL
 
 # Maximum context size for the AI response generation
 MAX_CONTEXT_SIZE = 15000  # Characters
 
 # Performance optimization configuration
 ENABLE_PARALLEL_SEARCH = True  # Process documents in parallel for faster search
-DOCUMENT_TEXT_LIMIT = 6000     # Reduced from 9000 to make processing faster
+DOCUMENT_TOKEN_BUDGET = int(os.environ.get("SEARCH_DOCUMENT_TOKEN_BUDGET", 1500))  # Context per scored document
 RELEVANCE_THRESHOLD = 3        # Minimum relevance score to include in results
+RELEVANCE_GENERATION_CONFIG = {
+    "temperature": 0.1,  # Lower temperature for more deterministic results
+}
 
-def process_document(doc, query):
+# Batched scoring configuration - several documents are judged in one prompt
+ENABLE_BATCH_SCORING = os.environ.get("SEARCH_BATCH_SCORING", "true").lower() == "true"
+BATCH_TOKEN_BUDGET = int(os.environ.get("SEARCH_BATCH_TOKEN_BUDGET", 12000))  # Estimated input tokens per batch prompt
+BATCH_MAX_DOCUMENTS = int(os.environ.get("SEARCH_BATCH_MAX_DOCUMENTS", 8))
+
+# Latency budget - a search returns whatever has been scored once the deadline passes
+SEARCH_DEADLINE_SECONDS = float(os.environ.get("SEARCH_DEADLINE_SECONDS", 8))  # 0 disables the deadline
+EARLY_EXIT_RESULTS = int(os.environ.get("SEARCH_EARLY_EXIT_RESULTS", 3))      # Strong results needed to stop early
+EARLY_EXIT_SCORE = 7                                                           # Minimum score of a strong result
+
+# How a search finished, recorded in search_info and SearchLog
+TERMINATION_COMPLETE = 'complete'
+TERMINATION_DEADLINE = 'deadline'
+TERMINATION_EARLY_EXIT = 'early_exit'
+
+# Candidate retrieval configuration - only the best local matches are sent to Gemini
+ENABLE_CANDIDATE_RETRIEVAL = True
+ENABLE_SEMANTIC_RETRIEVAL = True  # Combine the dense vector index with BM25 when picking candidates
+CANDIDATE_LIMIT = int(os.environ.get("SEARCH_CANDIDATE_LIMIT", 20))  # Maximum documents scored by Gemini per search
+
+# Speculative answer generation - the answer starts as soon as the top results are strong enough
+ENABLE_SPECULATIVE_ANSWER = os.environ.get("SEARCH_SPECULATIVE_ANSWER", "true").lower() == "true"
+ANSWER_CONTEXT_RESULTS = 2                    # Top results the answer is written from
+SPECULATIVE_ANSWER_SCORE = EARLY_EXIT_SCORE   # Minimum score of each of those results
+SPECULATIVE_ANSWER_WAIT_SECONDS = float(os.environ.get("SPECULATIVE_ANSWER_WAIT_SECONDS", 45))  # Longest wait for it once results are final
+_answer_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.environ.get("SPECULATIVE_ANSWER_WORKERS", 4)), thread_name_prefix='answer')
+
+# Message shown when the AI answer could not be generated
+SEARCH_RESPONSE_FALLBACK = "I couldn't generate a complete response based on the search results. Please review the document excerpts below for relevant information."
+
+def build_relevance_prompt(doc, query, extract_passages=True):
     """
-    Process a single document for search relevance.
-    This function is designed to be run in parallel.
+    Build the prompt asking whether a single document is relevant to a query
     
     Args:
         doc: Document to process
         query: Search query
+        extract_passages: Also ask for key passages; screening prompts leave them out
         
     Returns:
-        Dictionary with search result or None if not relevant
+        str: Prompt text
+    """
+    # The query's best passages, for documents that were not prepared by prepare_chunk_excerpts
+    doc_text = build_context(doc['text'], query, DOCUMENT_TOKEN_BUDGET)
+    
+    if not extract_passages:
+        return f"""
+    You are a search assistant screening documents for relevance.
+    
+    SEARCH QUERY: "{query}"
+    
+    DOCUMENT TEXT:
+    {doc_text}
+    
+    Evaluate if this document contains information relevant to the search query.
+    
+    Be concise! Respond with JSON in this format:
+    {{
+        "is_relevant": true/false,
+        "relevance_score": 0-10,
+        "summary": "one sentence on how this document relates to the query"
+    }}
+    """
+    
+    # Create a prompt for evaluating document relevance - Optimized for speed
+    prompt = f"""
+    You are a search assistant helping find relevant information in documents.
+    
+    SEARCH QUERY: "{query}"
+    
+    DOCUMENT TEXT:
+    {doc_text}
+    
+    First, evaluate if this document contains information relevant to the search query.
+    Then, if relevant, extract up to 2 key passages that best answer the query.
+    
+    Be concise! Respond with JSON in this format:
+    {{
+        "is_relevant": true/false,
+        "relevance_score": 0-10,
+        "passages": [
+            {{
+                "text": "exact passage from document",
+                "location": "approximate page or section information"
+            }}
+        ],
+        "summary": "brief summary of how this document relates to the query"
+    }}
+    """
+    return prompt
+
+def parse_relevance_response(response_text):
+    """
+    Parse Gemini's relevance response into a verdict
+    
+    Args:
+        response_text: Raw response text
+        
+    Returns:
+        Verdict dictionary (is_relevant, relevance_score, passages, summary),
+        or None if the response could not be parsed
     """
+    # Parse response - Gemini might not return perfectly formatted JSON
     try:
-        # For very large documents, we might need to chunk them
-        doc_text = doc['text'][:DOCUMENT_TEXT_LIMIT]  # Limit text to avoid token limits
+        # Look for JSON object pattern
+        json_pattern = r'\{.*\}'
+        json_match = re.search(json_pattern, response_text, re.DOTALL)
         
-        # Create a prompt for evaluating document relevance - Optimized for speed
-        prompt = f"""
-        You are a search assistant helping find relevant information in documents.
+        if json_match:
+            json_str = json_match.group(0)
+            result_content = json.loads(json_str)
+        else:
+            # Attempt to parse the entire response as JSON
+            result_content = json.loads(response_text)
         
-        SEARCH QUERY: "{query}"
+        return {
+            "is_relevant": bool(result_content.get("is_relevant", False)),
+            "relevance_score": result_content.get("relevance_score", 0),
+            "passages": result_content.get("passages", []),
+            "summary": result_content.get("summary", "")
+        }
+    
+    except json.JSONDecodeError as e:
+        # If JSON parsing fails, try a more forgiving approach
+        try:
+            # Check if response has the necessary relevance information
+            if "is_relevant" not in response_text:
+                return None
+            
+            if "true" in response_text.lower():
+                # Extract relevance score if possible
+                score_match = re.search(r'relevance_score"?\s*:\s*(\d+)', response_text)
+                relevance_score = int(score_match.group(1)) if score_match else 5
+                
+                # Extract summary if possible
+                summary_match = re.search(r'summary"?\s*:\s*"([^"]+)"', response_text)
+                summary = summary_match.group(1) if summary_match else "Relevant document found"
+                
+                return {
+                    "is_relevant": True,
+                    "relevance_score": relevance_score,
+                    "passages": [],  # Unable to extract passages
+                    "summary": summary
+                }
+            
+            # Not relevant
+            return {"is_relevant": False, "relevance_score": 0, "passages": [], "summary": ""}
         
-        DOCUMENT TEXT:
-        {doc_text}
+        except Exception:
+            # Skip this document if we can't parse the response
+            return None
+
+def screening_model():
+    """Model that judges search candidates (the first stage of the cascade when it is enabled)"""
+    return SCREENING_MODEL if ENABLE_MODEL_CASCADE else PASSAGE_MODEL
+
+def judge_document(doc, query):
+    """
+    Ask Gemini whether a single document is relevant to a query.
+    The verdict carries no passages when they come from the passage model
+    or from local snippets.
+    
+    Args:
+        doc: Document to process
+        query: Search query
         
-        First, evaluate if this document contains information relevant to the search query.
-        Then, if relevant, extract up to 2 key passages that best answer the query.
+    Returns:
+        Verdict dictionary (is_relevant, relevance_score, passages, summary),
+        or None if the document could not be scored
+    """
+    try:
+        prompt = build_relevance_prompt(doc, query, extract_passages=SCREENING_EXTRACTS_PASSAGES)
+        response_text = complete(PROVIDER_GEMINI, prompt, screening_model(), task=TASK_SEARCH_SCREENING,
+                                 **RELEVANCE_GENERATION_CONFIG).text
+        return parse_relevance_response(response_text)
+    except Exception as e:
+        logger.error(f"Error processing document {doc.get('id', 'unknown')}: {str(e)}")
+        return None
+
+def build_scoring_batches(documents):
+    """
+    Pack documents into batches for batched relevance scoring
+    
+    Documents are added to a batch until the next one would push it over
+    BATCH_TOKEN_BUDGET or BATCH_MAX_DOCUMENTS.
+    
+    Args:
+        documents: List of document dictionaries
         
-        Be concise! Respond with JSON in this format:
+    Returns:
+        list: Lists of documents, one per prompt
+    """
+    if not ENABLE_BATCH_SCORING:
+        return [[doc] for doc in documents]
+    
+    batches = []
+    current = []
+    current_tokens = 0
+    for doc in documents:
+        doc_tokens = estimate_tokens(doc.get('text') or '')
+        if current and (current_tokens + doc_tokens > BATCH_TOKEN_BUDGET or len(current) >= BATCH_MAX_DOCUMENTS):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(doc)
+        current_tokens += doc_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def build_batch_relevance_prompt(docs, query, extract_passages=True):
+    """
+    Build one prompt asking for a relevance verdict on each of several documents
+    
+    Args:
+        docs: List of documents to judge
+        query: Search query
+        extract_passages: Also ask for key passages; screening prompts leave them out
+        
+    Returns:
+        str: Prompt text
+    """
+    document_sections = ""
+    for i, doc in enumerate(docs):
+        doc_text = build_context(doc.get('text') or '', query, DOCUMENT_TOKEN_BUDGET)
+        document_sections += f"\n=== DOCUMENT {i+1} ===\n{doc_text}\n"
+    
+    if not extract_passages:
+        return f"""
+    You are a search assistant screening documents for relevance.
+    
+    SEARCH QUERY: "{query}"
+    
+    Below are {len(docs)} documents. Judge each one independently.
+    {document_sections}
+    For each document, evaluate if it contains information relevant to the search query.
+    
+    Be concise! Respond with a JSON array containing one object per document, in this format:
+    [
+        {{
+            "document": 1,
+            "is_relevant": true/false,
+            "relevance_score": 0-10,
+            "summary": "one sentence on how this document relates to the query"
+        }}
+    ]
+    """
+    
+    prompt = f"""
+    You are a search assistant helping find relevant information in documents.
+    
+    SEARCH QUERY: "{query}"
+    
+    Below are {len(docs)} documents. Judge each one independently.
+    {document_sections}
+    For each document, evaluate if it contains information relevant to the search query.
+    Then, if relevant, extract up to 2 key passages that best answer the query.
+    
+    Be concise! Respond with a JSON array containing one object per document, in this format:
+    [
         {{
+            "document": 1,
             "is_relevant": true/false,
             "relevance_score": 0-10,
             "passages": [
@@ -67,90 +328,397 @@ def process_document(doc, query):
             ],
             "summary": "brief summary of how this document relates to the query"
         }}
-        """
+    ]
+    """
+    return prompt
+
+def parse_batch_relevance_response(response_text, doc_count):
+    """
+    Parse Gemini's batched relevance response
+    
+    Args:
+        response_text: Raw response text
+        doc_count: Number of documents in the batch
         
-        # Initialize Gemini model
-        model = genai.GenerativeModel(
-            GEMINI_MODEL,
-            generation_config={
-                "temperature": 0.1,  # Lower temperature for more deterministic results
-            }
-        )
+    Returns:
+        dict: Mapping of document position (0-based) to verdict; documents the
+        response did not cover are missing
+    """
+    try:
+        # Look for JSON array pattern
+        json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
+        items = json.loads(json_match.group(0) if json_match else response_text)
+        if not isinstance(items, list):
+            return {}
+        
+        verdicts = {}
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            try:
+                position = int(item.get("document")) - 1
+            except (TypeError, ValueError):
+                continue
+            if 0 <= position < doc_count and "is_relevant" in item:
+                verdicts[position] = {
+                    "is_relevant": bool(item.get("is_relevant", False)),
+                    "relevance_score": item.get("relevance_score", 0),
+                    "passages": item.get("passages", []),
+                    "summary": item.get("summary", "")
+                }
+        return verdicts
+    except Exception:
+        return {}
+
+def submit_relevance_batch(batch, query):
+    """
+    Submit a relevance call for a batch to the LLM engine
+    
+    Single-document batches use the per-document prompt. With the model
+    cascade enabled the batch goes to the screening model without passages.
+    
+    Args:
+        batch: List of documents
+        query: Search query
+        
+    Returns:
+        concurrent.futures.Future: Resolves to an LLMResponse
+    """
+    extract_passages = SCREENING_EXTRACTS_PASSAGES
+    if len(batch) == 1:
+        prompt = build_relevance_prompt(batch[0], query, extract_passages)
+    else:
+        prompt = build_batch_relevance_prompt(batch, query, extract_passages)
+    return submit_completion(PROVIDER_GEMINI, prompt, screening_model(), task=TASK_SEARCH_SCREENING,
+                             **RELEVANCE_GENERATION_CONFIG)
+
+SCORE_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+
+def coerce_score(value):
+    """
+    Read a model-supplied relevance score as a whole number from 0 to 10
+    
+    Models sometimes return scores as strings ("8", "8/10") or null.
+    
+    Args:
+        value: Score as returned by the model
         
-        # Call Gemini API
-        response = model.generate_content(prompt)
+    Returns:
+        int: The score, or 0 if it has no number
+    """
+    if isinstance(value, str):
+        match = SCORE_NUMBER.search(value)
+        value = match.group(0) if match else 0
+    try:
+        return min(10, max(0, int(round(float(value)))))
+    except (TypeError, ValueError):
+        return 0
+
+def build_search_result(doc, verdict, passages=None):
+    """
+    Turn a relevance verdict into a search result
+    
+    Args:
+        doc: Document that was scored
+        verdict: Verdict dictionary from judge_document or the relevance memo
+        passages: Optional locally extracted passages used instead of the verdict's
         
-        # Parse response - Gemini might not return perfectly formatted JSON
+    Returns:
+        Dictionary with search result or None if not relevant
+    """
+    if not verdict or not verdict.get("is_relevant") or _score_value(verdict) <= RELEVANCE_THRESHOLD:
+        return None
+    
+    return {
+        "document": {
+            "id": doc["id"],
+            "filename": doc["filename"],
+            "friendly_name": doc.get("friendly_name"),
+            "category": doc["category"]
+        },
+        "relevance_score": _score_value(verdict),
+        "passages": passages if passages is not None else verdict.get("passages", []),
+        "summary": verdict.get("summary", "")
+    }
+
+def process_document(doc, query):
+    """
+    Process a single document for search relevance.
+    
+    Args:
+        doc: Document to process
+        query: Search query
+        
+    Returns:
+        Dictionary with search result or None if not relevant
+    """
+    return build_search_result(doc, judge_document(doc, query))
+
+def prepare_chunk_excerpts(query, documents, load_texts=None):
+    """
+    Replace each document's text with the context sent to the model for the query
+    
+    The context is the best-matching stored chunks, or for documents without
+    stored chunks the best blocks of the full text, within DOCUMENT_TOKEN_BUDGET.
+    Lightweight documents that were loaded without text get it from load_texts.
+    
+    Args:
+        query: Search query
+        documents: List of document dictionaries
+        load_texts: Optional callable mapping a list of doc_ids to {doc_id: text}
+        
+    Returns:
+        tuple: (list of document dictionaries to score, dict mapping doc_id to the chunks used)
+    """
+    try:
+        stored_chunks = get_document_chunks(doc['id'] for doc in documents)
+    except Exception as e:
+        logger.error(f"Error loading document chunks: {str(e)}")
+        stored_chunks = {}
+    
+    # Only documents without chunks need their full text
+    texts = {}
+    missing_text = [doc['id'] for doc in documents if doc['id'] not in stored_chunks and 'text' not in doc]
+    if missing_text and load_texts is not None:
         try:
-            # Try to extract JSON object
-            response_text = response.text
+            texts = load_texts(missing_text)
+        except Exception as e:
+            logger.error(f"Error loading document text: {str(e)}")
+    
+    prepared = []
+    selected_chunks = {}
+    for doc in documents:
+        chunks = stored_chunks.get(doc['id'])
+        if chunks:
+            excerpt, selected_chunks[doc['id']] = build_excerpt(query, chunks, DOCUMENT_TOKEN_BUDGET)
+            doc = dict(doc, text=excerpt)
+        else:
+            text = doc['text'] if 'text' in doc else texts.get(doc['id'])
+            doc = dict(doc, text=build_context(text or '', query, DOCUMENT_TOKEN_BUDGET))
+        prepared.append(doc)
+    logger.info(f"Using stored chunks for {len(selected_chunks)} of {len(documents)} documents")
+    return prepared, selected_chunks
+
+def locate_passages(verdict, chunks):
+    """
+    Set each passage's location to the page of the chunk it was quoted from
+    
+    Args:
+        verdict: Verdict dictionary; passages are updated in place
+        chunks: Chunks that were sent for this document, or None
+    """
+    if not chunks:
+        return
+    for passage in verdict.get('passages') or []:
+        if isinstance(passage, dict):
+            label = locate_passage(passage.get('text'), chunks)
+            if label:
+                passage['location'] = label
+
+class PassageExtractor:
+    """
+    Second stage of the model cascade: the passage model reads the top screened results.
+    
+    Extraction for strong results starts while screening is still running, so
+    their passages are usually ready by the time the last batch is scored.
+    Results are updated in place with the passage model's passages, summary
+    and score; results it judges irrelevant are removed. Results that already
+    have passages (for example from the relevance memo) are left alone.
+    """
+    
+    def __init__(self, query, documents_by_id, selected_chunks, content_hashes):
+        self.query = query
+        self.documents_by_id = documents_by_id
+        self.selected_chunks = selected_chunks
+        self.content_hashes = content_hashes
+        self.verdicts = {}  # content hash -> verdict, for the relevance memo
+        self._pending = {}  # future -> result being read
+        self._requested = set()
+    
+    def request(self, results, min_score=None):
+        """
+        Submit extraction calls for top results that have no passages yet
+        
+        Args:
+            results: Current search results
+            min_score: Only request results scoring at least this much (used while screening is running)
+        """
+        for result in sorted(results, key=_score_value, reverse=True)[:PASSAGE_EXTRACTION_LIMIT]:
+            doc_id = result['document']['id']
+            if result.get('passages') or doc_id in self._requested or doc_id not in self.documents_by_id:
+                continue
+            if min_score is not None and _score_value(result) < min_score:
+                continue
+            if len(self._requested) >= PASSAGE_EXTRACTION_MAX_CALLS:
+                return
+            self._requested.add(doc_id)
+            prompt = build_relevance_prompt(self.documents_by_id[doc_id], self.query)
+            future = submit_completion(PROVIDER_GEMINI, prompt, PASSAGE_MODEL, task=TASK_PASSAGE_EXTRACTION,
+                                       **RELEVANCE_GENERATION_CONFIG)
+            self._pending[future] = result
+    
+    def collect(self, results, timeout=0):
+        """
+        Apply finished extraction calls to the results
+        
+        Args:
+            results: Current search results; updated in place
+            timeout: Seconds to wait for at least one call to finish
             
-            # Look for JSON object pattern
-            json_pattern = r'\{.*\}'
-            json_match = re.search(json_pattern, response_text, re.DOTALL)
+        Returns:
+            bool: True if any call finished
+        """
+        if not self._pending:
+            return False
+        done, _ = concurrent.futures.wait(self._pending, timeout=timeout,
+                                          return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            result = self._pending.pop(future)
+            doc = self.documents_by_id[result['document']['id']]
+            try:
+                verdict = parse_relevance_response(future.result().text)
+            except Exception as e:
+                logger.error(f"Error extracting passages from document {doc['id']}: {str(e)}")
+                continue
+            if verdict is None:
+                continue
             
-            if json_match:
-                json_str = json_match.group(0)
-                result_content = json.loads(json_str)
+            locate_passages(verdict, self.selected_chunks.get(doc['id']))
+            self.verdicts[self.content_hashes[doc['id']]] = verdict
+            confirmed = build_search_result(doc, verdict)
+            if confirmed is None:
+                results[:] = [item for item in results if item is not result]
             else:
-                # Attempt to parse the entire response as JSON
-                result_content = json.loads(response_text)
-            
-            # Only include relevant documents
-            if result_content.get("is_relevant", False) and result_content.get("relevance_score", 0) > RELEVANCE_THRESHOLD:
-                return {
-                    "document": {
-                        "id": doc["id"],
-                        "filename": doc["filename"],
-                        "friendly_name": doc.get("friendly_name"),
-                        "category": doc["category"]
-                    },
-                    "relevance_score": result_content.get("relevance_score", 0),
-                    "passages": result_content.get("passages", []),
-                    "summary": result_content.get("summary", "")
-                }
-            
-            # Not relevant, return None
-            return None
-            
-        except json.JSONDecodeError as e:
-            # If JSON parsing fails, try a more forgiving approach
-            try:
-                # Check if response has the necessary relevance information
-                if "is_relevant" in response_text and "true" in response_text.lower():
-                    # Extract relevance score if possible
-                    score_match = re.search(r'relevance_score"?\s*:\s*(\d+)', response_text)
-                    relevance_score = int(score_match.group(1)) if score_match else 5
-                    
-                    # Extract summary if possible
-                    summary_match = re.search(r'summary"?\s*:\s*"([^"]+)"', response_text)
-                    summary = summary_match.group(1) if summary_match else "Relevant document found"
-                    
-                    if relevance_score > RELEVANCE_THRESHOLD:
-                        return {
-                            "document": {
-                                "id": doc["id"],
-                                "filename": doc["filename"],
-                                "friendly_name": doc.get("friendly_name"),
-                                "category": doc["category"]
-                            },
-                            "relevance_score": relevance_score,
-                            "passages": [],  # Unable to extract passages
-                            "summary": summary
-                        }
-                
-                # Not relevant or couldn't extract information, return None
-                return None
-                
-            except Exception:
-                # Skip this document if we can't parse the response
-                return None
+                result.update(confirmed)
+        return bool(done)
+    
+    def finish(self, results, deadline=None):
+        """
+        Extract passages for the final top results
+        
+        Waits until PASSAGE_EXTRACTION_GRACE_SECONDS after the search deadline;
+        results still being read then keep their screening verdicts.
+        
+        Args:
+            results: Final search results; updated in place
+            deadline: Search deadline (epoch seconds), or None
+        """
+        stop = None if deadline is None else max(deadline, time.time()) + PASSAGE_EXTRACTION_GRACE_SECONDS
+        self.request(results)
+        while self._pending:
+            timeout = None if stop is None else max(0, stop - time.time())
+            if not self.collect(results, timeout):
+                break
+            # A rejected result lets the next one into the top
+            self.request(results)
+        
+        if self._pending:
+            logger.warning(f"Passage extraction timed out for {len(self._pending)} result(s), keeping their screening verdicts")
+            for future in self._pending:
+                future.cancel()
+            self._pending = {}
+        logger.info(f"Passage model read {len(self._requested)} of {len(results)} results")
+
+def retrieval_scores(query, documents, limit, category=None):
+    """
+    Score documents against a query with every available retrieval source
+    
+    Lexical scores come from PostgreSQL full-text search when available,
+    otherwise from the local BM25 index.
     
+    Args:
+        query: Search query
+        documents: List of document dictionaries
+        limit: Shortlist size the scores will be used for
+        category: Category the documents were filtered by, if any
+        
+    Returns:
+        dict: Mapping of source name ('lexical', 'semantic') to {doc_id: score}
+    """
+    score_sets = {}
+    
+    try:
+        ranked = fulltext_candidates(query, max(limit, FUSION_DEPTH), category)
+        score_sets['lexical'] = dict(ranked) if ranked is not None else lexical_scores(query, documents)
     except Exception as e:
-        logger.error(f"Error processing document {doc.get('id', 'unknown')}: {str(e)}")
-        return None
+        logger.error(f"Lexical retrieval failed: {str(e)}")
+    
+    if ENABLE_SEMANTIC_RETRIEVAL:
+        try:
+            scores = semantic_scores(query, documents)
+            # None until the vector index has been built; fusion then runs on lexical scores alone
+            if scores is not None:
+                score_sets['semantic'] = scores
+        except Exception as e:
+            logger.error(f"Semantic retrieval failed: {str(e)}")
+    
+    return score_sets
+
+def select_candidates(query, documents, limit, category=None):
+    """
+    Pick the documents worth sending to Gemini for a query.
+    Lexical and semantic (vector) scores are merged by rank fusion, and the
+    shortlist shrinks when one document clearly stands out.
+    
+    Args:
+        query: Search query
+        documents: List of document dictionaries
+        limit: Maximum number of documents to return
+        category: Category the documents were filtered by, if any
+        
+    Returns:
+        list: Up to `limit` document dictionaries, best candidates first
+    """
+    score_sets = retrieval_scores(query, documents, limit, category)
+    shortlist = fuse_rankings(score_sets, [doc['id'] for doc in documents], limit)
+    documents_by_id = {doc['id']: doc for doc in documents}
+    return [documents_by_id[doc_id] for doc_id in shortlist]
+
+def _score_value(result):
+    """Relevance score of a result or verdict as a number"""
+    return coerce_score(result.get("relevance_score", 0))
+
+def should_exit_early(results, remaining_docs, retrieval_rank):
+    """
+    Decide whether scoring can stop before every candidate has been judged
+    
+    Scoring stops once EARLY_EXIT_RESULTS results score at least
+    EARLY_EXIT_SCORE and every document still waiting ranked below all of
+    them in the retrieval stage.
+    
+    Args:
+        results: Search results found so far
+        remaining_docs: Documents that have not been scored yet
+        retrieval_rank: Mapping of doc_id to retrieval position (0 = best)
+        
+    Returns:
+        bool: True if the remaining documents can be skipped
+    """
+    strong = sorted((result for result in results if _score_value(result) >= EARLY_EXIT_SCORE),
+                    key=_score_value, reverse=True)[:EARLY_EXIT_RESULTS]
+    if len(strong) < EARLY_EXIT_RESULTS:
+        return False
+    
+    weakest_rank = max(retrieval_rank.get(result['document']['id'], len(retrieval_rank)) for result in strong)
+    return all(retrieval_rank.get(doc['id'], 0) > weakest_rank for doc in remaining_docs)
+
+def emit_progress(progress_callback, event, data):
+    """
+    Send a progress event to a search job, ignoring callback errors
+    
+    Args:
+        progress_callback: Callable taking (event, data), or None
+        event: Event name
+        data: JSON-serializable event payload
+    """
+    if progress_callback is None:
+        return
+    try:
+        progress_callback(event, data)
+    except Exception as e:
+        logger.error(f"Error reporting search progress: {str(e)}")
 
-def search_documents(query, document_repository, category_filter="all"):
+def search_documents(query, document_repository, category_filter="all", progress_callback=None, speculation=None):
     """
     Search through documents using Gemini to find relevant information.
     Optimized for faster performance using parallel processing.
@@ -159,6 +727,8 @@ def search_documents(query, document_repository, category_filter="all"):
         query: User search query
         document_repository: Document repository with methods to access documents
         category_filter: Category to filter documents by (or 'all')
+        progress_callback: Optional callable receiving (event, data) as documents are scheduled and scored
+        speculation: Optional SpeculativeAnswer that starts the answer while scoring is still running
         
     Returns:
         Dictionary with search results and metadata
@@ -189,45 +759,185 @@ def search_documents(query, document_repository, category_filter="all"):
         doc_count = len(documents)
         logger.info(f"Searching through {doc_count} documents with Gemini")
         
-        # Process documents - either in parallel or sequentially
+        # Narrow the corpus to a bounded shortlist using the local index
+        candidates = documents
+        if ENABLE_CANDIDATE_RETRIEVAL and doc_count > CANDIDATE_LIMIT:
+            candidates = select_candidates(query, documents, CANDIDATE_LIMIT,
+                                           category_filter if category_filter and category_filter.lower() != "all" else None)
+            logger.info(f"Candidate retrieval reduced {doc_count} documents to {len(candidates)} for Gemini scoring")
+        
+        # Score each candidate's best-matching chunks instead of its opening characters
+        candidates, selected_chunks = prepare_chunk_excerpts(
+            query, candidates, document_repository.get('get_document_texts'))
+        
+        # Reuse stored verdicts for documents whose scored text has not changed since they were judged
+        content_hashes = {doc['id']: content_hash(doc.get('text') or '') for doc in candidates}
+        memoized = get_memoized_verdicts(query, RELEVANCE_MEMO_MODEL, content_hashes.values())
+        
+        # Passages for result cards come from the same text, matched locally instead of quoted by Gemini
+        local_passages = {}
+        if ENABLE_LOCAL_SNIPPETS:
+            weights = term_weights(query, [doc.get('text') or '' for doc in candidates])
+            local_passages = {doc['id']: extract_snippets(weights, selected_chunks.get(doc['id']), doc.get('text'))
+                              for doc in candidates}
+        
         results = []
-        if ENABLE_PARALLEL_SEARCH and doc_count > 1:
+        for doc in candidates:
+            verdict = memoized.get(content_hashes[doc['id']])
+            if verdict is not None:
+                result = build_search_result(doc, verdict, local_passages.get(doc['id']))
+                if result:
+                    results.append(result)
+                    emit_progress(progress_callback, 'result', {'result': result})
+        memoized_count = sum(1 for doc in candidates if content_hashes[doc['id']] in memoized)
+        
+        # Only documents without a stored verdict need a Gemini call
+        to_score = [doc for doc in candidates if content_hashes[doc['id']] not in memoized]
+        scored_count = len(to_score)
+        logger.info(f"Relevance memo covered {memoized_count} documents, {scored_count} left to score")
+        emit_progress(progress_callback, 'scheduled', {
+            'documents_searched': doc_count,
+            'documents_memoized': memoized_count,
+            'documents_to_score': scored_count
+        })
+        
+        # Early exit relies on the retrieval ranking, so it only applies when candidates were ranked
+        retrieval_ranked = ENABLE_CANDIDATE_RETRIEVAL and doc_count > CANDIDATE_LIMIT
+        retrieval_rank = {doc['id']: rank for rank, doc in enumerate(candidates)}
+        deadline = start_time + SEARCH_DEADLINE_SECONDS if SEARCH_DEADLINE_SECONDS > 0 else None
+        termination = TERMINATION_COMPLETE
+        unscored_count = 0
+        
+        # The passage model and the answer start on strong results while the rest are screened
+        extractor = None
+        if ENABLE_PASSAGE_MODEL:
+            extractor = PassageExtractor(query, {doc['id']: doc for doc in candidates}, selected_chunks, content_hashes)
+        
+        def advance_pipeline():
+            if extractor is not None:
+                extractor.collect(results)
+                extractor.request(results, min_score=SPECULATIVE_ANSWER_SCORE)
+            if speculation is not None:
+                speculation.consider(results)
+        
+        advance_pipeline()
+        
+        # Process documents - either in parallel or sequentially
+        new_verdicts = {}
+        if ENABLE_PARALLEL_SEARCH and scored_count > 1:
             # Parallel processing of documents
-            logger.info(f"Using parallel processing for {doc_count} documents")
+            logger.info(f"Using parallel processing for {scored_count} documents")
             
-            # Create a partial function with the query parameter pre-filled
-            process_func = partial(process_document, query=query)
+            # Submit every batch to the shared LLM engine, which bounds concurrency across all requests
+            batches = build_scoring_batches(to_score)
+            pending = {submit_relevance_batch(batch, query): batch for batch in batches}
+            logger.info(f"Scoring {scored_count} documents in {len(batches)} Gemini request(s)")
             
-            # Use a thread pool to process documents in parallel
-            with concurrent.futures.ThreadPoolExecutor(max_workers=min(5, doc_count)) as executor:
-                # Start processing all documents
-                future_to_doc = {executor.submit(process_func, doc): doc for doc in documents}
+            # Collect results as they complete
+            completed = 0
+            while pending:
+                timeout = None if deadline is None else max(0, deadline - time.time())
+                done, _ = concurrent.futures.wait(pending, timeout=timeout,
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+                if not done:
+                    termination = TERMINATION_DEADLINE
+                    break
                 
-                # Collect results as they complete
-                for future in concurrent.futures.as_completed(future_to_doc):
-                    result = future.result()
-                    if result:  # Only include non-None results (i.e., relevant documents)
-                        results.append(result)
-                        
-                        # Log progress for long searches
-                        if doc_count > 10 and len(results) % 5 == 0:
-                            elapsed_so_far = time.time() - start_time
-                            logger.info(f"Search progress: Found {len(results)} relevant documents so far in {elapsed_so_far:.2f} seconds")
+                for future in done:
+                    batch = pending.pop(future)
+                    try:
+                        response_text = future.result().text
+                        if len(batch) == 1:
+                            verdicts = {0: parse_relevance_response(response_text)}
+                        else:
+                            verdicts = parse_batch_relevance_response(response_text, len(batch))
+                    except Exception as e:
+                        logger.error(f"Error scoring batch of {len(batch)} document(s): {str(e)}")
+                        verdicts = {0: None} if len(batch) == 1 else {}
+                    
+                    # Fall back to per-document calls for anything a batch failed to cover
+                    if len(batch) > 1:
+                        missing = [doc for i, doc in enumerate(batch) if verdicts.get(i) is None]
+                        if missing:
+                            logger.warning(f"Batch response covered {len(batch) - len(missing)} of {len(batch)} documents, retrying the rest individually")
+                        for doc in missing:
+                            pending[submit_relevance_batch([doc], query)] = [doc]
+                    
+                    for i, doc in enumerate(batch):
+                        verdict = verdicts.get(i)
+                        if verdict is None and len(batch) > 1:
+                            continue  # Being retried individually
+                        completed += 1
+                        result = build_search_result(doc, verdict, local_passages.get(doc['id']))
+                        emit_progress(progress_callback, 'scored', {'completed': completed, 'total': scored_count})
+                        if verdict is None:
+                            continue
+                        locate_passages(verdict, selected_chunks.get(doc['id']))
+                        new_verdicts[content_hashes[doc['id']]] = verdict
+                        if result:  # Only include relevant documents
+                            results.append(result)
+                            emit_progress(progress_callback, 'result', {'result': result})
+                            
+                            # Log progress for long searches
+                            if scored_count > 10 and len(results) % 5 == 0:
+                                elapsed_so_far = time.time() - start_time
+                                logger.info(f"Search progress: Found {len(results)} relevant documents so far in {elapsed_so_far:.2f} seconds")
+                
+                advance_pipeline()
+                remaining_docs = [doc for batch in pending.values() for doc in batch]
+                if pending and retrieval_ranked and should_exit_early(results, remaining_docs, retrieval_rank):
+                    termination = TERMINATION_EARLY_EXIT
+                    break
+            
+            # Abandon whatever is still queued or running
+            unscored_count = sum(len(batch) for batch in pending.values())
+            for future in pending:
+                future.cancel()
         else:
             # Sequential processing for small document sets or when parallel is disabled
             logger.info("Using sequential document processing")
-            for doc in documents:
-                result = process_document(doc, query)
-                if result:  # Only include non-None results
+            for completed, doc in enumerate(to_score, 1):
+                if deadline is not None and time.time() >= deadline:
+                    termination = TERMINATION_DEADLINE
+                elif retrieval_ranked and should_exit_early(results, to_score[completed - 1:], retrieval_rank):
+                    termination = TERMINATION_EARLY_EXIT
+                if termination != TERMINATION_COMPLETE:
+                    unscored_count = scored_count - completed + 1
+                    break
+                
+                verdict = judge_document(doc, query)
+                result = build_search_result(doc, verdict, local_passages.get(doc['id']))
+                emit_progress(progress_callback, 'scored', {'completed': completed, 'total': scored_count})
+                if verdict is None:
+                    continue
+                locate_passages(verdict, selected_chunks.get(doc['id']))
+                new_verdicts[content_hashes[doc['id']]] = verdict
+                if result:  # Only include relevant documents
                     results.append(result)
+                    emit_progress(progress_callback, 'result', {'result': result})
+                advance_pipeline()
+        
+        # Second stage of the cascade: only the top screened results go to the passage model
+        if extractor is not None:
+            extractor.finish(results, deadline)
+            new_verdicts.update(extractor.verdicts)
+        if speculation is not None:
+            speculation.consider(results)
+        
+        # Failed calls are not stored so they are retried on the next search
+        for verdict in new_verdicts.values():
+            verdict["relevance_score"] = _score_value(verdict)
+        save_verdicts(query, RELEVANCE_MEMO_MODEL, new_verdicts)
         
         # Sort results by relevance score (highest first)
-        results.sort(key=lambda x: x["relevance_score"], reverse=True)
+        results.sort(key=_score_value, reverse=True)
         
         # Calculate and log elapsed time
         end_time = time.time()
         elapsed_time = end_time - start_time
-        logger.info(f"Search completed in {elapsed_time:.2f} seconds. Found {len(results)} relevant documents.")
+        logger.info(f"Search completed in {elapsed_time:.2f} seconds ({termination}). Found {len(results)} relevant documents.")
+        if unscored_count:
+            logger.info(f"Search stopped with {unscored_count} candidate documents unscored")
         
         # Format the return value
         response = {
@@ -236,6 +946,10 @@ def search_documents(query, document_repository, category_filter="all"):
                 'elapsed_time': round(elapsed_time, 2),
                 'results_found': len(results),
                 'documents_searched': doc_count,
+                'documents_scored': scored_count,
+                'documents_memoized': memoized_count,
+                'documents_unscored': unscored_count,
+                'termination': termination,
                 'query': query
             }
         }
@@ -251,11 +965,128 @@ def search_documents(query, document_repository, category_filter="all"):
                 'elapsed_time': 0,
                 'results_found': 0,
                 'documents_searched': 0,
-                'query': query
+                'query': query,
+                'failed': True
             }
         }
 
-def generate_search_response(query, search_result):
+def answer_context_key(results):
+    """Identify the part of the results that the answer is written from"""
+    top = sorted(results, key=_score_value, reverse=True)[:ANSWER_CONTEXT_RESULTS]
+    return json.dumps([[result['document']['id'], result.get('relevance_score'), result.get('passages'),
+                        result.get('summary')] for result in top], sort_keys=True, default=str)
+
+
+class SpeculativeAnswer:
+    """
+    Answer generation that starts while documents are still being scored.
+    
+    Generation starts once the top ANSWER_CONTEXT_RESULTS results all score
+    at least SPECULATIVE_ANSWER_SCORE (and have passages when the model
+    cascade is on). If the top results change later, generation restarts
+    from the new ones and the earlier generation is stopped at its next
+    streamed chunk, so it frees its answer worker. Tokens are buffered
+    until the search is finished and resolve() confirms the answer matches
+    the final results.
+    """
+    
+    def __init__(self, query):
+        self.query = query
+        self.starts = 0
+        self._key = None
+        self._future = None
+        self._cancel = None
+        self._tokens = []
+        self._listener = None
+        self._lock = threading.Lock()
+    
+    def consider(self, results):
+        """
+        Start or restart generation if the top results are strong and have changed
+        
+        Args:
+            results: Search results found so far
+        """
+        top = sorted(results, key=_score_value, reverse=True)[:ANSWER_CONTEXT_RESULTS]
+        if len(top) < ANSWER_CONTEXT_RESULTS or any(_score_value(result) < SPECULATIVE_ANSWER_SCORE for result in top):
+            return
+        if ENABLE_PASSAGE_MODEL and any(not result.get('passages') for result in top):
+            return  # Wait for the passage model
+        
+        key = answer_context_key(results)
+        with self._lock:
+            if key == self._key:
+                return
+            if self._future is not None:
+                self._stop()
+                logger.info("Top results changed, restarting the speculative answer")
+            self._key = key
+            self._tokens = []
+            self._cancel = threading.Event()
+            self.starts += 1
+            self._future = _answer_executor.submit(self._generate, key, copy.deepcopy(top), self._cancel)
+    
+    def _stop(self):
+        """Stop the current generation, whether it is queued or already streaming (called under the lock)"""
+        self._future.cancel()
+        self._cancel.set()
+        self._listener = None
+    
+    def _generate(self, key, results, cancel_event):
+        def on_token(text):
+            with self._lock:
+                if key != self._key:
+                    return  # Superseded by a restart
+                self._tokens.append(text)
+                listener = self._listener
+            if listener is not None:
+                listener(text)
+        
+        return generate_search_response(self.query, {'results': results}, on_token=on_token,
+                                        cancel_event=cancel_event)
+    
+    def resolve(self, results, on_token=None):
+        """
+        Get the speculative answer if it was written from the final results
+        
+        Buffered text is replayed to on_token and the rest is streamed as it
+        arrives. A generation that does not finish within
+        SPECULATIVE_ANSWER_WAIT_SECONDS is stopped; text already passed to
+        on_token then has to be discarded by the caller.
+        
+        Args:
+            results: Final search results
+            on_token: Optional callable receiving each chunk of text
+            
+        Returns:
+            str: The answer, or None if it has to be generated from the final results
+        """
+        with self._lock:
+            if self._future is None or self._key != answer_context_key(results):
+                if self._future is not None:
+                    self._stop()
+                    self._key = None
+                return None
+            if on_token is not None:
+                for text in self._tokens:
+                    on_token(text)
+            self._listener = on_token
+            future = self._future
+        
+        try:
+            return future.result(timeout=SPECULATIVE_ANSWER_WAIT_SECONDS)
+        except concurrent.futures.TimeoutError:
+            logger.warning(f"Speculative answer not finished after {SPECULATIVE_ANSWER_WAIT_SECONDS}s, "
+                           f"generating it again")
+        except concurrent.futures.CancelledError:
+            pass
+        with self._lock:
+            if self._future is future:
+                self._stop()
+                self._key = None
+        return None
+
+def generate_search_response(query, search_result, on_token=None, cancel_event=None):
     """
     Generate an AI response based on search results using Gemini.
     Optimized for faster response generation.
@@ -263,9 +1094,11 @@ def generate_search_response(query, search_result):
     Args:
         query: Original search query
         search_result: Results from search_documents
+        on_token: Optional callable receiving each chunk of text as it is generated
+        cancel_event: Optional threading.Event that stops the generation once set
         
     Returns:
-        str: AI-generated response based on search results
+        str: AI-generated response based on search results, or None if it was cancelled
     """
     try:
         start_time = time.time()
@@ -276,7 +1109,7 @@ def generate_search_response(query, search_result):
         
         # Extract relevant information from search results - limit to top 2 for faster processing
         document_info = []
-        for i, result in enumerate(results[:2]):  # Consider up to 2 top results for faster processing
+        for i, result in enumerate(results[:ANSWER_CONTEXT_RESULTS]):  # Consider only the top results for faster processing
             doc = result.get('document', {})
             passages = result.get('passages', [])
             
@@ -291,12 +1124,21 @@ def generate_search_response(query, search_result):
                     passage_texts.append(passage_text)
             
             document_info.append({
+                "id": doc.get('id'),
                 "title": doc.get('friendly_name') or doc.get('filename', f"Document {i+1}"),
                 "category": doc.get('category', 'Unknown'),
                 "relevance": result.get('relevance_score', 0),
-                "passages": passage_texts
+                "passages": passage_texts,
+                "summary": '' if passage_texts else result.get('summary', '')
             })
         
+        # Reuse the answer written for this or a similar query from the same passages
+        cached_response = get_cached_answer(query, ANSWER_MODEL, document_info)
+        if cached_response is not None:
+            if on_token is not None:
+                on_token(cached_response)
+            return cached_response
+        
         # Build prompt for Gemini API - optimized for speed
         prompt = f"""
         You are a helpful document search assistant responding to: "{query}"
@@ -310,10 +1152,8 @@ def generate_search_response(query, search_result):
             if doc['passages']:
                 for j, passage in enumerate(doc['passages']):
                     prompt += f"- {passage}\n"
-            else:
-                summary = results[i].get('summary', '')
-                if summary:
-                    prompt += f"- {summary}\n"
+            elif doc['summary']:
+                prompt += f"- {doc['summary']}\n"
         
         prompt += """
         Guidelines:
@@ -323,28 +1163,30 @@ def generate_search_response(query, search_result):
         4. Don't waste words on unnecessary lead-ins
         """
         
-        # Initialize Gemini model - optimized settings for speed
-        model = genai.GenerativeModel(
-            GEMINI_MODEL,
-            generation_config={
-                "temperature": 0.1,  # Lower temperature for more deterministic and faster results
-                "max_output_tokens": 768,  # Shorter response limit for faster generation
-                "top_p": 0.95,  # Slightly more focused sampling for faster generation
-            }
-        )
-        
-        # Call Gemini API to generate the summary
-        response = model.generate_content(prompt)
-        
-        # Process and return response
-        ai_response = response.text.strip()
+        # Call Gemini through the gateway - optimized settings for speed; with on_token
+        # the completion is streamed so callers can forward text as it arrives
+        ai_response = complete(
+            PROVIDER_GEMINI,
+            prompt,
+            ANSWER_MODEL,
+            temperature=0.1,  # Lower temperature for more deterministic and faster results
+            max_tokens=768,  # Shorter response limit for faster generation
+            top_p=0.95,  # Slightly more focused sampling for faster generation
+            on_token=on_token,
+            task=TASK_SEARCH_ANSWER,
+            cancel_event=cancel_event
+        ).text.strip()
         
         # Calculate elapsed time
         elapsed_time = time.time() - start_time
         logger.info(f"Generated search response in {elapsed_time:.2f} seconds: {len(ai_response)} characters")
         
+        store_answer(query, ANSWER_MODEL, document_info, ai_response)
         return ai_response
         
+    except LLMCancelledError:
+        logger.info(f"Answer generation for '{query}' was cancelled")
+        return None
     except Exception as e:
         logger.error(f"Error generating search response with Gemini: {str(e)}")
-        return "I couldn't generate a complete response based on the search results. Please review the document excerpts below for relevant information."
\ No newline at end of file
+        return SEARCH_RESPONSE_FALLBACK
\ No newline at end of file
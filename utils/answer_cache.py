@@ -0,0 +1,211 @@
+"""
+Cache of generated search answers keyed by query intent and the evidence they were written from
+
+Different phrasings of a question often resolve to the same top documents and
+passages; the answer written for one is reused for the others instead of
+asking the model to synthesize a nearly identical one again.
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Optional, Tuple
+
+from utils.search_cache import LRUCache, normalize_query
+from utils.search_index import TOKEN_PATTERN, normalize_term
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_TTL_SECONDS = int(os.environ.get("ANSWER_CACHE_TTL_SECONDS", 6 * 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", 1000))          # In-memory answers per worker
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", 0.75))          # Minimum intent overlap to reuse an answer; 1 disables
+ANSWER_CACHE_QUERIES_PER_EVIDENCE = 8   # Distinct query intents remembered for one set of evidence
+
+# Bump when the answer prompt changes so old answers are not reused
+ANSWER_PROMPT_VERSION = 1
+
+# Words that change what is being asked, kept although search ignores them
+INTENT_WORDS = frozenset(['how', 'what', 'why', 'when', 'where', 'which', 'who', 'not', 'no', 'without'])
+
+def query_intent(query):
+    """
+    Reduce a query to the set of terms that determine what it asks
+
+    Search terms are normalized as the retrieval index does, so word order,
+    plurals, punctuation and filler words do not matter, but question words
+    and negations are kept: "why do agents quit" and "how do agents quit"
+    have different intents.
+
+    Args:
+        query: Search query
+
+    Returns:
+        tuple: Sorted distinct intent terms
+    """
+    terms = set()
+    for token in TOKEN_PATTERN.findall(normalize_query(query)):
+        term = token if token in INTENT_WORDS else normalize_term(token)
+        if term:
+            terms.add(term)
+    return tuple(sorted(terms))
+
+def intent_similarity(first, second):
+    """
+    Similarity of two query intents
+
+    Intents asking a different question or with a different negation never
+    match: the intent words must be identical, and the Jaccard similarity is
+    taken over the remaining content terms only.
+
+    Args:
+        first: Intent from query_intent
+        second: Intent from query_intent
+
+    Returns:
+        float: Similarity from 0 to 1
+    """
+    first, second = set(first), set(second)
+    if first & INTENT_WORDS != second & INTENT_WORDS:
+        return 0.0
+    first, second = first - INTENT_WORDS, second - INTENT_WORDS
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+def evidence_hash(model, documents):
+    """
+    Hash the exact inputs an answer is written from
+
+    Args:
+        model: Name of the answer model
+        documents: Document dictionaries as placed in the answer prompt
+            (id, title, passages and summary)
+
+    Returns:
+        str: Hex SHA-256 hash
+    """
+    evidence = [[document.get('id'), document.get('title'), document.get('passages'), document.get('summary')]
+                for document in documents]
+    raw = json.dumps([model, ANSWER_PROMPT_VERSION, evidence], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def answer_key(intent, evidence_key):
+    """Build the cache key of one answer from a query intent and an evidence hash"""
+    raw = f"{' '.join(intent)}\x1f{evidence_key}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class AnswerCache:
+    """
+    LRU cache of answers with a time-to-live, searchable by similar intent over the same evidence.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int, similarity: float):
+        self.similarity = similarity
+        self._answers = LRUCache(max_entries, ttl_seconds)     # answer key -> answer text
+        self._intents = LRUCache(max_entries, ttl_seconds)     # evidence hash -> [(intent, answer key), ...]
+        self._lock = threading.Lock()
+
+    def get(self, query: str, evidence_key: str) -> Optional[Tuple[str, float]]:
+        """
+        Find an answer for a query over the given evidence
+
+        Args:
+            query: Search query
+            evidence_key: Hash from evidence_hash
+
+        Returns:
+            tuple: (answer, intent similarity) or None on a miss
+        """
+        intent = query_intent(query)
+        answer = self._answers.get(answer_key(intent, evidence_key))
+        if answer is not None:
+            return answer, 1.0
+
+        if self.similarity >= 1:
+            return None
+        candidates = self._intents.get(evidence_key) or []
+        scored = sorted(((intent_similarity(intent, other), key) for other, key in candidates), reverse=True)
+        for similarity, key in scored:
+            if similarity < self.similarity:
+                break
+            answer = self._answers.get(key)
+            if answer is not None:
+                return answer, similarity
+        return None
+
+    def set(self, query: str, evidence_key: str, answer: str) -> None:
+        """
+        Store the answer written for a query over the given evidence
+
+        Args:
+            query: Search query
+            evidence_key: Hash from evidence_hash
+            answer: Generated answer text
+        """
+        intent = query_intent(query)
+        key = answer_key(intent, evidence_key)
+        self._answers.set(key, answer)
+
+        with self._lock:
+            candidates = [entry for entry in (self._intents.get(evidence_key) or []) if entry[0] != intent]
+            candidates.append((intent, key))
+            self._intents.set(evidence_key, candidates[-ANSWER_CACHE_QUERIES_PER_EVIDENCE:])
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        self._answers.clear()
+        self._intents.clear()
+
+    def __len__(self):
+        return len(self._answers)
+
+
+_answer_cache = AnswerCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_SIMILARITY)
+
+def get_cached_answer(query, model, documents):
+    """
+    Look up an answer written for this or a similar query from the same evidence
+
+    Args:
+        query: Search query
+        model: Name of the answer model
+        documents: Document dictionaries as placed in the answer prompt
+
+    Returns:
+        str: Cached answer or None on a miss
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return None
+
+    try:
+        found = _answer_cache.get(query, evidence_hash(model, documents))
+        if found is None:
+            return None
+        answer, similarity = found
+        logger.info(f"Answer cache hit for '{query}' (intent similarity {similarity:.2f})")
+        return answer
+    except Exception as e:
+        logger.error(f"Error reading answer cache: {str(e)}")
+        return None
+
+def store_answer(query, model, documents, answer):
+    """
+    Store a generated answer
+
+    Args:
+        query: Search query
+        model: Name of the answer model
+        documents: Document dictionaries as placed in the answer prompt
+        answer: Generated answer text
+    """
+    if not ANSWER_CACHE_ENABLED or not answer:
+        return
+
+    try:
+        _answer_cache.set(query, evidence_hash(model, documents), answer)
+    except Exception as e:
+        logger.error(f"Error writing answer cache: {str(e)}")
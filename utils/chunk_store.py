@@ -0,0 +1,219 @@
+"""
+Passage-level chunk store built at ingest time for search and answer generation
+"""
+import os
+import bisect
+import logging
+
+from models import db, Document, DocumentChunk
+from utils.pdf_processor import get_pdf_page_offsets
+from utils.context_builder import estimate_tokens, find_repeated_lines, strip_repeated_lines, rank_blocks, select_within_budget
+
+logger = logging.getLogger(__name__)
+
+# Chunking configuration
+SEARCH_CHUNK_SIZE = 2800     # Characters per stored chunk
+SEARCH_CHUNK_OVERLAP = 300   # Characters shared between neighbouring chunks
+EXCERPT_TOKEN_BUDGET = 1500  # Tokens of best-matching chunks sent to the model per document
+
+def chunk_text_with_offsets(text):
+    """
+    Split text into overlapping chunks and record where each one starts and ends
+
+    Args:
+        text: Full document text
+
+    Returns:
+        list: (chunk_text, start_offset, end_offset) tuples
+    """
+    # Import here to avoid circular imports
+    from utils.document_ai import split_document_into_chunks
+
+    spans = []
+    cursor = 0
+    for chunk in split_document_into_chunks(text, chunk_size=SEARCH_CHUNK_SIZE, overlap=SEARCH_CHUNK_OVERLAP):
+        # Chunks are exact slices with strictly increasing starts
+        start = text.find(chunk, cursor)
+        if start == -1:
+            start = cursor
+        spans.append((chunk, start, start + len(chunk)))
+        cursor = start + 1
+    return spans
+
+def _page_at(page_offsets, offset):
+    """Get the page containing a character offset"""
+    if not page_offsets:
+        return None
+    starts = [start for _, start in page_offsets]
+    index = bisect.bisect_right(starts, offset) - 1
+    return page_offsets[max(index, 0)][0]
+
+def build_document_chunks(document):
+    """
+    Rebuild the stored chunks for a document
+
+    Call this after a document is uploaded, edited or reuploaded. Must be
+    called inside an application context.
+
+    Args:
+        document: Document object
+
+    Returns:
+        int: Number of chunks stored
+    """
+    try:
+        DocumentChunk.query.filter_by(document_id=document.id).delete()
+
+        text = document.text or ''
+        if not text.strip():
+            db.session.commit()
+            return 0
+
+        page_offsets = []
+        if document.content_type == Document.TYPE_PDF and document.filepath and os.path.exists(document.filepath):
+            page_offsets = get_pdf_page_offsets(document.filepath, text)
+
+        spans = chunk_text_with_offsets(text)
+        for chunk_index, (chunk, start, end) in enumerate(spans):
+            db.session.add(DocumentChunk(
+                document_id=document.id,
+                chunk_index=chunk_index,
+                text=chunk,
+                start_offset=start,
+                end_offset=end,
+                page_start=_page_at(page_offsets, start),
+                page_end=_page_at(page_offsets, max(start, end - 1))
+            ))
+
+        db.session.commit()
+        logger.info(f"Stored {len(spans)} chunks for document {document.id} ({len(page_offsets)} pages located)")
+        return len(spans)
+
+    except Exception as e:
+        logger.error(f"Error building chunks for document {document.id}: {str(e)}")
+        db.session.rollback()
+        return 0
+
+def backfill_document_chunks():
+    """
+    Build chunks for every document that does not have any yet
+
+    Returns:
+        int: Number of documents chunked
+    """
+    chunked_ids = db.session.query(DocumentChunk.document_id).distinct()
+    missing_ids = [row.id for row in
+                   Document.query.with_entities(Document.id).filter(~Document.id.in_(chunked_ids))]
+
+    count = 0
+    for doc_id in missing_ids:
+        document = db.session.get(Document, doc_id)
+        if document and build_document_chunks(document):
+            count += 1
+    logger.info(f"Backfilled chunks for {count} of {len(missing_ids)} documents")
+    return count
+
+def get_document_chunks(doc_ids):
+    """
+    Load the stored chunks for a set of documents
+
+    Args:
+        doc_ids: Iterable of document IDs
+
+    Returns:
+        dict: Mapping of doc_id to a list of chunk dictionaries in document order
+    """
+    doc_ids = list(doc_ids)
+    if not doc_ids:
+        return {}
+
+    rows = db.session.query(
+        DocumentChunk.document_id, DocumentChunk.chunk_index, DocumentChunk.text,
+        DocumentChunk.page_start, DocumentChunk.page_end
+    ).filter(DocumentChunk.document_id.in_(doc_ids)).order_by(
+        DocumentChunk.document_id, DocumentChunk.chunk_index
+    )
+
+    chunks = {}
+    for row in rows:
+        chunks.setdefault(row.document_id, []).append({
+            'chunk_index': row.chunk_index,
+            'text': row.text,
+            'page_start': row.page_start,
+            'page_end': row.page_end
+        })
+    return chunks
+
+def page_label(chunk):
+    """Human-readable page range for a chunk dictionary, or None when pages are unknown"""
+    if not chunk.get('page_start'):
+        return None
+    if chunk.get('page_end') and chunk['page_end'] != chunk['page_start']:
+        return f"Pages {chunk['page_start']}-{chunk['page_end']}"
+    return f"Page {chunk['page_start']}"
+
+def select_best_chunks(query, chunks, token_budget=EXCERPT_TOKEN_BUDGET):
+    """
+    Pick the chunks of one document that best match a query within a token budget
+
+    Page headers and footers repeated across the document are removed from
+    the chunk text first. Chunks are ranked by the query terms they contain
+    and then by how much readable content they hold, so a table of contents
+    or cover page is not picked when nothing matches.
+
+    Args:
+        query: Search query
+        chunks: Chunk dictionaries for one document
+        token_budget: Maximum estimated tokens of chunk text
+
+    Returns:
+        list: Selected chunk dictionaries in document order, with cleaned text
+    """
+    repeated = find_repeated_lines('\n'.join(chunk['text'] for chunk in chunks))
+    cleaned = [dict(chunk, text=strip_repeated_lines(chunk['text'], repeated)) for chunk in chunks]
+    texts = [chunk['text'] for chunk in cleaned]
+    selected = select_within_budget(texts, rank_blocks(texts, query), token_budget)
+    if not selected and cleaned:
+        # A single chunk larger than the budget is still better than nothing
+        selected = rank_blocks(texts, query)[:1]
+    return [cleaned[index] for index in selected]
+
+def build_excerpt(query, chunks, token_budget=EXCERPT_TOKEN_BUDGET):
+    """
+    Build the text sent to the model for one document from its best chunks
+
+    Args:
+        query: Search query
+        chunks: Chunk dictionaries for one document
+        token_budget: Maximum estimated tokens of chunk text
+
+    Returns:
+        tuple: (excerpt text, list of selected chunks)
+    """
+    selected = select_best_chunks(query, chunks, token_budget)
+    sections = []
+    for chunk in selected:
+        label = page_label(chunk) or f"Section {chunk['chunk_index'] + 1}"
+        sections.append(f"[{label}]\n{chunk['text']}")
+    excerpt = "\n\n".join(sections)
+    logger.debug(f"Excerpt uses {len(selected)} of {len(chunks)} chunks ({estimate_tokens(excerpt)} tokens)")
+    return excerpt, selected
+
+def locate_passage(passage_text, chunks):
+    """
+    Find the page label for a passage quoted from a set of chunks
+
+    Args:
+        passage_text: Passage returned by the model
+        chunks: Chunk dictionaries the passage was drawn from
+
+    Returns:
+        str: Page label, or None if the passage or its page could not be found
+    """
+    needle = ' '.join((passage_text or '').split())[:80].lower()
+    if not needle:
+        return None
+    for chunk in chunks:
+        if needle in ' '.join(chunk['text'].split()).lower():
+            return page_label(chunk)
+    return None
@@ -6,19 +6,16 @@ import uuid
 import logging
 import json
 from datetime import datetime
-from openai import OpenAI
 
 from utils.pdf_processor import extract_text_from_pdf
 from utils.web_scraper import extract_text_from_url, is_valid_url
 from utils.youtube_processor import process_youtube_url, extract_video_id
 from utils.document_ai import generate_document_summary
+from utils.llm_gateway import complete, PROVIDER_OPENAI
+from utils.model_routing import TASK_CATEGORIZATION
 
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-openai = OpenAI(api_key=OPENAI_API_KEY)
-
 # Available document categories
 DOCUMENT_CATEGORIES = [
     "Industry Insights",
@@ -262,18 +259,16 @@ Respond with a single JSON object with a "category" field containing your classi
 """
 
         # Use OpenAI to classify the document
-        response = openai.chat.completions.create(
+        response = complete(PROVIDER_OPENAI, prompt,
             model="gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-            messages=[
-                {"role": "system", "content": "You are a document classification expert for a professional audience."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"},
-            max_tokens=100
+            system="You are a document classification expert for a professional audience.",
+            json_output=True,
+            max_tokens=100,
+            task=TASK_CATEGORIZATION
         )
         
         # Parse the response
-        result = json.loads(response.choices[0].message.content)
+        result = json.loads(response.text)
         category = result.get("category")
         
         # Validate the category against our list
@@ -0,0 +1,283 @@
+"""
+Query-aware selection of document text for LLM prompts under a token budget
+"""
+import re
+import math
+import logging
+from collections import Counter
+
+from utils.search_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Token estimation
+CHARS_PER_TOKEN = 4            # Average characters per token of English text
+LETTERS_PER_EXTRA_TOKEN = 12   # Longer words split into more tokens
+DIGITS_PER_TOKEN = 3           # Digits per token in numbers
+
+# Candidate blocks are built from paragraphs up to about this many tokens
+CONTEXT_BLOCK_TOKENS = 300
+
+# A short line repeated this often, far enough apart, is a page header or footer
+HEADER_MIN_REPEATS = 3
+HEADER_MAX_LENGTH = 120
+HEADER_MIN_GAP_LINES = 5
+
+# Marks text left out between selected blocks
+OMISSION_MARKER = "[...]"
+
+WORD_PATTERN = re.compile(r'[^\W\d_]+')
+NUMBER_PATTERN = re.compile(r'\d+')
+PUNCTUATION_PATTERN = re.compile(r'[^\w\s]|_')
+# Page number shapes after digits become '#': "page #", "page # of #", "# of #", "#/#" and "- # -".
+# Bare numbers are left to the repeated-line check so figures like "2023" or "85%" survive.
+PAGE_NUMBER_LINE = re.compile(r'^(?:(?:page|pg\.?|p\.)\s*#(?:\s*(?:of|/)\s*#)?|#\s*(?:of|/)\s*#|[-–—]\s*#\s*[-–—])$')
+TOC_LINE = re.compile(r'(\.{3,}|\s{2,}|\t)\s*\d+\s*$|^\s*(\d+(\.\d+)*\.?\s+)?[^.!?]{1,80}\s\d{1,4}\s*$')
+SENTENCE_END = re.compile(r'[a-z0-9)][.!?](\s|$)')
+
+def estimate_tokens(text):
+    """
+    Estimate the number of tokens in a piece of text without a tokenizer
+
+    Each word counts one token plus a share of its length, so long words cost
+    more; numbers cost one token per DIGITS_PER_TOKEN digits and each
+    punctuation mark one token. This tracks BPE tokenizers closely enough for
+    budgeting and is much cheaper than running one.
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        int: Estimated token count
+    """
+    if not text:
+        return 0
+
+    words = WORD_PATTERN.findall(text)
+    numbers = NUMBER_PATTERN.findall(text)
+    letters = sum(map(len, words))
+    digits = sum(map(len, numbers))
+    return (len(words) + letters // LETTERS_PER_EXTRA_TOKEN
+            + len(numbers) + (digits - len(numbers)) // DIGITS_PER_TOKEN
+            + len(PUNCTUATION_PATTERN.findall(text)))
+
+def _line_key(line):
+    """Normalize a line so that headers differing only in page numbers compare equal"""
+    return re.sub(r'\d+', '#', ' '.join(line.split()).lower())
+
+def find_repeated_lines(text):
+    """
+    Find the page headers and footers in a document
+
+    A header is a short line that recurs at least HEADER_MIN_REPEATS times with
+    HEADER_MIN_GAP_LINES or more lines between occurrences on average, so
+    repeated table cells and list bullets are not mistaken for one.
+
+    Args:
+        text: Full document text
+
+    Returns:
+        set: Normalized keys of repeated lines
+    """
+    positions = {}
+    for number, line in enumerate((text or '').splitlines()):
+        stripped = line.strip()
+        # Bare page numbers are shorter than any header but recur the same way
+        if 3 <= len(stripped) <= HEADER_MAX_LENGTH or stripped.isdigit():
+            positions.setdefault(_line_key(stripped), []).append(number)
+
+    repeated = set()
+    for key, found_at in positions.items():
+        if len(found_at) < HEADER_MIN_REPEATS:
+            continue
+        average_gap = (found_at[-1] - found_at[0]) / (len(found_at) - 1)
+        if average_gap >= HEADER_MIN_GAP_LINES:
+            repeated.add(key)
+    return repeated
+
+def strip_repeated_lines(text, repeated=None):
+    """
+    Remove page numbers and all but the first copy of each page header and footer
+
+    Args:
+        text: Text to clean
+        repeated: Header keys from find_repeated_lines; found in text itself when omitted
+
+    Returns:
+        str: Cleaned text
+    """
+    if not text:
+        return ''
+    repeated = find_repeated_lines(text) if repeated is None else repeated
+
+    kept = []
+    seen = set()
+    for line in text.splitlines():
+        key = _line_key(line.strip())
+        if key and PAGE_NUMBER_LINE.match(key):
+            continue
+        if key in repeated:
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(line)
+    return '\n'.join(kept)
+
+def split_into_blocks(text, block_tokens=CONTEXT_BLOCK_TOKENS):
+    """
+    Split text into blocks of whole paragraphs of roughly block_tokens tokens
+
+    Paragraphs longer than a block are cut at line or sentence breaks.
+
+    Args:
+        text: Text to split
+        block_tokens: Target block size in tokens
+
+    Returns:
+        list: Block texts in document order
+    """
+    max_chars = block_tokens * CHARS_PER_TOKEN
+    pieces = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = paragraph.strip()
+        while len(paragraph) > max_chars:
+            cut = max(paragraph.rfind('\n', 0, max_chars), paragraph.rfind('. ', 0, max_chars) + 1)
+            if cut <= max_chars // 2:
+                cut = max_chars
+            pieces.append(paragraph[:cut].strip())
+            paragraph = paragraph[cut:].strip()
+        if paragraph:
+            pieces.append(paragraph)
+
+    blocks = []
+    current = []
+    current_tokens = 0
+    for piece in pieces:
+        piece_tokens = estimate_tokens(piece)
+        if current and current_tokens + piece_tokens > block_tokens:
+            blocks.append('\n\n'.join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        blocks.append('\n\n'.join(current))
+    return blocks
+
+def content_score(block, terms):
+    """
+    Score how much readable content a block holds, regardless of any query
+
+    Running prose scores high; cover pages, tables of contents and lists of
+    figures, which are mostly short lines ending in page numbers, score low.
+
+    Args:
+        block: Block text
+        terms: The block's search terms from tokenize
+
+    Returns:
+        float: Non-negative score
+    """
+    lines = [line for line in block.splitlines() if line.strip()]
+    if not lines:
+        return 0.0
+    toc_share = sum(1 for line in lines if TOC_LINE.search(line)) / len(lines)
+    sentences = len(SENTENCE_END.findall(block))
+    return (1.0 - toc_share) * min(sentences, 10) * math.log1p(len(set(terms)))
+
+def query_score(terms, query_terms):
+    """Score a block's terms by the query terms among them, with diminishing returns for repeats"""
+    if not query_terms:
+        return 0.0
+    counts = Counter(term for term in terms if term in query_terms)
+    return sum(1 + min(count, 5) * 0.1 for count in counts.values())
+
+def rank_blocks(blocks, query=None):
+    """
+    Order blocks by how useful they are for a query, or for the document as a whole
+
+    With a query, blocks are ranked by the query terms they contain and then
+    by content; without one, by content with a mild preference for earlier
+    blocks, where introductions and abstracts usually are.
+
+    Args:
+        blocks: Block texts in document order
+        query: Optional query or task description
+
+    Returns:
+        list: Block indexes, best first
+    """
+    query_terms = set(tokenize(query)) if query else set()
+    keys = []
+    for index, block in enumerate(blocks):
+        terms = tokenize(block)
+        content = content_score(block, terms) / (1 + 0.05 * index)
+        keys.append((-query_score(terms, query_terms), -content, index))
+    return [key[2] for key in sorted(keys)]
+
+def select_within_budget(blocks, ranking, token_budget):
+    """
+    Take blocks in ranked order until the token budget is spent
+
+    Args:
+        blocks: Block texts
+        ranking: Block indexes, best first
+        token_budget: Maximum tokens to select
+
+    Returns:
+        list: Selected block indexes in document order
+    """
+    selected = []
+    used = 0
+    for index in ranking:
+        if used >= token_budget:
+            break
+        block_tokens = estimate_tokens(blocks[index])
+        if used + block_tokens <= token_budget:
+            selected.append(index)
+            used += block_tokens
+    return sorted(selected)
+
+def join_blocks(blocks, selected):
+    """Join selected blocks in document order, marking the gaps between them"""
+    parts = []
+    previous = None
+    for index in selected:
+        if previous is not None and index != previous + 1:
+            parts.append(OMISSION_MARKER)
+        parts.append(blocks[index])
+        previous = index
+    if selected and selected[0] != 0:
+        parts.insert(0, OMISSION_MARKER)
+    return '\n\n'.join(parts)
+
+def build_context(text, query=None, token_budget=1500):
+    """
+    Select the parts of a document to send to a model
+
+    Page headers, footers and page numbers are removed first. Text that then
+    fits the budget is returned whole; otherwise the best blocks for the query
+    (or for the document as a whole when there is no query) are kept in
+    document order, with [...] where text was left out.
+
+    Args:
+        text: Full document text
+        query: Optional search query or task description the context is for
+        token_budget: Maximum estimated tokens of context
+
+    Returns:
+        str: Context text
+    """
+    text = strip_repeated_lines(text)
+    if estimate_tokens(text) <= token_budget:
+        return text
+
+    blocks = split_into_blocks(text, min(CONTEXT_BLOCK_TOKENS, token_budget))
+    selected = select_within_budget(blocks, rank_blocks(blocks, query), token_budget)
+    if not selected:
+        # Only possible with a budget smaller than one block
+        return blocks[rank_blocks(blocks, query)[0]][:token_budget * CHARS_PER_TOKEN]
+
+    context = join_blocks(blocks, selected)
+    logger.debug(f"Built context of {len(selected)} of {len(blocks)} blocks "
+                 f"({estimate_tokens(context)} of {token_budget} tokens)")
+    return context
@@ -5,16 +5,17 @@ import os
 import logging
 import re
 from datetime import datetime
-from openai import OpenAI
 from models import db, Document
 from utils.relevance_generator import generate_relevance_reasons
-
-# Initialize OpenAI client
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-openai = OpenAI(api_key=OPENAI_API_KEY)
+from utils.llm_gateway import complete, submit_completion, PROVIDER_OPENAI
+from utils.model_routing import TASK_SUMMARY, TASK_FRIENDLY_NAME
+from utils.context_builder import build_context
 
 logger = logging.getLogger(__name__)
 
+# Estimated tokens of document text sent for a single-pass summary
+SUMMARY_CONTEXT_TOKENS = int(os.environ.get("SUMMARY_CONTEXT_TOKENS", 3750))
+
 def generate_friendly_name(filename):
     """
     Generate a user-friendly name for a document based on its filename
@@ -41,27 +42,20 @@ def generate_friendly_name(filename):
         # If the name is still complex or unclear, use AI to generate a better title
         if len(name) > 30 or re.search(r'\d{6,}', name) or name.count(' ') < 1:
             # Get a better title using OpenAI
-            response = openai.chat.completions.create(
+            response = complete(PROVIDER_OPENAI,
+                f"Create a user-friendly title for this document filename: {filename}",
                 model="gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert at creating concise, descriptive document titles. "
-                                   "Given a filename, create a professional, clear title that would make sense in a "
-                                   "document library for product managers. Keep it under 6 words if possible. "
-                                   "Don't use phrases like 'Report on' or 'Analysis of' unless necessary. "
-                                   "Don't include dates unless they seem important to the content."
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Create a user-friendly title for this document filename: {filename}"
-                    }
-                ],
-                max_tokens=50
+                system="You are an expert at creating concise, descriptive document titles. "
+                       "Given a filename, create a professional, clear title that would make sense in a "
+                       "document library for product managers. Keep it under 6 words if possible. "
+                       "Don't use phrases like 'Report on' or 'Analysis of' unless necessary. "
+                       "Don't include dates unless they seem important to the content.",
+                max_tokens=50,
+                task=TASK_FRIENDLY_NAME
             )
             
             # Extract the generated title
-            friendly_name = response.choices[0].message.content.strip()
+            friendly_name = response.text.strip()
             
             # Remove any quotation marks that might have been added
             friendly_name = friendly_name.strip('"\'').strip()
@@ -104,8 +98,8 @@ def generate_document_summary(document_id):
             logger.info(f"Document {document_id} is large ({len(full_text)} chars). Processing with chunking approach.")
             return process_large_document(document)
         else:
-            # For smaller documents, limit to first 15000 characters to stay within OpenAI context limits
-            doc_text = full_text[:15000]
+            # For smaller documents, send the most informative parts that fit the context budget
+            doc_text = build_context(full_text, token_budget=SUMMARY_CONTEXT_TOKENS)
         
         # Prepare the prompt based on content type
         system_content = "You are an expert document summarizer for a professional audience of product managers. "
@@ -114,7 +108,7 @@ def generate_document_summary(document_id):
         # Adjust prompt based on content type
         if document.content_type == 'youtube':
             # Check if this is a YouTube video without a transcript
-            if "This video does not have an available transcript" in doc_text:
+            if "This video does not have an available transcript" in full_text:
                 # Special handling for YouTube videos without transcripts
                 video_id = document.youtube_video_id
                 video_url = document.source_url
@@ -155,23 +149,15 @@ def generate_document_summary(document_id):
         system_content += "The summary should be objective and concise, capturing the most important information."
         
         # Generate summary using OpenAI's API
-        response = openai.chat.completions.create(
+        response = complete(PROVIDER_OPENAI, user_content,
             model="gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_content
-                },
-                {
-                    "role": "user",
-                    "content": user_content
-                }
-            ],
-            max_tokens=700
+            system=system_content,
+            max_tokens=700,
+            task=TASK_SUMMARY
         )
         
         # Extract the generated summary
-        ai_response = response.choices[0].message.content
+        ai_response = response.text
         
         # Process response to separate key points and summary
         # Look for section markers in AI responses
@@ -358,67 +344,52 @@ def process_large_document(document):
         chunks = split_document_into_chunks(document.text)
         logger.info(f"Processing large document {document.id} in {len(chunks)} chunks")
         
-        # Process each chunk to extract key information
-        chunk_summaries = []
+        # Submit every chunk to the shared LLM engine so they are extracted concurrently
+        chunk_futures = []
         for i, chunk in enumerate(chunks):
             logger.info(f"Processing chunk {i+1}/{len(chunks)} for document {document.id}")
             
             # Process this chunk with OpenAI
-            response = openai.chat.completions.create(
+            chunk_futures.append(submit_completion(PROVIDER_OPENAI,
+                f"Extract the key information from this document chunk (chunk {i+1} of {len(chunks)}):\n\n{chunk}",
                 model="gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert document analyzer that extracts key information from document chunks. "
-                                   "Extract the most important information from this document chunk, focusing on facts, "
-                                   "statistics, and key points. Format your response as bullet points, starting each with "
-                                   "a dash (-). Focus on extracting information, not summarizing."
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Extract the key information from this document chunk (chunk {i+1} of {len(chunks)}):\n\n{chunk}"
-                    }
-                ],
-                max_tokens=500
-            )
-            
-            # Add this chunk's summary to our collection
-            chunk_summary = response.choices[0].message.content
-            chunk_summaries.append(chunk_summary)
+                system="You are an expert document analyzer that extracts key information from document chunks. "
+                       "Extract the most important information from this document chunk, focusing on facts, "
+                       "statistics, and key points. Format your response as bullet points, starting each with "
+                       "a dash (-). Focus on extracting information, not summarizing.",
+                max_tokens=500,
+                task=TASK_SUMMARY
+            ))
+        
+        # Collect the chunk summaries in document order
+        chunk_summaries = [future.result().text for future in chunk_futures]
         
         # Now synthesize all the chunk summaries into a final summary
         combined_chunk_info = "\n\n".join(chunk_summaries)
         
         # Generate a final summary and key points from the extracted information
-        final_response = openai.chat.completions.create(
+        final_response = complete(PROVIDER_OPENAI,
+            f"Here is the extracted information from a large document. "
+            f"Synthesize this information into key points and a summary:\n\n{combined_chunk_info}",
             model="gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert document summarizer for a professional audience of product managers. "
-                               "Format your response with two clearly separated sections in this exact order:\n\n"
-                               "1. Key Points: A bulleted list of exactly 4-5 key points from the document\n"
-                               "2. Summary: A concise summary of no more than 2 short paragraphs (100-150 words total)\n\n"
-                               "Use these exact section headers: 'Key Points:' and 'Summary:'\n\n"
-                               "For Key Points:\n"
-                               "- Start each point with a bullet point (- )\n"
-                               "- Put a clear title in **bold** at the beginning of each point\n"
-                               "- Keep each point focused on a key fact or insight from the document\n"
-                               "- Make points brief and direct - one sentence per point is ideal\n\n"
-                               "Example format for a key point:\n"
-                               "- **Market Growth:** Customer satisfaction increased 24% over the last quarter.\n\n"
-                },
-                {
-                    "role": "user",
-                    "content": f"Here is the extracted information from a large document. "
-                              f"Synthesize this information into key points and a summary:\n\n{combined_chunk_info}"
-                }
-            ],
-            max_tokens=800
+            system="You are an expert document summarizer for a professional audience of product managers. "
+                   "Format your response with two clearly separated sections in this exact order:\n\n"
+                   "1. Key Points: A bulleted list of exactly 4-5 key points from the document\n"
+                   "2. Summary: A concise summary of no more than 2 short paragraphs (100-150 words total)\n\n"
+                   "Use these exact section headers: 'Key Points:' and 'Summary:'\n\n"
+                   "For Key Points:\n"
+                   "- Start each point with a bullet point (- )\n"
+                   "- Put a clear title in **bold** at the beginning of each point\n"
+                   "- Keep each point focused on a key fact or insight from the document\n"
+                   "- Make points brief and direct - one sentence per point is ideal\n\n"
+                   "Example format for a key point:\n"
+                   "- **Market Growth:** Customer satisfaction increased 24% over the last quarter.\n\n",
+            max_tokens=800,
+            task=TASK_SUMMARY
         )
         
         # Extract the final AI response
-        ai_response = final_response.choices[0].message.content
+        ai_response = final_response.text
         
         # Now follow the same processing as the regular document processing
         # Process response to separate key points and summary
@@ -616,6 +587,10 @@ def split_document_into_chunks(text, chunk_size=10000, overlap=500):
         # Add this chunk
         chunks.append(text[start:end])
         
+        # Stop once the end of the text has been reached
+        if end >= len(text):
+            break
+        
         # Move start position for next chunk (with overlap)
         start = max(start, end - overlap)
         
@@ -0,0 +1,127 @@
+"""
+PostgreSQL full-text search over the document.search_vector column
+"""
+import re
+import logging
+
+from sqlalchemy import text
+
+from models import db, Document
+
+logger = logging.getLogger(__name__)
+
+# Text search configuration and the share of document text covered by search_vector
+SEARCH_VECTOR_CONFIG = 'english'
+SEARCH_VECTOR_TEXT_LIMIT = 200000  # Characters; keeps the vector well under the 1MB tsvector limit
+
+# ts_rank_cd normalization: 32 scales ranks into 0-1 so they are comparable across queries
+RANK_NORMALIZATION = 32
+
+# Cached result of the column check, per process
+_fulltext_available = None
+
+def is_fulltext_available():
+    """
+    Check whether the database supports full-text search on documents
+    
+    True on PostgreSQL once migrate_search_vector has added search_vector.
+    Must be called inside an application context.
+    
+    Returns:
+        bool: True if search_vector can be queried
+    """
+    global _fulltext_available
+    if _fulltext_available is None:
+        try:
+            engine = db.engine
+            _fulltext_available = (
+                engine.dialect.name == 'postgresql' and
+                'search_vector' in [col['name'] for col in db.inspect(engine).get_columns('document')]
+            )
+        except Exception as e:
+            logger.error(f"Error checking for full-text search support: {str(e)}")
+            return False
+    return _fulltext_available
+
+def build_any_terms_query(query):
+    """
+    Build a to_tsquery expression matching any word of a query
+    
+    Postgres applies stemming and drops stopwords, so only punctuation is
+    removed here. Matching any term keeps recall high for candidate
+    selection; ts_rank_cd still ranks documents that match more terms higher.
+    
+    Args:
+        query: Search query
+    
+    Returns:
+        str: tsquery text such as "ventilator | weaning", or '' if the query has no words
+    """
+    terms = re.findall(r'[a-z0-9]+', (query or '').lower())
+    return ' | '.join(dict.fromkeys(terms))
+
+def fulltext_candidates(query, limit, category=None):
+    """
+    Rank documents for a query with ts_rank_cd
+    
+    Args:
+        query: Search query
+        limit: Maximum number of documents to return
+        category: Optional category to filter by
+    
+    Returns:
+        list: (doc_id, rank) tuples, best first; None if full-text search is unavailable or failed
+    """
+    if not is_fulltext_available():
+        return None
+    
+    tsquery = build_any_terms_query(query)
+    if not tsquery:
+        return []
+    
+    category_clause = "AND category = :category" if category else ""
+    try:
+        rows = db.session.execute(text(f"""
+            SELECT id, ts_rank_cd(search_vector, terms, {RANK_NORMALIZATION}) AS rank
+            FROM document, to_tsquery('{SEARCH_VECTOR_CONFIG}', :tsquery) AS terms
+            WHERE search_vector @@ terms {category_clause}
+            ORDER BY rank DESC
+            LIMIT :limit
+        """), {'tsquery': tsquery, 'category': category, 'limit': limit})
+        return [(row.id, float(row.rank)) for row in rows]
+    except Exception as e:
+        # Leave the session usable so callers can fall back to the local index
+        logger.error(f"Full-text candidate query failed: {str(e)}")
+        db.session.rollback()
+        return None
+
+def filter_documents_by_text(document_query, search_text, order_by_rank=True):
+    """
+    Restrict a Document query to documents matching search text
+    
+    Uses web-search syntax on PostgreSQL ("quoted phrases", -excluded words,
+    all other words required). Other databases fall back to a substring match
+    on names and summaries.
+    
+    Args:
+        document_query: Document query to filter
+        search_text: Text typed by the user
+        order_by_rank: Order the best matches first (PostgreSQL only)
+    
+    Returns:
+        Query: The filtered query
+    """
+    if is_fulltext_available():
+        terms = f"websearch_to_tsquery('{SEARCH_VECTOR_CONFIG}', :search_text)"
+        document_query = document_query.filter(text(f"document.search_vector @@ {terms}"))
+        if order_by_rank:
+            document_query = document_query.order_by(
+                text(f"ts_rank_cd(document.search_vector, {terms}, {RANK_NORMALIZATION}) DESC"))
+        return document_query.params(search_text=search_text)
+    
+    pattern = f"%{search_text}%"
+    return document_query.filter(db.or_(
+        Document.friendly_name.ilike(pattern),
+        Document.filename.ilike(pattern),
+        Document.summary.ilike(pattern)
+    ))
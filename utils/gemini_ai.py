@@ -7,18 +7,20 @@ import logging
 import re
 import json
 from datetime import datetime
-import google.generativeai as genai
 from models import db, Document
 from utils.relevance_generator_gemini import generate_relevance_reasons
-
-# Initialize Gemini client
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
+from utils.llm_gateway import complete, PROVIDER_GEMINI
+from utils.context_builder import build_context
+from utils.model_routing import get_model_for_task, TASK_SUMMARY, TASK_FRIENDLY_NAME
 
 logger = logging.getLogger(__name__)
 
 # Model configuration
-GEMINI_MODEL = "gemini-1.5-pro"
+SUMMARY_MODEL = get_model_for_task(TASK_SUMMARY)
+FRIENDLY_NAME_MODEL = get_model_for_task(TASK_FRIENDLY_NAME)
+
+# Estimated tokens of document text sent for a summary
+SUMMARY_CONTEXT_TOKENS = int(os.environ.get("SUMMARY_CONTEXT_TOKENS", 3750))
 
 def generate_friendly_name(filename):
     """
@@ -46,8 +48,6 @@ def generate_friendly_name(filename):
         # If the name is still complex or unclear, use AI to generate a better title
         if len(name) > 30 or re.search(r'\d{6,}', name) or name.count(' ') < 1:
             # Get a better title using Gemini
-            model = genai.GenerativeModel(GEMINI_MODEL)
-            
             prompt = f"""
             You are an expert at creating concise, descriptive document titles.
             Given a filename, create a professional, clear title that would make sense in a 
@@ -58,7 +58,7 @@ def generate_friendly_name(filename):
             Create a user-friendly title for this document filename: {filename}
             """
             
-            response = model.generate_content(prompt)
+            response = complete(PROVIDER_GEMINI, prompt, FRIENDLY_NAME_MODEL, task=TASK_FRIENDLY_NAME)
             
             # Extract the generated title
             friendly_name = response.text.strip()
@@ -98,8 +98,8 @@ def generate_document_summary(document_id):
         if not document.text:
             raise ValueError(f"Document with ID {document_id} has no text content")
         
-        # Get document text - limit to first 15000 characters to stay within context limits
-        doc_text = document.text[:15000]
+        # Send the most informative parts of the text that fit the context budget, skipping cover pages and contents
+        doc_text = build_context(document.text, token_budget=SUMMARY_CONTEXT_TOKENS)
         
         # Prepare the prompt based on content type
         system_content = "You are an expert document summarizer for a professional audience of product managers. "
@@ -151,11 +151,8 @@ def generate_document_summary(document_id):
         # Create full prompt for Gemini (combining system and user content)
         full_prompt = f"{system_content}\n\n{user_content}"
         
-        # Initialize Gemini model
-        model = genai.GenerativeModel(GEMINI_MODEL)
-        
         # Generate summary using Gemini API
-        response = model.generate_content(full_prompt)
+        response = complete(PROVIDER_GEMINI, full_prompt, SUMMARY_MODEL, task=TASK_SUMMARY)
         
         # Extract the generated summary
         ai_response = response.text
@@ -0,0 +1,167 @@
+"""
+Persistent content-addressed cache of LLM responses shared by all AI features
+
+A response is stored under a hash of everything that determines it (provider,
+model, generation settings, system instruction and prompt), so re-running a
+maintenance job over unchanged documents sends no API calls.
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+from sqlalchemy import func, select, update, delete
+
+from models import db, LLMResponseCache
+
+logger = logging.getLogger(__name__)
+
+def _task_set(value):
+    return frozenset(task.strip() for task in (value or '').split(',') if task.strip())
+
+# Cache configuration
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "true").lower() == "true"
+# Tasks whose responses are cached; search tasks have their own caches and memo
+LLM_CACHE_TASKS = _task_set(os.environ.get("LLM_CACHE_TASKS", "summary,relevance_reasons,friendly_name,categorization"))
+# Tasks that skip cache reads but still store fresh responses ("all" for every task), to force regeneration
+LLM_CACHE_BYPASS_TASKS = _task_set(os.environ.get("LLM_CACHE_BYPASS_TASKS"))
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))   # Stored response text across all rows
+LLM_CACHE_PRUNE_EVERY = 200   # Writes per process between size checks
+
+_writes_since_prune = 0
+_prune_lock = threading.Lock()
+
+def cache_enabled_for(task):
+    """Check whether responses for a task are cached"""
+    return LLM_CACHE_ENABLED and task in LLM_CACHE_TASKS
+
+def cache_bypassed_for(task):
+    """Check whether cached responses for a task are ignored so they get regenerated"""
+    return 'all' in LLM_CACHE_BYPASS_TASKS or task in LLM_CACHE_BYPASS_TASKS
+
+def response_cache_key(request_params):
+    """
+    Hash the parameters that determine a response
+
+    Args:
+        request_params: Dictionary from LLMRequest.to_dict()
+
+    Returns:
+        str: Hex SHA-256 cache key
+    """
+    raw = json.dumps(request_params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def get_cached_response(cache_key):
+    """
+    Look up a stored response
+
+    Uses its own connection so the caller's session is never committed or
+    rolled back. Must be called inside an application context.
+
+    Args:
+        cache_key: Key from response_cache_key
+
+    Returns:
+        dict: text, input_tokens and output_tokens, or None on a miss
+    """
+    table = LLMResponseCache.__table__
+    try:
+        with db.engine.begin() as conn:
+            row = conn.execute(select(table.c.response_text, table.c.input_tokens, table.c.output_tokens)
+                               .where(table.c.cache_key == cache_key)).first()
+            if row is None:
+                return None
+            conn.execute(update(table).where(table.c.cache_key == cache_key)
+                         .values(hit_count=table.c.hit_count + 1, last_accessed_at=datetime.utcnow()))
+        return {'text': row.response_text, 'input_tokens': row.input_tokens, 'output_tokens': row.output_tokens}
+    except Exception as e:
+        logger.error(f"Error reading LLM response cache: {str(e)}")
+        return None
+
+def store_response(cache_key, request_params, task, text, input_tokens=None, output_tokens=None):
+    """
+    Store a response
+
+    Must be called inside an application context.
+
+    Args:
+        cache_key: Key from response_cache_key
+        request_params: Dictionary from LLMRequest.to_dict()
+        task: Task the response was generated for
+        text: Response text
+        input_tokens: Prompt tokens reported by the provider, if any
+        output_tokens: Generated tokens reported by the provider, if any
+    """
+    global _writes_since_prune
+
+    table = LLMResponseCache.__table__
+    now = datetime.utcnow()
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.cache_key == cache_key))
+            conn.execute(table.insert().values(
+                cache_key=cache_key,
+                task=task,
+                provider=request_params['provider'],
+                model=request_params['model'],
+                response_text=text,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                size_bytes=len(text.encode('utf-8')),
+                created_at=now,
+                last_accessed_at=now,
+                hit_count=0
+            ))
+    except Exception as e:
+        logger.error(f"Error writing LLM response cache: {str(e)}")
+        return
+
+    with _prune_lock:
+        _writes_since_prune += 1
+        due = _writes_since_prune >= LLM_CACHE_PRUNE_EVERY
+        if due:
+            _writes_since_prune = 0
+    if due:
+        prune_llm_cache()
+
+def prune_llm_cache(max_bytes=None):
+    """
+    Evict the least recently used responses until the cache fits its size limit
+
+    Must be called inside an application context.
+
+    Args:
+        max_bytes: Size limit (default LLM_CACHE_MAX_BYTES)
+
+    Returns:
+        int: Number of rows removed
+    """
+    max_bytes = LLM_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    table = LLMResponseCache.__table__
+    try:
+        with db.engine.begin() as conn:
+            total = conn.execute(select(func.coalesce(func.sum(table.c.size_bytes), 0))).scalar()
+            if total <= max_bytes:
+                return 0
+
+            # Walk from the least recently used end until enough bytes are freed
+            excess = total - max_bytes
+            stale_keys = []
+            rows = conn.execute(select(table.c.cache_key, table.c.size_bytes)
+                                .order_by(table.c.last_accessed_at.asc())).all()
+            for row in rows:
+                if excess <= 0:
+                    break
+                stale_keys.append(row.cache_key)
+                excess -= row.size_bytes
+            for start in range(0, len(stale_keys), 500):
+                conn.execute(delete(table).where(table.c.cache_key.in_(stale_keys[start:start + 500])))
+
+        logger.info(f"Pruned {len(stale_keys)} LLM response cache entries")
+        return len(stale_keys)
+    except Exception as e:
+        logger.error(f"Error pruning LLM response cache: {str(e)}")
+        return 0
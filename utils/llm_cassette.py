@@ -0,0 +1,121 @@
+"""
+Record and replay of LLM responses for repeatable offline benchmarks
+
+With LLM_MODE=record every response from the real providers is written to a
+cassette file under LLM_CASSETTE_DIR. With LLM_MODE=replay the same requests
+are answered from those files with the recorded latency, without network
+access.
+"""
+import os
+import json
+import time
+import logging
+import tempfile
+from datetime import datetime
+
+from utils.llm_gateway import ProviderAdapter, LLMResponse
+from utils.llm_cache import response_cache_key
+from utils.llm_stub import stream_text, LLM_STUB_FIRST_TOKEN_SHARE
+
+logger = logging.getLogger(__name__)
+
+# Cassette location (one JSON file per distinct request)
+LLM_CASSETTE_DIR = os.environ.get(
+    'LLM_CASSETTE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'llm_cassettes')
+)
+
+# Multiplier for recorded latencies on replay; 0 replays instantly
+LLM_REPLAY_LATENCY_SCALE = float(os.environ.get("LLM_REPLAY_LATENCY_SCALE", 1.0))
+
+# What a replay does for a request that was never recorded: 'error' or 'stub'
+LLM_REPLAY_MISSING = os.environ.get("LLM_REPLAY_MISSING", "error").lower()
+
+
+class CassetteMissError(Exception):
+    """A replayed request has no recording"""
+
+
+def cassette_path(provider, cache_key):
+    """Get the file holding the recording of one request"""
+    return os.path.join(LLM_CASSETTE_DIR, provider, f"{cache_key}.json")
+
+def write_cassette(path, entry):
+    """Write a recording atomically so concurrent recorders never leave partial files"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, path)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+
+
+class RecordingAdapter(ProviderAdapter):
+    """
+    Wraps a real provider adapter and saves each successful response.
+    """
+
+    def __init__(self, inner: ProviderAdapter):
+        self.inner = inner
+        self.name = inner.name
+
+    def generate(self, request, on_token=None):
+        start_time = time.time()
+        response = self.inner.generate(request, on_token)
+        params = request.to_dict()
+        try:
+            write_cassette(cassette_path(self.name, response_cache_key(params)), {
+                'request': params,
+                'task': request.task,
+                'text': response.text,
+                'input_tokens': response.input_tokens,
+                'output_tokens': response.output_tokens,
+                'latency': time.time() - start_time,
+                'recorded_at': datetime.utcnow().isoformat()
+            })
+        except Exception as e:
+            logger.error(f"Error recording LLM cassette: {str(e)}")
+        return response
+
+    def is_retryable(self, error):
+        return self.inner.is_retryable(error)
+
+    def is_overload(self, error):
+        return self.inner.is_overload(error)
+
+    def retry_after(self, error):
+        return self.inner.retry_after(error)
+
+
+class ReplayAdapter(ProviderAdapter):
+    """
+    Answers requests from recorded cassettes, taking the recorded time to do so.
+    """
+
+    def __init__(self, name, fallback: ProviderAdapter = None):
+        self.name = name
+        self.fallback = fallback
+
+    def generate(self, request, on_token=None):
+        path = cassette_path(self.name, response_cache_key(request.to_dict()))
+        try:
+            with open(path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            if self.fallback is not None:
+                return self.fallback.generate(request, on_token)
+            raise CassetteMissError(f"No recording for {request.task or 'untagged'} request to "
+                                    f"{self.name}/{request.model} in {LLM_CASSETTE_DIR}")
+
+        latency = entry.get('latency', 0) * LLM_REPLAY_LATENCY_SCALE
+        if on_token is None:
+            time.sleep(latency)
+        else:
+            time.sleep(latency * LLM_STUB_FIRST_TOKEN_SHARE)
+            stream_text(entry['text'], on_token, latency * (1 - LLM_STUB_FIRST_TOKEN_SHARE))
+        return LLMResponse(entry['text'], self.name, request.model,
+                           entry.get('input_tokens'), entry.get('output_tokens'))
@@ -0,0 +1,372 @@
+"""
+Shared asyncio engine that bounds outbound LLM concurrency across the whole process
+
+Each provider's in-flight limit adapts to how the provider responds (AIMD):
+it grows by one slot per window of fast, successful calls made while the
+limit was in use, and is cut multiplicatively when the provider throttles
+or times out.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+import collections
+import concurrent.futures
+from datetime import datetime
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Maximum LLM calls in flight at once for this process, across all providers (also the thread pool size)
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 32))
+
+# Starting in-flight limit per provider; adjusted at runtime while adaptive concurrency is on
+PROVIDER_CONCURRENCY = {
+    'gemini': int(os.environ.get("GEMINI_MAX_CONCURRENCY", 6)),
+    'openai': int(os.environ.get("OPENAI_MAX_CONCURRENCY", 4))
+}
+DEFAULT_PROVIDER_CONCURRENCY = 2
+
+# Highest in-flight limit adaptive concurrency may reach per provider
+PROVIDER_CONCURRENCY_CEILING = {
+    'gemini': int(os.environ.get("GEMINI_CONCURRENCY_CEILING", 24)),
+    'openai': int(os.environ.get("OPENAI_CONCURRENCY_CEILING", 16))
+}
+DEFAULT_PROVIDER_CONCURRENCY_CEILING = 8
+
+# Adaptive (AIMD) concurrency configuration
+LLM_ADAPTIVE_CONCURRENCY = os.environ.get("LLM_ADAPTIVE_CONCURRENCY", "true").lower() == "true"
+LLM_MIN_CONCURRENCY = 1
+LLM_AIMD_DECREASE_FACTOR = float(os.environ.get("LLM_AIMD_DECREASE_FACTOR", 0.5))   # Limit multiplier on throttling
+LLM_AIMD_LATENCY_TOLERANCE = 2.0           # Calls slower than this multiple of the usual latency do not grow the limit
+LLM_AIMD_LATENCY_SMOOTHING = 0.1           # Weight of each new call in the usual latency
+LLM_AIMD_DECREASE_COOLDOWN_SECONDS = 2.0   # Throttles within this window of a cut count as one event
+
+
+class AdaptiveLimiter:
+    """
+    Per-provider concurrency limit adjusted by additive increase, multiplicative decrease.
+
+    Used only on the engine loop, so its state needs no lock; stats() may be
+    read from other threads.
+    """
+
+    def __init__(self, provider: str, initial: int, minimum: int, maximum: int, adaptive: bool = True):
+        self.provider = provider
+        self.minimum = minimum
+        self.maximum = max(maximum, initial)
+        self.adaptive = adaptive
+        self.limit = float(initial)
+        self.in_flight = 0
+        self.latency_baseline = None
+        self.throttle_events = 0
+        self.last_throttle_at = None
+        self._waiters = collections.deque()
+        self._last_decrease = 0.0
+
+    @property
+    def slots(self) -> int:
+        return max(self.minimum, int(self.limit))
+
+    async def acquire(self) -> None:
+        """Wait for a slot, first come first served"""
+        if self.in_flight < self.slots and not self._waiters:
+            self.in_flight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted just before the cancellation; hand it on
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < self.slots:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def on_success(self, latency: float, running: int) -> None:
+        """
+        Grow the limit after a call that finished normally
+
+        The limit only grows while every slot has a call running and the call
+        was not much slower than usual, so idle periods, calls held back by
+        the rate limiter and a slowing provider do not inflate it.
+
+        Args:
+            latency: Seconds the call took
+            running: Calls to the provider running when it finished, including this one
+        """
+        baseline = self.latency_baseline
+        healthy = baseline is None or latency <= baseline * LLM_AIMD_LATENCY_TOLERANCE
+        self.latency_baseline = latency if baseline is None else (
+            baseline + LLM_AIMD_LATENCY_SMOOTHING * (latency - baseline))
+
+        if self.adaptive and healthy and running >= self.slots and self.limit < self.maximum:
+            # One extra slot per limit's worth of successful calls
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._wake()
+
+    def on_overload(self) -> None:
+        """Cut the limit after the provider throttled, timed out or reported overload"""
+        now = time.monotonic()
+        self.throttle_events += 1
+        self.last_throttle_at = datetime.utcnow()
+        if not self.adaptive or now - self._last_decrease < LLM_AIMD_DECREASE_COOLDOWN_SECONDS:
+            return
+
+        self._last_decrease = now
+        previous = self.slots
+        self.limit = max(float(self.minimum), self.limit * LLM_AIMD_DECREASE_FACTOR)
+        if self.slots < previous:
+            logger.warning(f"{self.provider} is throttling, concurrency limit cut from {previous} to {self.slots}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'limit': self.slots,
+            'ceiling': self.maximum,
+            'in_flight': self.in_flight,
+            'waiting': len(self._waiters),
+            'throttle_events': self.throttle_events,
+            'last_throttle_at': self.last_throttle_at,
+            'latency_baseline': self.latency_baseline
+        }
+
+
+class LLMEngine:
+    """
+    Event loop running in a daemon thread that executes LLM calls under a
+    global semaphore and an adaptive per-provider limit.
+
+    The provider SDKs are blocking, so calls run on one shared thread pool
+    sized to the global limit instead of a new pool per request. Coroutines
+    from async SDKs can be submitted directly.
+    """
+
+    def __init__(self, max_concurrency: int, provider_limits: Dict[str, int],
+                 provider_ceilings: Optional[Dict[str, int]] = None, adaptive: bool = LLM_ADAPTIVE_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.provider_limits = dict(provider_limits)
+        self.provider_ceilings = dict(provider_ceilings or {})
+        self.adaptive = adaptive
+        self._loop = None
+        self._thread = None
+        self._executor = None
+        self._global_semaphore = None
+        self._provider_limiters = {}
+        self._in_flight = {}
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        """Start the event loop thread on first use"""
+        if self._loop is not None:
+            return self._loop
+
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_concurrency, thread_name_prefix='llm')
+                loop.set_default_executor(self._executor)
+                self._global_semaphore = asyncio.Semaphore(self.max_concurrency)
+
+                self._thread = threading.Thread(target=loop.run_forever, name='llm-engine', daemon=True)
+                self._thread.start()
+                self._loop = loop
+                logger.info(f"Started LLM engine with {self.max_concurrency} concurrent calls")
+        return self._loop
+
+    def _provider_limiter(self, provider: str) -> AdaptiveLimiter:
+        """Get the concurrency limiter for a provider (called on the engine loop)"""
+        limiter = self._provider_limiters.get(provider)
+        if limiter is None:
+            limiter = AdaptiveLimiter(provider,
+                                      self.provider_limits.get(provider, DEFAULT_PROVIDER_CONCURRENCY),
+                                      LLM_MIN_CONCURRENCY,
+                                      self.provider_ceilings.get(provider, DEFAULT_PROVIDER_CONCURRENCY_CEILING),
+                                      self.adaptive)
+            self._provider_limiters[provider] = limiter
+        return limiter
+
+    async def _limited(self, provider: str, awaitable_factory: Callable[[], Any], rate_limiter: Any = None,
+                       is_overload: Optional[Callable[[Exception], bool]] = None) -> Any:
+        # Take the provider slot first so a throttled provider cannot hold global slots while it waits
+        limiter = self._provider_limiter(provider)
+        await limiter.acquire()
+        try:
+            if rate_limiter is not None:
+                delay = rate_limiter.reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await self._global_semaphore.acquire()
+        except BaseException:
+            limiter.release()
+            raise
+
+        self._in_flight[provider] = self._in_flight.get(provider, 0) + 1
+        call = asyncio.ensure_future(awaitable_factory())
+        call.add_done_callback(partial(self._finish_call, provider, limiter, is_overload, time.monotonic()))
+        # A cancelled caller stops waiting, but a blocking SDK call cannot be interrupted: the
+        # slots stay taken until the call really returns, so the limits hold after a deadline
+        return await asyncio.shield(call)
+
+    def _finish_call(self, provider: str, limiter: AdaptiveLimiter, is_overload: Optional[Callable[[Exception], bool]],
+                     start_time: float, call: asyncio.Future) -> None:
+        """Release a call's slots and report its outcome to the limiter once it has ended (on the engine loop)"""
+        running = self._in_flight[provider]
+        self._in_flight[provider] -= 1
+        self._global_semaphore.release()
+        try:
+            if call.cancelled():
+                return
+            error = call.exception()
+            if error is None:
+                limiter.on_success(time.monotonic() - start_time, running)
+            elif is_overload is not None and is_overload(error):
+                limiter.on_overload()
+        finally:
+            limiter.release()
+
+    def submit(self, provider: str, func: Callable, *args, **kwargs) -> concurrent.futures.Future:
+        """
+        Schedule a blocking LLM call
+
+        Args:
+            provider: Provider name used for the per-provider limit ('gemini', 'openai')
+            func: Blocking callable, typically an SDK method
+            *args: Positional arguments for func
+            **kwargs: Keyword arguments for func
+
+        Returns:
+            concurrent.futures.Future: Resolves to the return value of func
+        """
+        loop = self._ensure_started()
+        call = partial(func, *args, **kwargs)
+        coroutine = self._limited(provider, lambda: loop.run_in_executor(None, call))
+        return asyncio.run_coroutine_threadsafe(coroutine, loop)
+
+    def submit_coroutine(self, provider: str, coroutine_func: Callable, *args, **kwargs) -> concurrent.futures.Future:
+        """
+        Schedule a coroutine from an async SDK
+
+        Args:
+            provider: Provider name used for the per-provider limit
+            coroutine_func: Coroutine function to call on the engine loop
+            *args: Positional arguments for coroutine_func
+            **kwargs: Keyword arguments for coroutine_func
+
+        Returns:
+            concurrent.futures.Future: Resolves to the coroutine's result
+        """
+        loop = self._ensure_started()
+        coroutine = self._limited(provider, lambda: coroutine_func(*args, **kwargs))
+        return asyncio.run_coroutine_threadsafe(coroutine, loop)
+
+    async def run_limited(self, provider: str, func: Callable, rate_limiter: Any = None,
+                          is_overload: Optional[Callable[[Exception], bool]] = None) -> Any:
+        """
+        Run a blocking call on the pool under the concurrency limits (awaited on the engine loop)
+
+        Args:
+            provider: Provider name used for the per-provider limit
+            func: Blocking callable taking no arguments
+            rate_limiter: Optional object whose reserve() returns seconds to wait before the call starts
+            is_overload: Optional callable telling whether an error means the provider is
+                throttling or overloaded, which cuts the provider's concurrency limit
+
+        Returns:
+            The return value of func
+        """
+        loop = asyncio.get_running_loop()
+        return await self._limited(provider, lambda: loop.run_in_executor(None, func), rate_limiter, is_overload)
+
+    def schedule(self, coroutine) -> concurrent.futures.Future:
+        """
+        Run a coroutine on the engine loop without taking a concurrency slot
+
+        Used for work that spans several limited calls, such as retries with
+        backoff, so slots are only held while a call is actually in flight.
+
+        Args:
+            coroutine: Coroutine object
+
+        Returns:
+            concurrent.futures.Future: Resolves to the coroutine's result
+        """
+        loop = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(coroutine, loop)
+
+    def call(self, provider: str, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Run a blocking LLM call through the engine and wait for its result
+
+        Args:
+            provider: Provider name used for the per-provider limit
+            func: Blocking callable
+            *args: Positional arguments for func
+            timeout: Optional seconds to wait before raising concurrent.futures.TimeoutError
+            **kwargs: Keyword arguments for func
+
+        Returns:
+            The return value of func
+        """
+        return self.submit(provider, func, *args, **kwargs).result(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the current limits, in-flight calls and throttle events per provider"""
+        providers = {provider: limiter.stats() for provider, limiter in list(self._provider_limiters.items())}
+        return {
+            'max_concurrency': self.max_concurrency,
+            'adaptive': self.adaptive,
+            'provider_limits': {provider: item['limit'] for provider, item in providers.items()},
+            'in_flight': dict(self._in_flight),
+            'providers': providers
+        }
+
+
+# Process-wide engine shared by every request thread
+llm_engine = LLMEngine(LLM_MAX_CONCURRENCY, PROVIDER_CONCURRENCY, PROVIDER_CONCURRENCY_CEILING)
+
+def submit_llm_call(provider, func, *args, **kwargs):
+    """
+    Schedule a blocking LLM call on the shared engine
+
+    Args:
+        provider: Provider name ('gemini', 'openai')
+        func: Blocking callable
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+
+    Returns:
+        concurrent.futures.Future: Resolves to the return value of func
+    """
+    return llm_engine.submit(provider, func, *args, **kwargs)
+
+def run_llm_call(provider, func, *args, **kwargs):
+    """
+    Run a blocking LLM call on the shared engine and wait for its result
+
+    Args:
+        provider: Provider name ('gemini', 'openai')
+        func: Blocking callable
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+
+    Returns:
+        The return value of func
+    """
+    return llm_engine.call(provider, func, *args, **kwargs)
@@ -0,0 +1,611 @@
+"""
+Single entry point for LLM calls: provider adapters, rate limiting, retries and timeouts
+
+Every AI feature calls complete() or submit_completion() with the same
+arguments whichever provider serves it. The gateway keeps one pooled client
+per provider, waits on a token bucket per (provider, model), runs the call on
+the shared LLM engine, and retries throttled or failed calls with jittered
+exponential backoff. Responses for maintenance tasks are also kept in a
+persistent cache (utils.llm_cache), so identical requests are not repeated.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+import openai
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from flask import current_app, has_app_context
+
+from utils.llm_engine import llm_engine
+from utils.llm_metrics import (llm_metrics, current_document, OUTCOME_SUCCESS, OUTCOME_CACHED, OUTCOME_ERROR,
+                               OUTCOME_CANCELLED)
+
+logger = logging.getLogger(__name__)
+
+# Providers
+PROVIDER_OPENAI = 'openai'
+PROVIDER_GEMINI = 'gemini'
+
+# Timeouts and retries
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", 60))        # Per attempt
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 3))                   # Retries after the first attempt
+LLM_BACKOFF_BASE_SECONDS = float(os.environ.get("LLM_BACKOFF_BASE_SECONDS", 0.5))
+LLM_BACKOFF_MAX_SECONDS = float(os.environ.get("LLM_BACKOFF_MAX_SECONDS", 8))
+
+# Rate limits in requests per minute; 0 disables the limit
+PROVIDER_REQUESTS_PER_MINUTE = {
+    PROVIDER_GEMINI: float(os.environ.get("GEMINI_REQUESTS_PER_MINUTE", 600)),
+    PROVIDER_OPENAI: float(os.environ.get("OPENAI_REQUESTS_PER_MINUTE", 500))
+}
+RATE_LIMIT_BURST_SECONDS = 2  # A bucket holds this many seconds' worth of requests
+
+# Where responses come from: 'live' providers, the offline 'stub', or cassettes ('record' or 'replay')
+LLM_MODE_LIVE = 'live'
+LLM_MODE_STUB = 'stub'
+LLM_MODE_RECORD = 'record'
+LLM_MODE_REPLAY = 'replay'
+LLM_MODE = os.environ.get("LLM_MODE", LLM_MODE_LIVE).lower()
+
+# HTTP statuses worth retrying
+RETRYABLE_STATUS_CODES = frozenset([408, 429, 500, 502, 503, 504])
+
+# HTTP statuses meaning the provider is throttling or overloaded, which cut its concurrency limit
+OVERLOAD_STATUS_CODES = frozenset([429, 503])
+
+def parse_model_rate_limits(value):
+    """
+    Parse per-model request limits, e.g. "gemini-1.5-pro=150,gpt-4o=300"
+
+    Args:
+        value: Comma-separated model=requests_per_minute pairs
+
+    Returns:
+        dict: Mapping of model name to requests per minute
+    """
+    limits = {}
+    for pair in (value or '').split(','):
+        model, _, rate = pair.partition('=')
+        try:
+            limits[model.strip()] = float(rate)
+        except ValueError:
+            if pair.strip():
+                logger.warning(f"Ignoring invalid model rate limit: {pair}")
+    return limits
+
+# Models that need a different limit from their provider's
+MODEL_REQUESTS_PER_MINUTE = parse_model_rate_limits(os.environ.get("LLM_MODEL_REQUESTS_PER_MINUTE"))
+
+
+class LLMRequest:
+    """
+    Provider-independent description of one completion.
+    """
+
+    def __init__(self, provider: str, model: str, prompt: str, system: Optional[str] = None,
+                 temperature: Optional[float] = None, max_tokens: Optional[int] = None,
+                 top_p: Optional[float] = None, json_output: bool = False,
+                 timeout: Optional[float] = None, task: Optional[str] = None):
+        self.provider = provider
+        self.model = model
+        self.prompt = prompt
+        self.system = system
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.top_p = top_p
+        self.json_output = json_output
+        self.timeout = timeout or LLM_TIMEOUT_SECONDS
+        self.task = task
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the request parameters that determine the output"""
+        return {
+            'provider': self.provider,
+            'model': self.model,
+            'prompt': self.prompt,
+            'system': self.system,
+            'temperature': self.temperature,
+            'max_tokens': self.max_tokens,
+            'top_p': self.top_p,
+            'json_output': self.json_output
+        }
+
+
+class LLMResponse:
+    """
+    Text and usage returned by a completion.
+    """
+
+    def __init__(self, text: str, provider: str, model: str, input_tokens: Optional[int] = None,
+                 output_tokens: Optional[int] = None):
+        self.text = text
+        self.provider = provider
+        self.model = model
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.attempts = 1
+        self.latency = 0.0
+        self.cached = False
+
+    def __repr__(self):
+        return f"<LLMResponse {self.provider}/{self.model} {len(self.text)} chars>"
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that hands out reservations instead of blocking.
+
+    reserve() takes a token immediately, letting the balance go negative, and
+    returns how long the caller must wait for that token to exist. Waiting
+    happens on the engine loop, so no thread sleeps while throttled.
+    """
+
+    def __init__(self, requests_per_minute: float, burst_seconds: float = RATE_LIMIT_BURST_SECONDS):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take one token
+
+        Returns:
+            float: Seconds to wait before using it (0 when one was available)
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class LLMCancelledError(Exception):
+    """The caller cancelled a completion through its cancel event"""
+
+
+class ProviderAdapter:
+    """
+    Translates LLMRequests into calls on one provider's SDK.
+    """
+
+    name = None
+
+    def generate(self, request: LLMRequest, on_token: Optional[Callable[[str], None]] = None) -> LLMResponse:
+        """
+        Make one blocking attempt at a completion
+
+        Args:
+            request: The completion to make
+            on_token: Optional callable receiving each chunk of text as it is generated
+
+        Returns:
+            LLMResponse: The completion
+        """
+        raise NotImplementedError
+
+    def is_retryable(self, error: Exception) -> bool:
+        """Check whether a failed attempt is worth retrying"""
+        return isinstance(error, (TimeoutError, ConnectionError))
+
+    def is_overload(self, error: Exception) -> bool:
+        """Check whether a failed attempt means the provider is throttling, timing out or overloaded"""
+        return isinstance(error, TimeoutError)
+
+    def retry_after(self, error: Exception) -> Optional[float]:
+        """Get the delay the provider asked for before retrying, if any"""
+        return None
+
+
+class OpenAIAdapter(ProviderAdapter):
+    """
+    Chat completions through one shared OpenAI client.
+
+    The client keeps a pool of HTTP connections that every call reuses. Its
+    built-in retries are disabled because the gateway retries instead.
+    """
+
+    name = PROVIDER_OPENAI
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    def client(self) -> openai.OpenAI:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = openai.OpenAI(api_key=os.environ.get("OPENAI_API_KEY"),
+                                                 timeout=LLM_TIMEOUT_SECONDS, max_retries=0)
+        return self._client
+
+    def generate(self, request, on_token=None):
+        messages = []
+        if request.system:
+            messages.append({"role": "system", "content": request.system})
+        messages.append({"role": "user", "content": request.prompt})
+
+        kwargs = {'model': request.model, 'messages': messages, 'timeout': request.timeout}
+        if request.temperature is not None:
+            kwargs['temperature'] = request.temperature
+        if request.max_tokens is not None:
+            kwargs['max_tokens'] = request.max_tokens
+        if request.top_p is not None:
+            kwargs['top_p'] = request.top_p
+        if request.json_output:
+            kwargs['response_format'] = {"type": "json_object"}
+
+        completions = self.client().chat.completions
+        if on_token is None:
+            response = completions.create(**kwargs)
+            usage = response.usage
+            return LLMResponse(response.choices[0].message.content or '', self.name, request.model,
+                               usage.prompt_tokens if usage else None,
+                               usage.completion_tokens if usage else None)
+
+        chunks = []
+        usage = None
+        # Closing the stream drops the connection when on_token raises to stop generation
+        with completions.create(stream=True, stream_options={"include_usage": True}, **kwargs) as stream:
+            for chunk in stream:
+                usage = chunk.usage or usage
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    chunks.append(text)
+                    on_token(text)
+        return LLMResponse(''.join(chunks), self.name, request.model,
+                           usage.prompt_tokens if usage else None,
+                           usage.completion_tokens if usage else None)
+
+    def is_retryable(self, error):
+        if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code in RETRYABLE_STATUS_CODES
+        return super().is_retryable(error)
+
+    def is_overload(self, error):
+        if isinstance(error, openai.APITimeoutError):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code in OVERLOAD_STATUS_CODES
+        return super().is_overload(error)
+
+    def retry_after(self, error):
+        response = getattr(error, 'response', None)
+        try:
+            return float(response.headers.get('retry-after'))
+        except (AttributeError, TypeError, ValueError):
+            return None
+
+
+class GeminiAdapter(ProviderAdapter):
+    """
+    Content generation through cached Gemini model objects.
+
+    The SDK shares one connection channel per process; model objects are
+    built once per (model, system instruction) instead of on every call.
+    """
+
+    name = PROVIDER_GEMINI
+
+    def __init__(self):
+        self._models = {}
+        self._configured = False
+        self._lock = threading.Lock()
+
+    def model(self, model_name: str, system: Optional[str]) -> genai.GenerativeModel:
+        key = (model_name, system)
+        model = self._models.get(key)
+        if model is None:
+            with self._lock:
+                if not self._configured:
+                    genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
+                    self._configured = True
+                model = self._models.setdefault(key, genai.GenerativeModel(model_name, system_instruction=system))
+        return model
+
+    def generate(self, request, on_token=None):
+        generation_config = {}
+        if request.temperature is not None:
+            generation_config['temperature'] = request.temperature
+        if request.max_tokens is not None:
+            generation_config['max_output_tokens'] = request.max_tokens
+        if request.top_p is not None:
+            generation_config['top_p'] = request.top_p
+        if request.json_output:
+            generation_config['response_mime_type'] = 'application/json'
+
+        model = self.model(request.model, request.system)
+        request_options = {'timeout': request.timeout}
+        if on_token is None:
+            response = model.generate_content(request.prompt, generation_config=generation_config,
+                                              request_options=request_options)
+            text = response.text
+        else:
+            chunks = []
+            response = model.generate_content(request.prompt, generation_config=generation_config,
+                                              request_options=request_options, stream=True)
+            for chunk in response:
+                if chunk.text:
+                    chunks.append(chunk.text)
+                    on_token(chunk.text)
+            text = ''.join(chunks)
+
+        usage = getattr(response, 'usage_metadata', None)
+        return LLMResponse(text, self.name, request.model,
+                           getattr(usage, 'prompt_token_count', None),
+                           getattr(usage, 'candidates_token_count', None))
+
+    def is_retryable(self, error):
+        if isinstance(error, google_exceptions.GoogleAPICallError):
+            return error.code in RETRYABLE_STATUS_CODES or isinstance(error, google_exceptions.DeadlineExceeded)
+        return super().is_retryable(error)
+
+    def is_overload(self, error):
+        # ResourceExhausted is 429, ServiceUnavailable 503
+        if isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.ServiceUnavailable,
+                              google_exceptions.DeadlineExceeded)):
+            return True
+        return super().is_overload(error)
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Get the wait before a retry: full jitter over an exponentially growing window
+
+    Args:
+        attempt: Number of the attempt that just failed, starting at 1
+        retry_after: Delay requested by the provider, used as a floor
+
+    Returns:
+        float: Seconds to wait
+    """
+    window = min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** (attempt - 1)))
+    delay = random.uniform(0, window)
+    if retry_after:
+        delay = max(delay, min(retry_after, LLM_BACKOFF_MAX_SECONDS))
+    return delay
+
+
+class LLMGateway:
+    """
+    Routes completions to provider adapters through the shared LLM engine.
+    """
+
+    def __init__(self):
+        self._adapters = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def register_adapter(self, adapter: ProviderAdapter) -> None:
+        """Add or replace the adapter serving a provider"""
+        self._adapters[adapter.name] = adapter
+
+    def adapter(self, provider: str) -> ProviderAdapter:
+        adapter = self._adapters.get(provider)
+        if adapter is None:
+            raise ValueError(f"Unknown LLM provider: {provider}")
+        return adapter
+
+    def bucket(self, provider: str, model: str) -> TokenBucket:
+        """Get the rate limiter for a provider and model"""
+        key = (provider, model)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                rate = MODEL_REQUESTS_PER_MINUTE.get(model, PROVIDER_REQUESTS_PER_MINUTE.get(provider, 0))
+                bucket = self._buckets.setdefault(key, TokenBucket(rate))
+        return bucket
+
+    async def _complete(self, request: LLMRequest, on_token: Optional[Callable[[str], None]],
+                        store: Optional[Callable[[LLMResponse], None]] = None, document_id=None,
+                        cancel_event: Optional[threading.Event] = None) -> LLMResponse:
+        """Make attempts until one succeeds, the error is not retryable, retries run out or the call is cancelled"""
+        adapter = self.adapter(request.provider)
+        bucket = self.bucket(request.provider, request.model)
+        streamed = []
+
+        def forward(text):
+            # Raising inside the adapter's stream loop stops the generation
+            if cancel_event is not None and cancel_event.is_set():
+                raise LLMCancelledError("Completion cancelled while streaming")
+            streamed.append(text)
+            on_token(text)
+
+        start_time = time.time()
+        attempt = 1
+        while True:
+            try:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise LLMCancelledError("Completion cancelled before it started")
+                call = partial(adapter.generate, request, forward if on_token is not None else None)
+                response = await llm_engine.run_limited(request.provider, call, bucket, adapter.is_overload)
+                response.attempts = attempt
+                response.latency = time.time() - start_time
+                llm_metrics.record(request, OUTCOME_SUCCESS, response.latency, attempt, response, document_id)
+                if store is not None:
+                    await asyncio.get_running_loop().run_in_executor(None, store, response)
+                return response
+            except (asyncio.CancelledError, LLMCancelledError):
+                llm_metrics.record(request, OUTCOME_CANCELLED, time.time() - start_time, attempt,
+                                   document_id=document_id)
+                raise
+            except Exception as e:
+                # Text already streamed to the caller cannot be taken back
+                if attempt > LLM_MAX_RETRIES or streamed or not adapter.is_retryable(e):
+                    llm_metrics.record(request, OUTCOME_ERROR, time.time() - start_time, attempt,
+                                       document_id=document_id)
+                    raise
+                delay = backoff_delay(attempt, adapter.retry_after(e))
+                logger.warning(f"{request.provider}/{request.model} attempt {attempt} failed ({str(e)}), "
+                               f"retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def _cached(self, request: LLMRequest, on_token: Optional[Callable[[str], None]]):
+        """
+        Look a request up in the response cache when its task is cached
+
+        Returns:
+            tuple: (cached LLMResponse or None, callable storing a fresh response or None)
+        """
+        # Import here to avoid circular imports
+        from utils.llm_cache import (cache_enabled_for, cache_bypassed_for, response_cache_key,
+                                     get_cached_response, store_response)
+
+        # The cache lives in the application database
+        if not cache_enabled_for(request.task) or not has_app_context():
+            return None, None
+
+        params = request.to_dict()
+        cache_key = response_cache_key(params)
+        if not cache_bypassed_for(request.task):
+            hit = get_cached_response(cache_key)
+            if hit is not None:
+                logger.debug(f"LLM cache hit for {request.task} ({request.provider}/{request.model})")
+                response = LLMResponse(hit['text'], request.provider, request.model,
+                                       hit['input_tokens'], hit['output_tokens'])
+                response.cached = True
+                if on_token is not None and response.text:
+                    on_token(response.text)
+                return response, None
+
+        app = current_app._get_current_object()
+
+        def store(response):
+            with app.app_context():
+                store_response(cache_key, params, request.task, response.text,
+                               response.input_tokens, response.output_tokens)
+
+        return None, store
+
+    def submit(self, request: LLMRequest, on_token: Optional[Callable[[str], None]] = None,
+               cache: bool = True, cancel_event: Optional[threading.Event] = None) -> concurrent.futures.Future:
+        """
+        Schedule a completion
+
+        Requests for cached tasks are answered from the response cache when
+        an identical one was made before.
+
+        Args:
+            request: The completion to make
+            on_token: Optional callable receiving each chunk of text as it is generated
+            cache: Set to False to neither read nor write the response cache; it is
+                only used with live providers, so stubbed or recorded runs never touch it
+            cancel_event: Optional event that stops the completion once set: before the
+                next attempt, or at the next streamed chunk. Cancelling the future alone
+                cannot stop an attempt that is already running.
+
+        Returns:
+            concurrent.futures.Future: Resolves to an LLMResponse, or raises LLMCancelledError
+                when cancel_event stopped it; cancelling the future stops further retries
+        """
+        # Read here because the engine loop does not run in the caller's context
+        document_id = current_document()
+        store = None
+        if cache and LLM_MODE == LLM_MODE_LIVE:
+            response, store = self._cached(request, on_token)
+            if response is not None:
+                llm_metrics.record(request, OUTCOME_CACHED, document_id=document_id)
+                future = concurrent.futures.Future()
+                future.set_result(response)
+                return future
+        return llm_engine.schedule(self._complete(request, on_token, store, document_id, cancel_event))
+
+
+def configure_adapters(gateway, mode=LLM_MODE):
+    """
+    Register the adapters for an LLM mode
+
+    Args:
+        gateway: LLMGateway to configure
+        mode: 'live', 'stub', 'record' or 'replay'
+    """
+    live_adapters = [OpenAIAdapter(), GeminiAdapter()]
+    if mode == LLM_MODE_LIVE:
+        adapters = live_adapters
+    elif mode == LLM_MODE_STUB:
+        # Import here to avoid circular imports
+        from utils.llm_stub import StubAdapter
+        adapters = [StubAdapter(adapter.name) for adapter in live_adapters]
+    elif mode == LLM_MODE_RECORD:
+        # Import here to avoid circular imports
+        from utils.llm_cassette import RecordingAdapter
+        adapters = [RecordingAdapter(adapter) for adapter in live_adapters]
+    elif mode == LLM_MODE_REPLAY:
+        # Import here to avoid circular imports
+        from utils.llm_stub import StubAdapter
+        from utils.llm_cassette import ReplayAdapter, LLM_REPLAY_MISSING
+        adapters = [ReplayAdapter(adapter.name, StubAdapter(adapter.name) if LLM_REPLAY_MISSING == 'stub' else None)
+                    for adapter in live_adapters]
+    else:
+        raise ValueError(f"Unknown LLM_MODE: {mode}")
+
+    for adapter in adapters:
+        gateway.register_adapter(adapter)
+    if mode != LLM_MODE_LIVE:
+        logger.info(f"LLM gateway running in {mode} mode")
+
+def provider_available(provider):
+    """Check whether calls to a provider can be served: an API key is set, or no live calls are made"""
+    if LLM_MODE in (LLM_MODE_STUB, LLM_MODE_REPLAY):
+        return True
+    return bool(os.environ.get(f"{provider.upper()}_API_KEY"))
+
+
+# Process-wide gateway shared by every AI feature
+llm_gateway = LLMGateway()
+configure_adapters(llm_gateway)
+
+def submit_completion(provider, prompt, model, system=None, temperature=None, max_tokens=None, top_p=None,
+                      json_output=False, timeout=None, on_token=None, task=None, cache=True, cancel_event=None):
+    """
+    Schedule a completion through the gateway
+
+    Args:
+        provider: PROVIDER_OPENAI or PROVIDER_GEMINI
+        prompt: User prompt text
+        model: Model name
+        system: Optional system instruction
+        temperature: Optional sampling temperature
+        max_tokens: Optional limit on generated tokens
+        top_p: Optional nucleus sampling parameter
+        json_output: Ask the provider for a JSON response
+        timeout: Seconds allowed per attempt (default LLM_TIMEOUT_SECONDS)
+        on_token: Optional callable receiving each chunk of text as it is generated
+        task: One of the model_routing TASK_* constants; decides whether the response is cached
+        cache: Set to False to skip the response cache for this call
+        cancel_event: Optional threading.Event that stops the completion once set
+
+    Returns:
+        concurrent.futures.Future: Resolves to an LLMResponse
+    """
+    request = LLMRequest(provider, model, prompt, system=system, temperature=temperature, max_tokens=max_tokens,
+                         top_p=top_p, json_output=json_output, timeout=timeout, task=task)
+    return llm_gateway.submit(request, on_token, cache, cancel_event)
+
+def complete(provider, prompt, model, system=None, temperature=None, max_tokens=None, top_p=None,
+             json_output=False, timeout=None, on_token=None, task=None, cache=True, cancel_event=None):
+    """
+    Make a completion through the gateway and wait for it
+
+    Takes the same arguments as submit_completion.
+
+    Returns:
+        LLMResponse: The completion; provider errors are raised after retries run out
+    """
+    return submit_completion(provider, prompt, model, system=system, temperature=temperature,
+                             max_tokens=max_tokens, top_p=top_p, json_output=json_output,
+                             timeout=timeout, on_token=on_token, task=task, cache=cache,
+                             cancel_event=cancel_event).result()
@@ -0,0 +1,340 @@
+"""
+In-process instrumentation of LLM calls: latency histograms, token counts and cost per feature
+
+The gateway records one observation per completion, labelled with the feature
+(the model_routing task), provider, model and outcome. Calls made while a
+document is being processed are also attributed to that document, so the
+token spend of each upload can be inspected.
+"""
+import os
+import math
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from utils.context_builder import estimate_tokens
+from utils.llm_engine import llm_engine
+
+logger = logging.getLogger(__name__)
+
+# Latency histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+# Documents whose token spend is kept, most recently updated first
+LLM_METRICS_MAX_DOCUMENTS = int(os.environ.get("LLM_METRICS_MAX_DOCUMENTS", 500))
+
+# Call outcomes
+OUTCOME_SUCCESS = 'success'
+OUTCOME_CACHED = 'cached'          # Answered from the response cache; no tokens are spent
+OUTCOME_ERROR = 'error'            # Failed after retries, or with an error that is not retried
+OUTCOME_CANCELLED = 'cancelled'
+
+UNTAGGED_FEATURE = 'untagged'
+
+def parse_model_prices(value):
+    """
+    Parse model prices in the form "gpt-4o=2.5:10,gemini-1.5-flash=0.075:0.3"
+
+    Args:
+        value: Comma-separated model=input_price:output_price pairs, in USD per million tokens
+
+    Returns:
+        dict: Mapping of model name to (input price, output price)
+    """
+    prices = {}
+    for pair in (value or '').split(','):
+        model, _, rates = pair.partition('=')
+        input_price, _, output_price = rates.partition(':')
+        try:
+            prices[model.strip()] = (float(input_price), float(output_price))
+        except ValueError:
+            if pair.strip():
+                logger.warning(f"Ignoring invalid model price: {pair}")
+    return prices
+
+# List prices in USD per million (input, output) tokens; LLM_MODEL_PRICES adds or overrides models
+MODEL_PRICES_PER_MILLION = {
+    'gpt-4o': (2.50, 10.00),
+    'gemini-1.5-pro': (1.25, 5.00),
+    'gemini-1.5-flash': (0.075, 0.30)
+}
+MODEL_PRICES_PER_MILLION.update(parse_model_prices(os.environ.get("LLM_MODEL_PRICES")))
+
+def call_cost(model, input_tokens, output_tokens):
+    """Estimate the cost of a call in USD; unpriced models cost 0"""
+    input_price, output_price = MODEL_PRICES_PER_MILLION.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+_current_document = contextvars.ContextVar('llm_metrics_document', default=None)
+
+@contextmanager
+def track_document(document_id):
+    """
+    Attribute the LLM calls made inside the block to a document
+
+    Args:
+        document_id: ID of the document being processed
+    """
+    token = _current_document.set(document_id)
+    try:
+        yield
+    finally:
+        _current_document.reset(token)
+
+def current_document():
+    """Get the document the current calls are attributed to, if any"""
+    return _current_document.get()
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram in the Prometheus layout, with quantile estimates.
+    """
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)   # Last slot counts values above every bound
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(self.bounds):
+            if value <= bound:
+                break
+        else:
+            index = len(self.bounds)
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Get (upper bound, observations at or below it) pairs, ending with +Inf"""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.bounds + (math.inf,), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate a quantile by linear interpolation inside its bucket, as histogram_quantile does
+
+        Args:
+            q: Quantile between 0 and 1
+
+        Returns:
+            float: Estimated value, or None without observations
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        lower_bound, lower_count = 0.0, 0
+        for bound, cumulative in self.cumulative():
+            if cumulative >= rank:
+                if math.isinf(bound):
+                    # Values above the largest bound cannot be placed more precisely
+                    return self.bounds[-1]
+                in_bucket = cumulative - lower_count
+                return lower_bound + (bound - lower_bound) * ((rank - lower_count) / in_bucket if in_bucket else 0)
+            lower_bound, lower_count = bound, cumulative
+        return self.bounds[-1]
+
+
+class CallStats:
+    """
+    Aggregates for one feature, provider and model.
+    """
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.outcomes = {}
+        self.retries = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'calls': sum(self.outcomes.values()),
+            'outcomes': dict(self.outcomes),
+            'retries': self.retries,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'cost_usd': round(self.cost, 6),
+            'latency_p50': self.latency.quantile(0.5),
+            'latency_p95': self.latency.quantile(0.95),
+            'latency_p99': self.latency.quantile(0.99),
+            'latency_mean': self.latency.sum / self.latency.count if self.latency.count else None
+        }
+
+
+class LLMMetrics:
+    """
+    Thread-safe registry of LLM call statistics for this process.
+    """
+
+    def __init__(self, max_documents: int = LLM_METRICS_MAX_DOCUMENTS):
+        self.max_documents = max_documents
+        self.started_at = datetime.utcnow()
+        self._series = {}                     # (feature, provider, model) -> CallStats
+        self._documents = OrderedDict()       # document id -> token spend, least recently updated first
+        self._lock = threading.Lock()
+
+    def record(self, request, outcome: str, latency: float = 0.0, attempts: int = 1, response=None,
+               document_id=None) -> None:
+        """
+        Record one completion
+
+        Args:
+            request: The LLMRequest that was made
+            outcome: One of the OUTCOME_* constants
+            latency: Seconds from scheduling to the result, including queueing and retries
+            attempts: Provider calls made for this completion
+            response: The LLMResponse on success, for token counts
+            document_id: Document the call is attributed to, if any
+        """
+        feature = request.task or UNTAGGED_FEATURE
+        input_tokens = output_tokens = 0
+        if outcome == OUTCOME_SUCCESS and response is not None:
+            # Fall back to estimates when the provider reports no usage
+            input_tokens = response.input_tokens
+            if input_tokens is None:
+                input_tokens = estimate_tokens(request.prompt) + estimate_tokens(request.system or '')
+            output_tokens = response.output_tokens
+            if output_tokens is None:
+                output_tokens = estimate_tokens(response.text or '')
+        cost = call_cost(request.model, input_tokens, output_tokens)
+
+        with self._lock:
+            key = (feature, request.provider, request.model)
+            stats = self._series.get(key)
+            if stats is None:
+                stats = self._series[key] = CallStats()
+            stats.outcomes[outcome] = stats.outcomes.get(outcome, 0) + 1
+            stats.retries += max(attempts - 1, 0)
+            stats.input_tokens += input_tokens
+            stats.output_tokens += output_tokens
+            stats.cost += cost
+            if outcome != OUTCOME_CACHED:
+                stats.latency.observe(latency)
+
+            if document_id is not None:
+                spend = self._documents.pop(document_id, None) or {
+                    'calls': 0, 'input_tokens': 0, 'output_tokens': 0, 'cost_usd': 0.0, 'features': {}
+                }
+                spend['calls'] += 1
+                spend['input_tokens'] += input_tokens
+                spend['output_tokens'] += output_tokens
+                spend['cost_usd'] += cost
+                spend['features'][feature] = spend['features'].get(feature, 0) + input_tokens + output_tokens
+                spend['updated_at'] = datetime.utcnow()
+                self._documents[document_id] = spend
+                while len(self._documents) > self.max_documents:
+                    self._documents.popitem(last=False)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Get the current statistics
+
+        Returns:
+            dict: 'series' (one entry per feature, provider and model), 'features'
+                (totals per feature), 'documents' (most recently processed first) and
+                'providers' (current concurrency limits and throttle events)
+        """
+        with self._lock:
+            series = [dict(feature=feature, provider=provider, model=model, **stats.to_dict())
+                      for (feature, provider, model), stats in sorted(self._series.items())]
+
+            features = {}
+            for (feature, _, _), stats in self._series.items():
+                merged = features.setdefault(feature, CallStats())
+                for outcome, count in stats.outcomes.items():
+                    merged.outcomes[outcome] = merged.outcomes.get(outcome, 0) + count
+                merged.retries += stats.retries
+                merged.input_tokens += stats.input_tokens
+                merged.output_tokens += stats.output_tokens
+                merged.cost += stats.cost
+                merged.latency.counts = [a + b for a, b in zip(merged.latency.counts, stats.latency.counts)]
+                merged.latency.sum += stats.latency.sum
+                merged.latency.count += stats.latency.count
+
+            documents = [dict(spend, document_id=document_id, cost_usd=round(spend['cost_usd'], 6),
+                              features=dict(spend['features']))
+                         for document_id, spend in reversed(self._documents.items())]
+
+        return {
+            'started_at': self.started_at,
+            'series': series,
+            'features': [dict(feature=feature, **stats.to_dict()) for feature, stats in sorted(features.items())],
+            'documents': documents,
+            'providers': llm_engine.stats()['providers']
+        }
+
+    def render_prometheus(self) -> str:
+        """Render the statistics in the Prometheus text exposition format"""
+        lines = [
+            '# HELP llm_request_duration_seconds Time from scheduling an LLM call to its result, including retries',
+            '# TYPE llm_request_duration_seconds histogram'
+        ]
+        counters = {
+            'llm_requests_total': ('LLM completions by outcome', []),
+            'llm_retries_total': ('LLM provider calls retried after a failure', []),
+            'llm_tokens_total': ('Tokens sent to and generated by LLM providers', []),
+            'llm_cost_usd_total': ('Estimated LLM spend in US dollars', [])
+        }
+
+        with self._lock:
+            for (feature, provider, model), stats in sorted(self._series.items()):
+                labels = _format_labels(feature=feature, provider=provider, model=model)
+                for bound, cumulative in stats.latency.cumulative():
+                    le = '+Inf' if math.isinf(bound) else repr(float(bound))
+                    lines.append(f'llm_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f'llm_request_duration_seconds_sum{{{labels}}} {stats.latency.sum}')
+                lines.append(f'llm_request_duration_seconds_count{{{labels}}} {stats.latency.count}')
+
+                for outcome, count in sorted(stats.outcomes.items()):
+                    counters['llm_requests_total'][1].append(f'{{{labels},outcome="{outcome}"}} {count}')
+                counters['llm_retries_total'][1].append(f'{{{labels}}} {stats.retries}')
+                counters['llm_tokens_total'][1].append(f'{{{labels},direction="input"}} {stats.input_tokens}')
+                counters['llm_tokens_total'][1].append(f'{{{labels},direction="output"}} {stats.output_tokens}')
+                counters['llm_cost_usd_total'][1].append(f'{{{labels}}} {stats.cost}')
+
+        for name, (help_text, samples) in counters.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            lines.extend(f'{name}{sample}' for sample in samples)
+
+        providers = sorted(llm_engine.stats()['providers'].items())
+        for name, metric_type, key, help_text in (
+            ('llm_concurrency_limit', 'gauge', 'limit', 'Current adaptive in-flight limit per provider'),
+            ('llm_concurrency_in_flight', 'gauge', 'in_flight', 'LLM calls holding a provider slot'),
+            ('llm_concurrency_waiting', 'gauge', 'waiting', 'LLM calls waiting for a provider slot'),
+            ('llm_throttle_events_total', 'counter', 'throttle_events', 'Throttling, timeout and overload errors per provider')
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.extend(f'{name}{{{_format_labels(provider=provider)}}} {item[key]}' for provider, item in providers)
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        """Discard all statistics"""
+        with self._lock:
+            self._series.clear()
+            self._documents.clear()
+            self.started_at = datetime.utcnow()
+
+
+def _format_labels(**labels):
+    """Format Prometheus label pairs, escaping backslashes, quotes and newlines"""
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in labels.items())
+
+
+# Process-wide registry; each worker process reports its own calls
+llm_metrics = LLMMetrics()
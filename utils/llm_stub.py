@@ -0,0 +1,223 @@
+"""
+Offline stub LLM provider for benchmarks and load tests
+
+Selected with LLM_MODE=stub. Every gateway task gets a response in the format
+its caller parses, built from the prompt itself so the same prompt always
+gets the same answer. Calls take a simulated log-normal latency, and a
+configurable share of them fail the way a throttled provider does, so the
+engine, retries and search fan-out behave as they would against the real API.
+"""
+import os
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import logging
+import threading
+
+from utils.llm_gateway import ProviderAdapter, LLMResponse
+from utils.model_routing import (TASK_SEARCH_SCREENING, TASK_PASSAGE_EXTRACTION, TASK_SEARCH_ANSWER, TASK_SUMMARY,
+                                 TASK_RELEVANCE_REASONS, TASK_FRIENDLY_NAME, TASK_CATEGORIZATION)
+from utils.search_index import tokenize
+from utils.context_builder import estimate_tokens
+from utils.snippet_extractor import split_sentences
+
+logger = logging.getLogger(__name__)
+
+# Simulated latency per call: log-normal with this median (milliseconds) and spread
+LLM_STUB_LATENCY_MS = float(os.environ.get("LLM_STUB_LATENCY_MS", 800))
+LLM_STUB_LATENCY_SIGMA = float(os.environ.get("LLM_STUB_LATENCY_SIGMA", 0.5))
+LLM_STUB_FIRST_TOKEN_SHARE = 0.3   # Share of the latency before the first streamed chunk
+
+# Share of calls that fail with a retryable 429 or 503
+LLM_STUB_ERROR_RATE = float(os.environ.get("LLM_STUB_ERROR_RATE", 0))
+
+# Seed for latency and failures; unset for a different draw on every run
+LLM_STUB_SEED = os.environ.get("LLM_STUB_SEED")
+
+STREAM_CHUNK_WORDS = 8
+RELEVANT_SCORE = 4   # Stub verdicts at or above this score are relevant
+
+QUERY_PATTERN = re.compile(r'SEARCH QUERY: "(.*?)"')
+DOCUMENT_SECTION = re.compile(r'=== DOCUMENT (\d+) ===\n(.*?)(?=\n=== DOCUMENT \d+ ===|\n\s*For each document)', re.DOTALL)
+SINGLE_DOCUMENT = re.compile(r'DOCUMENT TEXT:\s*\n(.*?)\n\s*(?:First, evaluate|Evaluate if)', re.DOTALL)
+FILENAME_PATTERN = re.compile(r'filename:\s*(.+)$', re.MULTILINE)
+CATEGORY_BLOCK = re.compile(r'categor(?:y|ies)[^\n]*:\s*\n(.*?)\n\s*\n', re.IGNORECASE | re.DOTALL)
+ANSWER_DOCUMENT = re.compile(r'^\s*Document \d+: (.+)$', re.MULTILINE)
+ANSWER_PASSAGE = re.compile(r'^\s*- (.+)$', re.MULTILINE)
+
+
+class StubProviderError(Exception):
+    """Simulated throttling or outage"""
+
+    def __init__(self, status_code):
+        super().__init__(f"Stub provider returned {status_code}")
+        self.status_code = status_code
+
+
+def stream_text(text, on_token, duration):
+    """
+    Send text to on_token in word chunks spread over a duration
+
+    Args:
+        text: Full response text
+        on_token: Callable receiving each chunk
+        duration: Seconds to spread the chunks over
+    """
+    words = re.findall(r'\S+\s*', text)
+    chunks = [''.join(words[i:i + STREAM_CHUNK_WORDS]) for i in range(0, len(words), STREAM_CHUNK_WORDS)]
+    for chunk in chunks:
+        if duration > 0:
+            time.sleep(duration / len(chunks))
+        on_token(chunk)
+
+def _longest_paragraph(text):
+    """The largest block of a prompt, which is normally the document text"""
+    return max(re.split(r'\n\s*\n', text), key=len).strip()
+
+def _content_sentences(text, limit):
+    """Get up to limit reasonably long sentences from a block of text"""
+    sentences = [' '.join(text[start:end].split()) for start, end in split_sentences(text)]
+    return list(dict.fromkeys(sentence for sentence in sentences if len(sentence) >= 40))[:limit]
+
+def _judge(query_terms, text, extract_passages):
+    """Build a relevance verdict from how many query terms a document contains"""
+    matched = sorted(query_terms.intersection(tokenize(text)))
+    score = round(10 * len(matched) / len(query_terms)) if query_terms else 0
+    verdict = {
+        'is_relevant': score >= RELEVANT_SCORE,
+        'relevance_score': score,
+        'summary': (f"Discusses {', '.join(matched[:3])} in relation to the query." if matched
+                    else "Does not discuss the query.")
+    }
+    if extract_passages:
+        passages = []
+        if matched:
+            sentences = [' '.join(text[start:end].split()) for start, end in split_sentences(text)]
+            best = max(sentences, key=lambda sentence: len(query_terms.intersection(tokenize(sentence))), default='')
+            if best:
+                passages.append({'text': best[:400], 'location': 'Section 1'})
+        verdict['passages'] = passages
+    return verdict
+
+def respond_relevance(request):
+    """Screening and passage prompts: one JSON verdict, or an array for batch prompts"""
+    prompt = request.prompt
+    match = QUERY_PATTERN.search(prompt)
+    query_terms = set(tokenize(match.group(1) if match else ''))
+    extract_passages = '"passages"' in prompt
+
+    sections = DOCUMENT_SECTION.findall(prompt)
+    if sections:
+        verdicts = [dict(document=int(number), **_judge(query_terms, text, extract_passages))
+                    for number, text in sections]
+        return json.dumps(verdicts)
+
+    match = SINGLE_DOCUMENT.search(prompt)
+    return json.dumps(_judge(query_terms, match.group(1) if match else prompt, extract_passages))
+
+def respond_answer(request):
+    """Search answers: two short paragraphs citing the documents and passages in the prompt"""
+    titles = ANSWER_DOCUMENT.findall(request.prompt)
+    passages = [passage for passage in ANSWER_PASSAGE.findall(request.prompt) if len(passage) > 20]
+    if not titles:
+        return "The documents provided do not contain enough information to answer this question."
+    answer = f"According to **{titles[0]}**, {passages[0] if passages else 'the topic is covered in detail.'}"
+    if len(titles) > 1:
+        answer += f"\n\n**{titles[1]}** adds that {passages[1] if len(passages) > 1 else 'related practices apply.'}"
+    return answer
+
+def respond_summary(request):
+    """Summaries: Key Points and Summary sections, or bullets for chunk extraction prompts"""
+    sentences = _content_sentences(_longest_paragraph(request.prompt), 6) or ["The document covers its topic briefly."]
+    bullets = []
+    for sentence in sentences[:5]:
+        title = ' '.join(sentence.split()[:3]).strip('.,;:')
+        bullets.append(f"- **{title}:** {sentence}")
+    if 'document chunk' in request.prompt:
+        return '\n'.join(bullet.replace('**', '') for bullet in bullets)
+    return "Key Points:\n" + '\n'.join(bullets) + "\n\nSummary:\n" + ' '.join(sentences[:3])
+
+def respond_relevance_reason(request):
+    """Team relevance reasons: JSON with a reason of 40-200 characters"""
+    sentences = _content_sentences(_longest_paragraph(request.prompt), 1)
+    point = sentences[0][:120].rstrip('.') if sentences else "the practices this document describes"
+    return json.dumps({'relevance_reason': f"Apply {point} to cut rework in your team's weekly workflow."[:200]})
+
+def respond_friendly_name(request):
+    """Titles: the filename from the prompt, cleaned up and title-cased"""
+    matches = FILENAME_PATTERN.findall(request.prompt)
+    name = re.sub(r'\.[^.]+$', '', matches[-1].strip()) if matches else 'Untitled Document'
+    words = re.sub(r'[_\-]+', ' ', name).split()
+    return ' '.join(word.capitalize() for word in words[:6]) or 'Untitled Document'
+
+def respond_category(request):
+    """Categories: one of the categories the prompt lists, chosen by prompt hash"""
+    match = CATEGORY_BLOCK.search(request.prompt)
+    block = match.group(1) if match else ''
+    categories = [item.strip(' -\t') for item in re.split(r'[,\n]', block) if item.strip(' -\t')]
+    categories = categories or ['Uncategorized']
+    digest = int(hashlib.sha256(request.prompt.encode('utf-8')).hexdigest(), 16)
+    category = categories[digest % len(categories)]
+    return json.dumps({'category': category, 'confidence': 0.8,
+                       'explanation': f"Stub classification as {category}"})
+
+# Response builder per task; other tasks get respond_default
+TASK_RESPONDERS = {
+    TASK_SEARCH_SCREENING: respond_relevance,
+    TASK_PASSAGE_EXTRACTION: respond_relevance,
+    TASK_SEARCH_ANSWER: respond_answer,
+    TASK_SUMMARY: respond_summary,
+    TASK_RELEVANCE_REASONS: respond_relevance_reason,
+    TASK_FRIENDLY_NAME: respond_friendly_name,
+    TASK_CATEGORIZATION: respond_category
+}
+
+def respond_default(request):
+    """Unlabelled calls: a JSON object when JSON was requested, otherwise plain text"""
+    if request.json_output:
+        return json.dumps({'result': 'stub'})
+    return "Stub response."
+
+
+class StubAdapter(ProviderAdapter):
+    """
+    Provider adapter that answers from TASK_RESPONDERS without any network access.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._random = random.Random(int(LLM_STUB_SEED) if LLM_STUB_SEED else None)
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        """Draw a latency in seconds and whether the call fails"""
+        with self._lock:
+            latency = self._random.lognormvariate(math.log(max(LLM_STUB_LATENCY_MS, 1)), LLM_STUB_LATENCY_SIGMA)
+            fails = self._random.random() < LLM_STUB_ERROR_RATE
+            status_code = self._random.choice([429, 429, 503])
+        return latency / 1000.0, (status_code if fails else None)
+
+    def generate(self, request, on_token=None):
+        latency, status_code = self._draw()
+        if status_code is not None:
+            time.sleep(latency * LLM_STUB_FIRST_TOKEN_SHARE)
+            raise StubProviderError(status_code)
+
+        text = TASK_RESPONDERS.get(request.task, respond_default)(request)
+        if on_token is None:
+            time.sleep(latency)
+        else:
+            time.sleep(latency * LLM_STUB_FIRST_TOKEN_SHARE)
+            stream_text(text, on_token, latency * (1 - LLM_STUB_FIRST_TOKEN_SHARE))
+        return LLMResponse(text, self.name, request.model,
+                           estimate_tokens(request.prompt) + estimate_tokens(request.system or ''),
+                           estimate_tokens(text))
+
+    def is_retryable(self, error):
+        return isinstance(error, StubProviderError) or super().is_retryable(error)
+
+    def is_overload(self, error):
+        return isinstance(error, StubProviderError) or super().is_overload(error)
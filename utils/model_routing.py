@@ -0,0 +1,46 @@
+"""
+Per-task Gemini model routing
+"""
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tasks that call an LLM; gateway calls are labelled with them for caching
+TASK_SEARCH_SCREENING = 'search_screening'        # Relevance screen of every search candidate
+TASK_PASSAGE_EXTRACTION = 'passage_extraction'    # Passages for the top search results
+TASK_SEARCH_ANSWER = 'search_answer'              # Synthesized answer on the results page
+TASK_SUMMARY = 'summary'                          # Document summaries and key points
+TASK_RELEVANCE_REASONS = 'relevance_reasons'      # Per-team relevance reasons
+TASK_FRIENDLY_NAME = 'friendly_name'              # Document titles from filenames
+TASK_CATEGORIZATION = 'categorization'            # Document categories at upload
+
+# Models
+GEMINI_PRO_MODEL = os.environ.get("GEMINI_PRO_MODEL", "gemini-1.5-pro")
+GEMINI_FAST_MODEL = os.environ.get("GEMINI_FAST_MODEL", "gemini-1.5-flash")
+
+# Default model per task; screening every candidate and titling files only need the fast model
+DEFAULT_TASK_MODELS = {
+    TASK_SEARCH_SCREENING: GEMINI_FAST_MODEL,
+    TASK_PASSAGE_EXTRACTION: GEMINI_PRO_MODEL,
+    TASK_SEARCH_ANSWER: GEMINI_PRO_MODEL,
+    TASK_SUMMARY: GEMINI_PRO_MODEL,
+    TASK_RELEVANCE_REASONS: GEMINI_PRO_MODEL,
+    TASK_FRIENDLY_NAME: GEMINI_FAST_MODEL,
+    TASK_CATEGORIZATION: GEMINI_FAST_MODEL
+}
+
+def get_model_for_task(task):
+    """
+    Get the Gemini model that handles a task
+    
+    Each task can be overridden with GEMINI_MODEL_<TASK>, for example
+    GEMINI_MODEL_SEARCH_SCREENING=gemini-1.5-pro.
+    
+    Args:
+        task: One of the TASK_* constants
+    
+    Returns:
+        str: Model name
+    """
+    return os.environ.get(f"GEMINI_MODEL_{task.upper()}") or DEFAULT_TASK_MODELS.get(task, GEMINI_PRO_MODEL)
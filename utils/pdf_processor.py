@@ -124,6 +124,46 @@ def extract_text_from_large_pdf(pdf_path):
         logger.error(f"Error in large file extraction: {str(e)}")
         raise Exception(f"Failed to extract text from large PDF: {str(e)}")
 
+def get_pdf_page_offsets(pdf_path, text):
+    """
+    Find where each PDF page starts within previously extracted text.
+    
+    The stored document text does not keep page boundaries, so each page is
+    extracted again and located in the text in order.
+    
+    Args:
+        pdf_path: Path to the PDF file
+        text: Text previously extracted from the same PDF
+        
+    Returns:
+        List of (page_number, start_offset) tuples with 1-based page numbers,
+        or an empty list if the pages could not be located
+    """
+    try:
+        offsets = []
+        cursor = 0
+        with open(pdf_path, 'rb') as file:
+            reader = PdfReader(file)
+            for page_num, page in enumerate(reader.pages):
+                try:
+                    page_text = (page.extract_text() or '').strip()
+                except Exception as page_error:
+                    logger.warning(f"Error extracting text from page {page_num}: {str(page_error)}")
+                    continue
+                if not page_text:
+                    continue
+                
+                # Locate the page by its opening text
+                position = text.find(page_text[:200], cursor)
+                if position == -1:
+                    continue
+                offsets.append((page_num + 1, position))
+                cursor = position + 1
+        return offsets
+    except Exception as e:
+        logger.error(f"Error reading PDF page offsets: {str(e)}")
+        return []
+
 def get_pdf_metadata(pdf_path):
     """
     Extract metadata from a PDF file.
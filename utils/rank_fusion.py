@@ -0,0 +1,144 @@
+"""
+Hybrid rank fusion of lexical and semantic retrieval with an adaptive shortlist size
+"""
+import os
+import logging
+from statistics import median
+
+logger = logging.getLogger(__name__)
+
+# Reciprocal rank fusion constant; larger values flatten the contribution of top ranks
+RRF_K = int(os.environ.get("SEARCH_RRF_K", 60))
+
+# Relative weight of each retrieval source in the fused ranking
+FUSION_WEIGHTS = {
+    'lexical': float(os.environ.get("SEARCH_LEXICAL_WEIGHT", 1.0)),
+    'semantic': float(os.environ.get("SEARCH_SEMANTIC_WEIGHT", 1.0))
+}
+
+# Documents taken from each database-ranked source before fusion
+FUSION_DEPTH = int(os.environ.get("SEARCH_FUSION_DEPTH", 100))
+
+# Shortlist sizing: keep documents whose fused score is within this share of the best one
+ENABLE_ADAPTIVE_SHORTLIST = os.environ.get("SEARCH_ADAPTIVE_SHORTLIST", "true").lower() != "false"
+SHORTLIST_MIN = int(os.environ.get("SEARCH_SHORTLIST_MIN", 5))
+SHORTLIST_RELATIVE_SCORE = float(os.environ.get("SEARCH_SHORTLIST_RELATIVE_SCORE", 0.5))
+
+def reciprocal_rank_fusion(rankings, weights=None, k=RRF_K):
+    """
+    Merge rankings with weighted reciprocal rank fusion
+    
+    Args:
+        rankings: Mapping of source name to a list of doc_ids, best first
+        weights: Optional mapping of source name to weight (default 1.0)
+        k: RRF constant
+    
+    Returns:
+        dict: Mapping of doc_id to fused score
+    """
+    weights = weights or {}
+    fused = {}
+    for source, ranking in rankings.items():
+        weight = weights.get(source, 1.0)
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight / (k + rank + 1)
+    return fused
+
+def normalize_scores(scores, doc_ids):
+    """
+    Scale one source's scores to 0-1 by how far each document stands above a typical one
+    
+    The median over all documents is the baseline, so a source that scores
+    everything about the same (common for vector similarity) contributes
+    little, while a document far ahead of the rest scores close to 1.
+    
+    Args:
+        scores: Mapping of doc_id to raw score; missing documents count as 0
+        doc_ids: All documents being ranked
+    
+    Returns:
+        dict: Mapping of doc_id to normalized score for documents above the baseline
+    """
+    values = [max(scores.get(doc_id, 0.0), 0.0) for doc_id in doc_ids]
+    if not values:
+        return {}
+    baseline = median(values)
+    top = max(values)
+    if top <= baseline:
+        return {}
+    return {doc_id: (value - baseline) / (top - baseline)
+            for doc_id, value in zip(doc_ids, values) if value > baseline}
+
+def adaptive_shortlist_size(fused_values, max_size, min_size=SHORTLIST_MIN, relative_score=SHORTLIST_RELATIVE_SCORE):
+    """
+    Decide how many documents to send for LLM scoring
+    
+    A clear winner leaves few documents near the best fused score and gives
+    a short list; flat scores keep many documents close to the top and give
+    a longer one.
+    
+    Args:
+        fused_values: Fused scores, best first
+        max_size: Largest allowed shortlist
+        min_size: Smallest allowed shortlist
+        relative_score: Share of the best score a document needs to be kept
+    
+    Returns:
+        int: Shortlist size between min_size and max_size
+    """
+    if not fused_values or fused_values[0] <= 0:
+        return max_size
+    cutoff = fused_values[0] * relative_score
+    size = sum(1 for value in fused_values if value >= cutoff)
+    return max(min(size, max_size), min(min_size, max_size))
+
+def fuse_rankings(score_sets, doc_ids, max_size, weights=None, adaptive=None,
+                  min_size=SHORTLIST_MIN, relative_score=SHORTLIST_RELATIVE_SCORE):
+    """
+    Build the LLM shortlist from several retrieval sources
+    
+    Documents are ordered by reciprocal rank fusion; the shortlist length comes
+    from the weighted, normalized scores so it reflects how decisive retrieval was.
+    Documents no source matched fill any remaining places in repository order.
+    
+    Args:
+        score_sets: Mapping of source name ('lexical', 'semantic') to {doc_id: score}
+        doc_ids: All documents being ranked, in repository order
+        max_size: Largest allowed shortlist
+        weights: Optional mapping of source name to weight (default FUSION_WEIGHTS)
+        adaptive: Size the shortlist from score gaps (default ENABLE_ADAPTIVE_SHORTLIST)
+        min_size: Smallest adaptive shortlist
+        relative_score: Share of the best fused score a document needs to be kept
+    
+    Returns:
+        list: Shortlisted doc_ids, best first
+    """
+    weights = FUSION_WEIGHTS if weights is None else weights
+    adaptive = ENABLE_ADAPTIVE_SHORTLIST if adaptive is None else adaptive
+    position = {doc_id: index for index, doc_id in enumerate(doc_ids)}
+    
+    rankings = {}
+    normalized = {}
+    for source, scores in score_sets.items():
+        matched = [doc_id for doc_id in scores if doc_id in position and scores[doc_id] > 0]
+        rankings[source] = sorted(matched, key=lambda doc_id: (-scores[doc_id], position[doc_id]))
+        normalized[source] = normalize_scores(scores, doc_ids)
+    
+    fused = reciprocal_rank_fusion(rankings, weights)
+    ordered = sorted(fused, key=lambda doc_id: (-fused[doc_id], position[doc_id]))
+    
+    size = max_size
+    if adaptive:
+        total_weight = sum(weights.get(source, 1.0) for source in normalized) or 1.0
+        strength = {doc_id: sum(weights.get(source, 1.0) * normalized[source].get(doc_id, 0.0)
+                                for source in normalized) / total_weight
+                    for doc_id in ordered}
+        size = adaptive_shortlist_size(sorted(strength.values(), reverse=True), max_size, min_size, relative_score)
+    
+    shortlist = ordered[:size]
+    if len(shortlist) < size:
+        chosen = set(shortlist)
+        shortlist.extend([doc_id for doc_id in doc_ids if doc_id not in chosen][:size - len(shortlist)])
+    logger.info(f"Rank fusion shortlisted {len(shortlist)} of {len(doc_ids)} documents "
+                f"({len(ordered)} matched by retrieval)")
+    return shortlist
@@ -8,11 +8,42 @@ from datetime import datetime, timedelta
 from sqlalchemy import desc, and_, or_, func
 from flask_login import current_user
 
-from models import Document, User, UserActivity, UserDismissedRecommendation
+from models import Document, User, UserActivity, UserDismissedRecommendation, TeamResponsibility
 from utils.relevance_generator import generate_team_relevance
+from utils.vector_index import get_vector_index
 
 logger = logging.getLogger(__name__)
 
+# Number of recent documents considered per recommendation slot before semantic ranking
+CANDIDATE_POOL_FACTOR = 5
+
+def rank_by_team_similarity(documents, team_specialization):
+    """
+    Order documents by semantic similarity to a team's responsibilities
+    
+    Uses the shared chunk vector index, so no AI calls are made. Documents keep
+    their original (recency) order when the index is unavailable.
+    
+    Args:
+        documents: List of Document objects
+        team_specialization: Team name
+        
+    Returns:
+        list: Documents, most similar first
+    """
+    try:
+        team = TeamResponsibility.query.filter_by(team_name=team_specialization).first()
+        team_text = f"{team_specialization}. {team.description}" if team else team_specialization
+        
+        index = get_vector_index()
+        if index is None:
+            return documents
+        scores = index.document_scores(team_text, doc_ids=[doc.id for doc in documents])
+        return sorted(documents, key=lambda doc: scores.get(doc.id, 0.0), reverse=True)
+    except Exception as e:
+        logger.error(f"Error ranking recommendations by team similarity: {str(e)}")
+        return documents
+
 def get_user_recommendations(user, max_recommendations=3):
     """
     Get personalized document recommendations for a user, excluding dismissed ones
@@ -66,7 +97,7 @@ def get_user_recommendations(user, max_recommendations=3):
             all_docs = (
                 query.filter(Document.id.notin_(viewed_doc_ids))
                 .order_by(desc(Document.uploaded_at))
-                .limit(int(max_recommendations * 0.8) + 1)
+                .limit((int(max_recommendations * 0.8) + 1) * CANDIDATE_POOL_FACTOR)
                 .all()
             )
             
@@ -82,7 +113,10 @@ def get_user_recommendations(user, max_recommendations=3):
                 all_docs.extend(viewed_docs)
         else:
             # User hasn't viewed any documents yet, just get the most recent ones
-            all_docs = query.order_by(desc(Document.uploaded_at)).limit(max_recommendations).all()
+            all_docs = query.order_by(desc(Document.uploaded_at)).limit(max_recommendations * CANDIDATE_POOL_FACTOR).all()
+        
+        # Put the documents closest to the team's responsibilities first
+        all_docs = rank_by_team_similarity(all_docs, team_specialization)
             
         # Prioritize documents that have specific relevance reasons for the user's team
         # by moving them to the front of the list
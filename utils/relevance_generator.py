@@ -5,7 +5,9 @@ import os
 import json
 import logging
 from models import User
-import openai
+from utils.llm_gateway import complete, PROVIDER_OPENAI
+from utils.model_routing import TASK_RELEVANCE_REASONS
+from utils.context_builder import build_context
 
 # Alias for backward compatibility
 def get_document_relevance_reasons(document_info):
@@ -39,9 +41,8 @@ def get_document_relevance_reasons(document_info):
 
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-openai_api_key = os.environ.get("OPENAI_API_KEY")
-openai_client = openai.OpenAI(api_key=openai_api_key)
+# Estimated tokens of document text quoted in each team's relevance prompt
+RELEVANCE_CONTEXT_TOKENS = int(os.environ.get("RELEVANCE_CONTEXT_TOKENS", 250))
 
 def generate_relevance_reasons(document):
     """
@@ -60,7 +61,9 @@ def generate_relevance_reasons(document):
             "category": document.category,
             "summary": document.summary or "Not available",
             "key_points": document.key_points or "Not available",
-            "text_excerpt": document.text[:1000] + "..." if document.text and len(document.text) > 1000 else document.text
+            "text_excerpt": build_context(document.text, token_budget=RELEVANCE_CONTEXT_TOKENS) if document.text else document.text,
+            # Full text lets each team's prompt quote the parts that matter to that team
+            "text": document.text
         }
         
         # Get all team specializations
@@ -116,6 +119,11 @@ def generate_team_relevance(team, document_info):
                 # Get context for this team
                 current_team_context = team_context.get(team, "Works on specialized product management areas")
         
+        # Quote the parts of the document closest to this team's work when the full text is available
+        text_excerpt = document_info.get('text_excerpt')
+        if document_info.get('text'):
+            text_excerpt = build_context(document_info['text'], f"{team} {current_team_context}", RELEVANCE_CONTEXT_TOKENS)
+        
         # Craft prompt for generating relevance
         prompt = f"""
         Document Information:
@@ -123,7 +131,7 @@ def generate_team_relevance(team, document_info):
         Category: {document_info['category']}
         Summary: {document_info['summary']}
         Key Points: {document_info['key_points']}
-        Text excerpt: {document_info['text_excerpt']}
+        Text excerpt: {text_excerpt}
         
         Team specialization: {team}
         Team context: {current_team_context}
@@ -159,21 +167,16 @@ def generate_team_relevance(team, document_info):
         # Call OpenAI API to generate the relevance reason
         # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
         # do not change this unless explicitly requested by the user
-        response = openai_client.chat.completions.create(
+        response = complete(PROVIDER_OPENAI, prompt,
             model="gpt-4o",
-            messages=[
-                {
-                    "role": "system", 
-                    "content": "You are an AI assistant that creates ultra-concise and hyper-specific document recommendations based on concrete document content. You MUST ALWAYS include specific metrics, numbers, tools, technologies or methodologies from the document. Your responses must include exact percentages, specific tools mentioned, and direct applications with measurable benefits. Always use second-person language, active verbs, and focus on immediate actionable steps. NEVER use generic phrases like 'updates directly impact your toolset' or 'enhance capabilities'. Instead, specify exactly which tools, what impacts, and what capabilities with numbers. Be ruthlessly specific - mention exact features, exact pages/sections, exact technologies, and exact benefits with metrics. Your output should be 1-2 sentences that precisely explain how the document helps this specific team's day-to-day work. You respond in JSON format."
-                },
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"},
-            max_tokens=200
+            system="You are an AI assistant that creates ultra-concise and hyper-specific document recommendations based on concrete document content. You MUST ALWAYS include specific metrics, numbers, tools, technologies or methodologies from the document. Your responses must include exact percentages, specific tools mentioned, and direct applications with measurable benefits. Always use second-person language, active verbs, and focus on immediate actionable steps. NEVER use generic phrases like 'updates directly impact your toolset' or 'enhance capabilities'. Instead, specify exactly which tools, what impacts, and what capabilities with numbers. Be ruthlessly specific - mention exact features, exact pages/sections, exact technologies, and exact benefits with metrics. Your output should be 1-2 sentences that precisely explain how the document helps this specific team's day-to-day work. You respond in JSON format.",
+            json_output=True,
+            max_tokens=200,
+            task=TASK_RELEVANCE_REASONS
         )
         
         # Parse the response
-        result = json.loads(response.choices[0].message.content)
+        result = json.loads(response.text)
         relevance = result.get("relevance_reason")
         
         # If we have a valid response, return just the relevance_reason string (not the full JSON object)
@@ -6,16 +6,17 @@ import json
 import logging
 import re
 from models import User
-import google.generativeai as genai
+from utils.llm_gateway import complete, PROVIDER_GEMINI
+from utils.context_builder import build_context
+from utils.model_routing import get_model_for_task, TASK_RELEVANCE_REASONS
 
 logger = logging.getLogger(__name__)
 
-# Initialize Gemini client
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
-
 # Model configuration
-GEMINI_MODEL = "gemini-1.5-pro"
+RELEVANCE_REASONS_MODEL = get_model_for_task(TASK_RELEVANCE_REASONS)
+
+# Estimated tokens of document text quoted in each team's relevance prompt
+RELEVANCE_CONTEXT_TOKENS = int(os.environ.get("RELEVANCE_CONTEXT_TOKENS", 250))
 
 def generate_relevance_reasons(document):
     """
@@ -34,7 +35,9 @@ def generate_relevance_reasons(document):
             "category": document.category,
             "summary": document.summary or "Not available",
             "key_points": document.key_points or "Not available",
-            "text_excerpt": document.text[:1000] + "..." if document.text and len(document.text) > 1000 else document.text
+            "text_excerpt": build_context(document.text, token_budget=RELEVANCE_CONTEXT_TOKENS) if document.text else document.text,
+            # Full text lets each team's prompt quote the parts that matter to that team
+            "text": document.text
         }
         
         # Get all team specializations
@@ -90,6 +93,11 @@ def generate_team_relevance(team, document_info):
                 # Get context for this team
                 current_team_context = team_context.get(team, "Works on specialized product management areas")
         
+        # Quote the parts of the document closest to this team's work when the full text is available
+        text_excerpt = document_info.get('text_excerpt')
+        if document_info.get('text'):
+            text_excerpt = build_context(document_info['text'], f"{team} {current_team_context}", RELEVANCE_CONTEXT_TOKENS)
+        
         # Craft prompt for generating relevance
         prompt = f"""
         Document Information:
@@ -97,7 +105,7 @@ def generate_team_relevance(team, document_info):
         Category: {document_info['category']}
         Summary: {document_info['summary']}
         Key Points: {document_info['key_points']}
-        Text excerpt: {document_info['text_excerpt']}
+        Text excerpt: {text_excerpt}
         
         Team specialization: {team}
         Team context: {current_team_context}
@@ -130,15 +138,6 @@ def generate_team_relevance(team, document_info):
         }
         """
         
-        # Initialize Gemini model
-        model = genai.GenerativeModel(
-            GEMINI_MODEL,
-            generation_config={
-                "temperature": 0.2,
-                "max_output_tokens": 200
-            }
-        )
-        
         # First, let's add a system prompt to guide generation
         system_prompt = """You are an AI assistant that creates ultra-concise and hyper-specific document recommendations based on concrete document content. You MUST ALWAYS include specific metrics, numbers, tools, technologies or methodologies from the document. Your responses must include exact percentages, specific tools mentioned, and direct applications with measurable benefits. Always use second-person language, active verbs, and focus on immediate actionable steps. NEVER use generic phrases like 'updates directly impact your toolset' or 'enhance capabilities'. Instead, specify exactly which tools, what impacts, and what capabilities with numbers. Be ruthlessly specific - mention exact features, exact pages/sections, exact technologies, and exact benefits with metrics. Your output should be 1-2 sentences that precisely explain how the document helps this specific team's day-to-day work. You respond in JSON format."""
         
@@ -146,7 +145,8 @@ def generate_team_relevance(team, document_info):
         full_prompt = f"{system_prompt}\n\n{prompt}"
         
         # Call Gemini API to generate the relevance reason
-        response = model.generate_content(full_prompt)
+        response = complete(PROVIDER_GEMINI, full_prompt, RELEVANCE_REASONS_MODEL, temperature=0.2, max_tokens=200,
+                            task=TASK_RELEVANCE_REASONS)
         
         # Parse the response - expecting JSON
         try:
@@ -0,0 +1,133 @@
+"""
+Persistent memo of per-(query, document) relevance verdicts
+"""
+import os
+import hashlib
+import logging
+from datetime import datetime, timedelta
+
+from models import db, RelevanceJudgment
+from utils.search_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# Memo configuration
+RELEVANCE_MEMO_ENABLED = os.environ.get("RELEVANCE_MEMO_ENABLED", "true").lower() == "true"
+RELEVANCE_MEMO_MAX_AGE_DAYS = int(os.environ.get("RELEVANCE_MEMO_MAX_AGE_DAYS", 30))
+
+# Bump when the relevance prompt changes so old verdicts are not reused
+RELEVANCE_PROMPT_VERSION = 2
+
+def query_hash(query, model):
+    """
+    Hash a query together with the model and prompt version that judged it
+
+    Args:
+        query: Search query
+        model: Name of the scoring model
+
+    Returns:
+        str: Hex SHA-256 hash
+    """
+    raw = f"{normalize_query(query)}\x1f{model}\x1f{RELEVANCE_PROMPT_VERSION}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def content_hash(text):
+    """
+    Hash the document text that is sent for scoring
+
+    Args:
+        text: Document text as included in the relevance prompt
+
+    Returns:
+        str: Hex SHA-256 hash
+    """
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+def get_memoized_verdicts(query, model, content_hashes):
+    """
+    Look up stored verdicts for a query
+
+    Must be called inside an application context.
+
+    Args:
+        query: Search query
+        model: Name of the scoring model
+        content_hashes: Iterable of document content hashes to look up
+
+    Returns:
+        dict: Mapping of content hash to verdict dictionary
+    """
+    if not RELEVANCE_MEMO_ENABLED:
+        return {}
+
+    try:
+        wanted = set(content_hashes)
+        cutoff = datetime.utcnow() - timedelta(days=RELEVANCE_MEMO_MAX_AGE_DAYS)
+        # One indexed lookup on the query hash; rows for other documents are filtered here
+        rows = RelevanceJudgment.query.filter(
+            RelevanceJudgment.query_hash == query_hash(query, model),
+            RelevanceJudgment.created_at >= cutoff
+        ).all()
+        return {row.content_hash: row.to_verdict() for row in rows if row.content_hash in wanted}
+    except Exception as e:
+        logger.error(f"Error reading relevance memo: {str(e)}")
+        db.session.rollback()
+        return {}
+
+def save_verdicts(query, model, verdicts):
+    """
+    Store new verdicts for a query
+
+    Must be called inside an application context.
+
+    Args:
+        query: Search query
+        model: Name of the scoring model
+        verdicts: Mapping of content hash to verdict dictionary
+    """
+    if not RELEVANCE_MEMO_ENABLED or not verdicts:
+        return
+
+    try:
+        key = query_hash(query, model)
+        now = datetime.utcnow()
+        for hash_value, verdict in verdicts.items():
+            db.session.merge(RelevanceJudgment(
+                query_hash=key,
+                content_hash=hash_value,
+                query_text=query[:255],
+                model=model,
+                is_relevant=bool(verdict.get('is_relevant')),
+                relevance_score=int(verdict.get('relevance_score') or 0),
+                passages=verdict.get('passages') or [],
+                summary=verdict.get('summary') or '',
+                created_at=now
+            ))
+        db.session.commit()
+        logger.info(f"Memoized {len(verdicts)} relevance verdict(s) for '{query}'")
+    except Exception as e:
+        logger.error(f"Error writing relevance memo: {str(e)}")
+        db.session.rollback()
+
+def prune_relevance_memo():
+    """
+    Remove verdicts older than the memo age limit
+
+    Verdicts for edited documents are never looked up again because their
+    content hash no longer matches, so they age out here.
+
+    Returns:
+        int: Number of rows removed
+    """
+    try:
+        cutoff = datetime.utcnow() - timedelta(days=RELEVANCE_MEMO_MAX_AGE_DAYS)
+        removed = RelevanceJudgment.query.filter(RelevanceJudgment.created_at < cutoff).delete()
+        db.session.commit()
+        if removed:
+            logger.info(f"Pruned {removed} relevance memo entries")
+        return removed
+    except Exception as e:
+        logger.error(f"Error pruning relevance memo: {str(e)}")
+        db.session.rollback()
+        return 0
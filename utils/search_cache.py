@@ -0,0 +1,221 @@
+"""
+Search result cache keyed by normalized query, category filter and corpus version
+"""
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+
+from sqlalchemy import func
+
+from models import db, Document, SearchResultCache
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+SEARCH_CACHE_TTL_SECONDS = int(os.environ.get("SEARCH_CACHE_TTL_SECONDS", 6 * 3600))
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", 500))        # In-memory entries per worker
+SEARCH_CACHE_MAX_ROWS = int(os.environ.get("SEARCH_CACHE_MAX_ROWS", 5000))             # Rows kept in the database
+SEARCH_CACHE_PERSIST = os.environ.get("SEARCH_CACHE_PERSIST", "true").lower() == "true"
+
+def normalize_query(query):
+    """
+    Normalize a search query so trivially different phrasings share a cache entry
+
+    Lowercases, collapses whitespace and strips surrounding punctuation.
+
+    Args:
+        query: Raw search query
+
+    Returns:
+        str: Normalized query
+    """
+    query = re.sub(r'\s+', ' ', (query or '').lower()).strip()
+    return query.strip('?!.,;:"\' ')
+
+def normalize_category(category_filter):
+    """Treat a missing category filter the same as 'all'"""
+    if not category_filter or category_filter.lower() == 'all':
+        return 'all'
+    return category_filter
+
+def get_corpus_version():
+    """
+    Get a version string that changes whenever any Document is inserted, updated or deleted
+
+    Returns:
+        str: Corpus version
+    """
+    count, last_update = db.session.query(func.count(Document.id), func.max(Document.updated_at)).one()
+    return f"{count}:{last_update.isoformat() if last_update else 'none'}"
+
+def make_cache_key(query, category_filter, corpus_version):
+    """
+    Build the cache key for a search
+
+    Args:
+        query: Search query
+        category_filter: Category filter
+        corpus_version: Corpus version from get_corpus_version()
+
+    Returns:
+        str: Hex SHA-256 cache key
+    """
+    raw = f"{normalize_query(query)}\x1f{normalize_category(category_filter)}\x1f{corpus_version}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU cache with a time-to-live per entry.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a value, or None when missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.time() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, stored_at: Optional[float] = None) -> None:
+        """Store a value, evicting the least recently used entries when full"""
+        with self._lock:
+            self._entries[key] = (stored_at or time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_memory_cache = LRUCache(SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL_SECONDS)
+
+def get_cached_search(query, category_filter):
+    """
+    Look up cached results for a search
+
+    Args:
+        query: Search query
+        category_filter: Category filter
+
+    Returns:
+        dict: Cached payload (results, search_info, ai_response) or None on a miss
+    """
+    try:
+        key = make_cache_key(query, category_filter, get_corpus_version())
+
+        payload = _memory_cache.get(key)
+        if payload is not None:
+            logger.info(f"Search cache hit (memory) for '{query}'")
+            return payload
+
+        if not SEARCH_CACHE_PERSIST:
+            return None
+
+        entry = db.session.get(SearchResultCache, key)
+        if entry is None:
+            return None
+
+        if entry.created_at < datetime.utcnow() - timedelta(seconds=SEARCH_CACHE_TTL_SECONDS):
+            return None
+
+        entry.hit_count += 1
+        entry.last_accessed_at = datetime.utcnow()
+        db.session.commit()
+
+        stored_at = time.time() - (datetime.utcnow() - entry.created_at).total_seconds()
+        _memory_cache.set(key, entry.payload, stored_at=stored_at)
+        logger.info(f"Search cache hit (database) for '{query}'")
+        return entry.payload
+
+    except Exception as e:
+        logger.error(f"Error reading search cache: {str(e)}")
+        db.session.rollback()
+        return None
+
+def store_search(query, category_filter, payload: Dict[str, Any]):
+    """
+    Store the results of a completed search
+
+    Args:
+        query: Search query
+        category_filter: Category filter
+        payload: JSON-serializable dict with results, search_info and ai_response
+    """
+    try:
+        corpus_version = get_corpus_version()
+        key = make_cache_key(query, category_filter, corpus_version)
+        _memory_cache.set(key, payload)
+
+        if not SEARCH_CACHE_PERSIST:
+            return
+
+        now = datetime.utcnow()
+        db.session.merge(SearchResultCache(
+            cache_key=key,
+            query_text=query[:255],
+            category_filter=normalize_category(category_filter),
+            corpus_version=corpus_version,
+            payload=payload,
+            created_at=now,
+            last_accessed_at=now,
+            hit_count=0
+        ))
+        db.session.commit()
+        prune_search_cache()
+
+    except Exception as e:
+        logger.error(f"Error writing search cache: {str(e)}")
+        db.session.rollback()
+
+def prune_search_cache():
+    """
+    Remove expired database entries and trim the table to the least recently used limit
+
+    Returns:
+        int: Number of rows removed
+    """
+    try:
+        cutoff = datetime.utcnow() - timedelta(seconds=SEARCH_CACHE_TTL_SECONDS)
+        removed = SearchResultCache.query.filter(SearchResultCache.created_at < cutoff).delete()
+
+        overflow = SearchResultCache.query.count() - SEARCH_CACHE_MAX_ROWS
+        if overflow > 0:
+            stale_keys = [row.cache_key for row in
+                          SearchResultCache.query.with_entities(SearchResultCache.cache_key)
+                          .order_by(SearchResultCache.last_accessed_at.asc())
+                          .limit(overflow)]
+            removed += SearchResultCache.query.filter(
+                SearchResultCache.cache_key.in_(stale_keys)).delete(synchronize_session=False)
+
+        db.session.commit()
+        if removed:
+            logger.info(f"Pruned {removed} search cache entries")
+        return removed
+    except Exception as e:
+        logger.error(f"Error pruning search cache: {str(e)}")
+        db.session.rollback()
+        return 0
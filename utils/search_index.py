@@ -0,0 +1,485 @@
+"""
+Persistent BM25 inverted index used for local candidate retrieval before AI scoring
+"""
+import os
+import re
+import json
+import math
+import fcntl
+import logging
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+
+from utils.text_processor import clean_html
+
+logger = logging.getLogger(__name__)
+
+# Location of the persisted index (shared by all workers on this host)
+INDEX_DIR = os.environ.get(
+    'SEARCH_INDEX_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'search_index')
+)
+INDEX_PATH = os.path.join(INDEX_DIR, 'bm25_index.json')
+INDEX_LOCK_PATH = os.path.join(INDEX_DIR, 'bm25_index.lock')   # Serializes index writes across processes
+INDEX_FORMAT_VERSION = 1
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Per-field term frequency weights - a match in the title counts more than one in the body
+FIELD_WEIGHTS = {
+    'friendly_name': 3.0,
+    'summary': 2.0,
+    'key_points': 1.5,
+    'text': 1.0
+}
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+STOPWORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'can', 'do', 'does', 'for', 'from',
+    'has', 'have', 'how', 'i', 'if', 'in', 'into', 'is', 'it', 'its', 'me', 'my', 'no', 'not', 'of',
+    'on', 'or', 'our', 'so', 'that', 'the', 'their', 'them', 'then', 'there', 'these', 'they',
+    'this', 'to', 'was', 'we', 'were', 'what', 'when', 'where', 'which', 'who', 'why', 'will',
+    'with', 'you', 'your', 'about', 'tell', 'all', 'any', 'been', 'more', 'most', 'other', 'some',
+    'such', 'than', 'too', 'very', 'should', 'would', 'could'
+])
+
+def tokenize(text):
+    """
+    Split text into normalized search terms
+
+    Lowercases, drops stopwords and single characters, and strips a trailing
+    plural 's' so that "agents" and "agent" match.
+
+    Args:
+        text: Text to tokenize
+
+    Returns:
+        list: List of terms in document order
+    """
+    if not text:
+        return []
+
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        term = normalize_term(token)
+        if term:
+            terms.append(term)
+    return terms
+
+def normalize_term(token):
+    """
+    Normalize one lowercase token the way tokenize does
+
+    Args:
+        token: Lowercase alphanumeric token
+
+    Returns:
+        str: The search term, or None for stopwords and single characters
+    """
+    if len(token) < 2 or token in STOPWORDS:
+        return None
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        token = token[:-1]
+    return token
+
+def tokenize_with_offsets(text):
+    """
+    Split text into search terms with the character span of each one
+
+    Terms are normalized exactly as tokenize does, so positions line up with
+    the terms stored in the index.
+
+    Args:
+        text: Text to tokenize
+
+    Returns:
+        list: (term, start, end) tuples in document order
+    """
+    if not text:
+        return []
+
+    terms = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        term = normalize_term(match.group())
+        if term:
+            terms.append((term, match.start(), match.end()))
+    return terms
+
+def document_fields(document):
+    """
+    Extract the indexed fields from a Document model or document dictionary
+
+    Args:
+        document: Document object or dictionary (as returned by Document.to_dict())
+
+    Returns:
+        tuple: (doc_id, category, fields dictionary)
+    """
+    if isinstance(document, dict):
+        get = document.get
+    else:
+        get = lambda name: getattr(document, name, None)
+
+    fields = {
+        'friendly_name': get('friendly_name') or get('filename') or '',
+        'summary': get('summary') or '',
+        # Key points are stored as HTML for the document view
+        'key_points': clean_html(get('key_points') or ''),
+        'text': get('text') or ''
+    }
+    return get('id'), get('category'), fields
+
+def load_full_documents(documents):
+    """
+    Make sure documents carry every indexed field before they are indexed
+
+    Search passes lightweight projections without summaries or text; those
+    are reloaded from the database. Must be called inside an application
+    context when any document is a projection.
+
+    Args:
+        documents: List of Document objects or document dictionaries
+
+    Returns:
+        list: Documents with all indexed fields available
+    """
+    complete = [doc for doc in documents if not isinstance(doc, dict) or 'text' in doc]
+    partial_ids = [doc['id'] for doc in documents if isinstance(doc, dict) and 'text' not in doc]
+    if partial_ids:
+        # Import here to avoid circular imports
+        from models import Document
+        complete.extend(Document.query.filter(Document.id.in_(partial_ids)).all())
+    return complete
+
+
+class BM25Index:
+    """
+    Inverted index with BM25 ranking over weighted document fields.
+    """
+
+    def __init__(self):
+        self._postings = {}      # dict mapping term to {doc_id: weighted term frequency}
+        self._doc_lengths = {}   # dict mapping doc_id to weighted document length
+        self._doc_terms = {}     # dict mapping doc_id to list of its distinct terms
+        self._categories = {}    # dict mapping doc_id to category
+        self._total_length = 0.0
+
+    def __len__(self):
+        return len(self._doc_lengths)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._doc_lengths
+
+    def add_document(self, doc_id: str, fields: Dict[str, str], category: Optional[str] = None) -> None:
+        """
+        Add or replace a document in the index
+
+        Args:
+            doc_id: Document ID
+            fields: Dictionary mapping field name to text
+            category: Document category used for filtering
+        """
+        if doc_id in self._doc_lengths:
+            self.remove_document(doc_id)
+
+        weighted_tf = Counter()
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS.get(field, 1.0)
+            for term in tokenize(text):
+                weighted_tf[term] += weight
+
+        for term, tf in weighted_tf.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+
+        length = float(sum(weighted_tf.values()))
+        self._doc_lengths[doc_id] = length
+        self._doc_terms[doc_id] = list(weighted_tf.keys())
+        self._categories[doc_id] = category
+        self._total_length += length
+
+    def remove_document(self, doc_id: str) -> bool:
+        """
+        Remove a document from the index
+
+        Args:
+            doc_id: Document ID
+
+        Returns:
+            True if the document was indexed, False otherwise
+        """
+        if doc_id not in self._doc_lengths:
+            return False
+
+        for term in self._doc_terms.pop(doc_id, []):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        self._categories.pop(doc_id, None)
+        return True
+
+    def score(self, query: str, doc_ids: Optional[Iterable[str]] = None,
+              category: Optional[str] = None) -> Dict[str, float]:
+        """
+        Compute BM25 scores for a query
+
+        Args:
+            query: Search query
+            doc_ids: Optional iterable restricting which documents are scored
+            category: Optional category to restrict results to
+
+        Returns:
+            dict: Mapping of doc_id to score for documents matching at least one term
+        """
+        doc_count = len(self._doc_lengths)
+        if doc_count == 0:
+            return {}
+
+        allowed = set(doc_ids) if doc_ids is not None else None
+        avg_length = (self._total_length / doc_count) or 1.0
+        scores = {}
+
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                if category and self._categories.get(doc_id) != category:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        return scores
+
+    def top_k(self, query: str, k: int, category: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Get the best-matching documents for a query
+
+        Args:
+            query: Search query
+            k: Maximum number of documents to return
+            category: Optional category filter
+
+        Returns:
+            list: (doc_id, score) tuples, highest score first
+        """
+        scores = self.score(query, category=category)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the index to a JSON-compatible dictionary"""
+        return {
+            'version': INDEX_FORMAT_VERSION,
+            'postings': self._postings,
+            'doc_lengths': self._doc_lengths,
+            'categories': self._categories
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'BM25Index':
+        """Rebuild an index from its serialized form"""
+        index = cls()
+        if data.get('version') != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported search index version: {data.get('version')}")
+
+        index._postings = data.get('postings', {})
+        index._doc_lengths = data.get('doc_lengths', {})
+        index._categories = data.get('categories', {})
+        index._total_length = float(sum(index._doc_lengths.values()))
+
+        doc_terms = {doc_id: [] for doc_id in index._doc_lengths}
+        for term, postings in index._postings.items():
+            for doc_id in postings:
+                doc_terms.setdefault(doc_id, []).append(term)
+        index._doc_terms = doc_terms
+        return index
+
+
+# Process-wide index instance, reloaded when another worker rewrites the file
+_index = None
+_index_mtime = None
+_index_lock = threading.RLock()
+
+@contextmanager
+def _index_write_lock():
+    """
+    Hold the index for a read-modify-write across threads and processes
+
+    Other workers and the standalone scripts update the same file, so the
+    exclusive file lock is taken before the index is reloaded, making every
+    update start from the latest saved version. Do not nest.
+    """
+    with _index_lock:
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        with open(INDEX_LOCK_PATH, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _save_index(index):
+    """Atomically write the index to disk"""
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=INDEX_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(index.to_dict(), f)
+        os.replace(tmp_path, INDEX_PATH)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return os.path.getmtime(INDEX_PATH)
+
+def _build_from_database():
+    """Build a fresh index from every Document in the database"""
+    from models import Document
+
+    index = BM25Index()
+    for document in Document.query.yield_per(100):
+        doc_id, category, fields = document_fields(document)
+        index.add_document(doc_id, fields, category)
+    logger.info(f"Built search index with {len(index)} documents")
+    return index
+
+def get_search_index():
+    """
+    Get the shared search index, loading it from disk or building it on first use
+
+    Must be called inside an application context when the index file does not exist yet.
+
+    Returns:
+        BM25Index: The current index
+    """
+    global _index, _index_mtime
+
+    with _index_lock:
+        mtime = os.path.getmtime(INDEX_PATH) if os.path.exists(INDEX_PATH) else None
+
+        if _index is not None and mtime == _index_mtime:
+            return _index
+
+        if mtime is not None:
+            try:
+                with open(INDEX_PATH) as f:
+                    _index = BM25Index.from_dict(json.load(f))
+                _index_mtime = mtime
+                logger.debug(f"Loaded search index with {len(_index)} documents")
+                return _index
+            except Exception as e:
+                logger.error(f"Error loading search index, rebuilding: {str(e)}")
+
+        _index = _build_from_database()
+        _index_mtime = _save_index(_index)
+        return _index
+
+def index_documents(documents):
+    """
+    Add or refresh documents in the search index
+
+    Args:
+        documents: Iterable of Document objects or document dictionaries
+
+    Returns:
+        int: Number of documents indexed
+    """
+    global _index_mtime
+
+    try:
+        with _index_write_lock():
+            index = get_search_index()
+            count = 0
+            for document in documents:
+                doc_id, category, fields = document_fields(document)
+                if doc_id:
+                    index.add_document(doc_id, fields, category)
+                    count += 1
+            if count:
+                _index_mtime = _save_index(index)
+                logger.info(f"Updated search index for {count} document(s)")
+            return count
+    except Exception as e:
+        logger.error(f"Error updating search index: {str(e)}")
+        return 0
+
+def index_document(document):
+    """
+    Add or refresh a single document in the search index
+
+    Call this after a document is uploaded, edited or reuploaded.
+
+    Args:
+        document: Document object or dictionary
+    """
+    index_documents([document])
+
+def remove_document_from_index(doc_id):
+    """
+    Remove a deleted document from the search index
+
+    Args:
+        doc_id: Document ID
+    """
+    global _index_mtime
+
+    try:
+        with _index_write_lock():
+            index = get_search_index()
+            if index.remove_document(doc_id):
+                _index_mtime = _save_index(index)
+                logger.info(f"Removed document {doc_id} from search index")
+    except Exception as e:
+        logger.error(f"Error removing document {doc_id} from search index: {str(e)}")
+
+def rebuild_search_index():
+    """
+    Rebuild the search index from the database
+
+    Returns:
+        int: Number of documents indexed
+    """
+    global _index, _index_mtime
+
+    with _index_write_lock():
+        _index = _build_from_database()
+        _index_mtime = _save_index(_index)
+        return len(_index)
+
+def lexical_scores(query, documents):
+    """
+    Score a list of documents against a query with BM25
+
+    Documents that are missing from the index are indexed on the fly.
+
+    Args:
+        query: Search query
+        documents: List of document dictionaries
+
+    Returns:
+        dict: Mapping of doc_id to BM25 score for documents matching at least one term
+    """
+    with _index_lock:
+        index = get_search_index()
+        missing = [doc for doc in documents if doc.get('id') not in index]
+    if missing:
+        index_documents(load_full_documents(missing))
+
+    # Uploads and edits update the shared index in place, so score the current one under the lock
+    with _index_lock:
+        scores = get_search_index().score(query, doc_ids=[doc['id'] for doc in documents])
+    logger.info(f"Lexical retrieval matched {len(scores)} of {len(documents)} documents")
+    return scores
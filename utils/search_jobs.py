@@ -0,0 +1,184 @@
+"""
+Background search jobs with a per-job event log for progress streaming
+"""
+import os
+import time
+import uuid
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+
+from utils.search_service import run_search
+
+logger = logging.getLogger(__name__)
+
+# Job configuration
+SEARCH_JOB_TTL_SECONDS = int(os.environ.get("SEARCH_JOB_TTL_SECONDS", 600))  # How long finished jobs stay readable
+SEARCH_JOB_MAX_JOBS = int(os.environ.get("SEARCH_JOB_MAX_JOBS", 200))        # Finished jobs kept per worker
+
+# Job states
+JOB_RUNNING = 'running'
+JOB_COMPLETE = 'complete'
+JOB_FAILED = 'failed'
+
+
+class SearchJob:
+    """
+    A search running in a background thread.
+
+    Progress is recorded as an append-only list of events so that any number
+    of listeners can replay it from the start or resume from an event id.
+    """
+
+    def __init__(self, query: str, category_filter: str, user_id: Optional[int] = None,
+                 allow_navigational: bool = True):
+        self.query_id = uuid.uuid4().hex
+        self.query = query
+        self.category_filter = category_filter
+        self.allow_navigational = allow_navigational
+        self.user_id = user_id
+        self.status = JOB_RUNNING
+        self.outcome = None  # run_search result once complete
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._events = []
+        self._condition = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status != JOB_RUNNING
+
+    def add_event(self, event: str, data: Dict[str, Any]) -> None:
+        """Append a progress event and wake any listeners"""
+        with self._condition:
+            self._events.append({'id': len(self._events), 'event': event, 'data': data})
+            self._condition.notify_all()
+
+    def wait_for_events(self, start: int, timeout: float) -> List[Dict[str, Any]]:
+        """
+        Get the events recorded after an index, waiting for new ones if needed
+
+        Args:
+            start: Index of the first event to return
+            timeout: Seconds to wait when there are no new events
+
+        Returns:
+            list: Events from `start` onwards (empty on timeout)
+        """
+        with self._condition:
+            if start >= len(self._events) and not self.finished:
+                self._condition.wait(timeout)
+            return self._events[start:]
+
+    def wait_for_event(self, event: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Wait until an event of one type has been recorded
+
+        Args:
+            event: Event name
+            timeout: Seconds to wait
+
+        Returns:
+            dict: The first such event, or None if the job finished without it or the timeout expired
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                for item in self._events:
+                    if item['event'] == event:
+                        return item
+                remaining = deadline - time.time()
+                if self.finished or remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def last_event(self) -> Optional[Dict[str, Any]]:
+        """Get the most recent event, if any"""
+        with self._condition:
+            return self._events[-1] if self._events else None
+
+    def events_of(self, event: str) -> List[Dict[str, Any]]:
+        """Get the events of one type"""
+        with self._condition:
+            return [item for item in self._events if item['event'] == event]
+
+    def _finish(self, status: str) -> None:
+        self.finished_at = time.time()
+        with self._condition:
+            self.status = status
+            self._condition.notify_all()
+
+    def run(self, app) -> None:
+        """Run the search inside an application context and record its outcome"""
+        with app.app_context():
+            try:
+                self.outcome = run_search(self.query, self.category_filter, progress_callback=self.add_event,
+                                          allow_navigational=self.allow_navigational)
+                search_info = self.outcome['search_info']
+                self.add_event('complete', {
+                    'results_found': search_info.get('results_found', 0),
+                    'elapsed_time': search_info.get('elapsed_time'),
+                    'cache_hit': self.outcome['cache_hit'],
+                    'termination': search_info.get('termination'),
+                    'ai_response': self.outcome['ai_response']
+                })
+                self._finish(JOB_COMPLETE)
+            except Exception as e:
+                logger.error(f"Search job {self.query_id} failed: {str(e)}")
+                self.error = str(e)
+                self.add_event('error', {'message': "An error occurred while searching documents."})
+                self._finish(JOB_FAILED)
+
+
+# Jobs for this worker process, by query_id. Nothing is shared between processes, so the
+# server runs a single worker (see gunicorn.conf.py) and a job is only visible to that worker.
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+def _prune_jobs():
+    """Drop finished jobs that have expired or exceed the job limit (caller holds the lock)"""
+    now = time.time()
+    finished = sorted((job for job in _jobs.values() if job.finished), key=lambda job: job.finished_at)
+    for index, job in enumerate(finished):
+        if now - job.finished_at > SEARCH_JOB_TTL_SECONDS or len(finished) - index > SEARCH_JOB_MAX_JOBS:
+            del _jobs[job.query_id]
+
+def start_search_job(app, query, category_filter='all', user_id=None, allow_navigational=True):
+    """
+    Start a search in a background thread
+
+    Args:
+        app: Flask application used to push an application context for the job
+        query: Search query
+        category_filter: Category to filter by, or 'all'
+        user_id: ID of the user who started the search
+        allow_navigational: Answer queries that name documents from the title index
+
+    Returns:
+        SearchJob: The running job
+    """
+    job = SearchJob(query, category_filter, user_id, allow_navigational)
+    with _jobs_lock:
+        _prune_jobs()
+        _jobs[job.query_id] = job
+
+    thread = threading.Thread(target=job.run, args=(app,), name=f"search-{job.query_id[:8]}", daemon=True)
+    thread.start()
+    logger.info(f"Started search job {job.query_id} for '{query}'")
+    return job
+
+def get_search_job(query_id):
+    """
+    Look up a search job
+
+    Args:
+        query_id: Job ID returned by start_search_job
+
+    Returns:
+        SearchJob: The job, or None if it is unknown or has expired
+    """
+    if not query_id:
+        return None
+    with _jobs_lock:
+        return _jobs.get(query_id)
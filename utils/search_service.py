@@ -0,0 +1,325 @@
+"""
+Search execution service shared by the search views
+"""
+import os
+import copy
+import time
+import json
+import logging
+import threading
+import concurrent.futures
+
+from models import db, Document
+from utils.ai_search_gemini import (search_documents, generate_search_response, emit_progress, SpeculativeAnswer,
+                                     ENABLE_SPECULATIVE_ANSWER, SEARCH_RESPONSE_FALLBACK, TERMINATION_COMPLETE,
+                                     TERMINATION_DEADLINE)
+from utils.search_cache import get_cached_search, store_search, normalize_query, normalize_category
+from utils.title_index import find_navigational_documents
+from utils.llm_gateway import provider_available, PROVIDER_GEMINI
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per round trip when streaming the search projection
+SEARCH_PROJECTION_BATCH_SIZE = int(os.environ.get("SEARCH_PROJECTION_BATCH_SIZE", 500))
+
+def get_search_documents(category=None):
+    """
+    Load the lightweight projection of documents used by search
+
+    Only the columns needed to rank and display results are selected; text is
+    loaded separately for the shortlisted documents that have no stored chunks.
+    No Document objects are built and no file checks are made.
+
+    Args:
+        category: Optional category to filter by
+
+    Returns:
+        list: Document dictionaries with id, filename, friendly_name and category
+    """
+    rows = db.session.query(Document.id, Document.filename, Document.friendly_name, Document.category)
+    if category:
+        rows = rows.filter(Document.category == category)
+
+    return [{
+        'id': row.id,
+        'filename': row.filename,
+        'friendly_name': row.friendly_name,
+        'category': row.category
+    } for row in rows.yield_per(SEARCH_PROJECTION_BATCH_SIZE)]
+
+def get_document_texts(doc_ids):
+    """
+    Load the full text of a set of documents
+
+    Args:
+        doc_ids: List of document IDs
+
+    Returns:
+        dict: Mapping of doc_id to text
+    """
+    if not doc_ids:
+        return {}
+    rows = db.session.query(Document.id, Document.text).filter(Document.id.in_(doc_ids))
+    return {row.id: row.text for row in rows}
+
+def build_document_repository():
+    """
+    Build the document repository passed to search_documents
+
+    Returns:
+        dict: Repository functions for retrieving documents as dictionaries
+    """
+    return {
+        'get_all_documents': get_search_documents,
+        'get_documents_by_category': lambda category: get_search_documents(category),
+        'get_document': lambda doc_id: Document.query.get(doc_id).to_dict() if Document.query.get(doc_id) else None,
+        'get_document_texts': get_document_texts
+    }
+
+class InFlightSearch:
+    """
+    A search being run by one caller that identical searches attach to.
+
+    Progress events are recorded so callers that attach late replay what
+    they missed before receiving live events.
+    """
+
+    def __init__(self):
+        self.future = concurrent.futures.Future()
+        self._events = []
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def attach(self, callback):
+        """Replay the events so far to a progress callback and subscribe it to new ones"""
+        with self._lock:
+            for event, data in self._events:
+                emit_progress(callback, event, data)
+            self._listeners.append(callback)
+
+    def emit(self, event, data):
+        """Record a progress event and pass it to every attached callback"""
+        with self._lock:
+            self._events.append((event, data))
+            listeners = list(self._listeners)
+        for callback in listeners:
+            emit_progress(callback, event, data)
+
+
+# Searches running in this worker process, by normalized (query, category)
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+def run_search(query, category_filter='all', progress_callback=None, allow_navigational=True):
+    """
+    Run a search, coalescing identical searches that are already in progress
+
+    Queries that name documents are answered from the title index without
+    calling Gemini unless allow_navigational is False. For other queries the
+    first caller for a normalized (query, category) pair runs the search;
+    callers that arrive while it is running wait for its outcome and receive
+    its progress events instead of starting their own Gemini calls. They wait
+    for as long as the first caller runs, which is bounded by its own search
+    deadline, so their event stream never restarts part-way through.
+    Must be called inside an application context.
+
+    Args:
+        query: Search query
+        category_filter: Category to filter by, or 'all'
+        progress_callback: Optional callable receiving (event, data) progress events
+        allow_navigational: Answer navigational queries from the title index
+
+    Returns:
+        dict: results, search_info, ai_response and cache_hit
+    """
+    if allow_navigational:
+        start_time = time.time()
+        matches = find_navigational_documents(query, category_filter)
+        if matches:
+            return navigational_search(query, matches, start_time, progress_callback)
+
+    key = (normalize_query(query), normalize_category(category_filter))
+    with _in_flight_lock:
+        flight = _in_flight.get(key)
+        is_leader = flight is None
+        if is_leader:
+            flight = InFlightSearch()
+            _in_flight[key] = flight
+
+    if progress_callback is not None:
+        flight.attach(progress_callback)
+
+    if not is_leader:
+        logger.info(f"Attaching to in-flight search for '{query}'")
+        outcome = copy.deepcopy(flight.future.result())
+        outcome['search_info']['coalesced'] = True
+        return outcome
+
+    try:
+        outcome = execute_search(query, category_filter, flight.emit)
+        # Waiting callers get their own copy so nobody sees another caller's changes
+        flight.future.set_result(copy.deepcopy(outcome))
+        return outcome
+    except Exception as e:
+        flight.future.set_exception(e)
+        raise
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+
+def navigational_search(query, matches, start_time, progress_callback=None):
+    """
+    Build the outcome of a navigational search from title index matches
+
+    Args:
+        query: Search query
+        matches: Matches from find_navigational_documents, best first
+        start_time: When the search started
+        progress_callback: Optional callable receiving (event, data) progress events
+
+    Returns:
+        dict: results, search_info, ai_response (None) and cache_hit
+    """
+    rows = db.session.query(Document.id, Document.summary).filter(Document.id.in_([match['id'] for match in matches]))
+    summaries = {row.id: row.summary for row in rows}
+
+    results = []
+    for match in matches:
+        result = {
+            'document': {
+                'id': match['id'],
+                'filename': match['filename'],
+                'friendly_name': match['title'],
+                'category': match['category']
+            },
+            # Coverage of the document's name, on the same 0-10 scale as AI relevance scores
+            'relevance_score': max(1, round(10 * match['coverage'])),
+            'passages': [],
+            'summary': summaries.get(match['id']) or ''
+        }
+        results.append(result)
+        emit_progress(progress_callback, 'result', {'result': result})
+
+    search_info = {
+        'results_found': len(results),
+        'documents_searched': len(results),
+        'elapsed_time': round(time.time() - start_time, 3),
+        'termination': TERMINATION_COMPLETE,
+        'navigational': True,
+        'cache_hit': False
+    }
+    logger.info(f"Navigational search for '{query}' matched {len(results)} document(s) by name")
+    emit_progress(progress_callback, 'answer_started', {
+        'results_found': len(results),
+        'results': results,
+        'search_info': search_info,
+        'cache_hit': False
+    })
+    return {
+        'results': results,
+        'search_info': search_info,
+        'ai_response': None,
+        'cache_hit': False
+    }
+
+def execute_search(query, category_filter='all', progress_callback=None):
+    """
+    Run a search, serving repeated queries from the search cache
+
+    Must be called inside an application context.
+
+    Args:
+        query: Search query
+        category_filter: Category to filter by, or 'all'
+        progress_callback: Optional callable receiving (event, data) progress events
+
+    Returns:
+        dict: results, search_info, ai_response and cache_hit
+    """
+    start_time = time.time()
+
+    cached = get_cached_search(query, category_filter)
+    if cached is not None:
+        search_info = dict(cached['search_info'])
+        search_info['elapsed_time'] = round(time.time() - start_time, 3)
+        search_info['cache_hit'] = True
+        for result in cached['results']:
+            emit_progress(progress_callback, 'result', {'result': result})
+        emit_progress(progress_callback, 'answer_started', {
+            'results_found': len(cached['results']),
+            'results': cached['results'],
+            'search_info': search_info,
+            'cache_hit': True
+        })
+        emit_progress(progress_callback, 'answer_token', {'text': cached['ai_response']})
+        return {
+            'results': cached['results'],
+            'search_info': search_info,
+            'ai_response': cached['ai_response'],
+            'cache_hit': True
+        }
+
+    # Check if the Gemini API key exists (not needed when the gateway is stubbed or replaying)
+    if not provider_available(PROVIDER_GEMINI):
+        logger.error("Gemini API key is missing")
+        raise Exception("Gemini API key is not configured")
+
+    logger.info("Performing search using Gemini API")
+    speculation = SpeculativeAnswer(query) if ENABLE_SPECULATIVE_ANSWER else None
+    search_result = search_documents(query, build_document_repository(), category_filter,
+                                     progress_callback=progress_callback, speculation=speculation)
+    results = search_result['results']
+    search_info = search_result['search_info']
+
+    logger.info(f"Search complete - Results found: {search_info['results_found']}, Time: {search_info['elapsed_time']}s")
+
+    # Debug log to check the structure
+    if results:
+        logger.debug(f"First result structure: {json.dumps(results[0], default=str)}")
+
+    # Generate AI response based on search results
+    try:
+        logger.info(f"Generating AI response for query: '{query}'")
+        # The final results go out with this event so the results page can render before the answer is written
+        emit_progress(progress_callback, 'answer_started', {
+            'results_found': len(results),
+            'results': results,
+            'search_info': dict(search_info, cache_hit=False),
+            'cache_hit': False
+        })
+        on_token = None
+        streamed = []
+        if progress_callback is not None:
+            def on_token(text):
+                streamed.append(text)
+                emit_progress(progress_callback, 'answer_token', {'text': text})
+        ai_response = speculation.resolve(results, on_token) if speculation is not None else None
+        search_info['speculative_answer'] = ai_response is not None
+        if ai_response is not None:
+            logger.info(f"Using the speculative answer ({speculation.starts} generation(s) started during scoring)")
+        else:
+            if streamed:
+                # Part of a speculative answer that was given up on has been shown already
+                emit_progress(progress_callback, 'answer_reset', {})
+            ai_response = generate_search_response(query, search_result, on_token=on_token)
+        logger.info(f"AI response generated successfully ({len(ai_response)} characters)")
+    except Exception as ai_error:
+        logger.error(f"Error generating AI response: {str(ai_error)}")
+        ai_response = SEARCH_RESPONSE_FALLBACK
+
+    # Only cache complete searches so a transient API failure or a deadline cut-off is retried next time
+    if (not search_info.get('failed') and search_info.get('termination') != TERMINATION_DEADLINE
+            and ai_response != SEARCH_RESPONSE_FALLBACK):
+        store_search(query, category_filter, {
+            'results': results,
+            'search_info': search_info,
+            'ai_response': ai_response
+        })
+
+    search_info['cache_hit'] = False
+    return {
+        'results': results,
+        'search_info': search_info,
+        'ai_response': ai_response,
+        'cache_hit': False
+    }
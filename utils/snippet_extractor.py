@@ -0,0 +1,134 @@
+"""
+Local extractive snippets with query-term highlights for search results
+"""
+import os
+import re
+import math
+import logging
+
+from utils.search_index import tokenize, tokenize_with_offsets
+from utils.chunk_store import page_label
+
+logger = logging.getLogger(__name__)
+
+# Snippet configuration
+SNIPPETS_PER_RESULT = int(os.environ.get("SEARCH_SNIPPETS_PER_RESULT", 2))
+SNIPPET_MAX_CHARS = 400   # Longest snippet; a short best sentence takes its neighbour along up to this
+SNIPPET_MIN_CHARS = 120   # Snippets shorter than this are extended with the next sentence
+
+# Sentence boundaries: end punctuation followed by whitespace, or a blank line
+SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"\'(\[])|\n\s*\n')
+
+# Section labels added by build_excerpt, e.g. "[Page 3]" or "[Pages 3-4]"
+SECTION_LABEL = re.compile(r'^\[(Pages? [\d-]+|Section \d+)\]$', re.MULTILINE)
+
+def split_sentences(text):
+    """
+    Split text into sentences with their character spans
+
+    Args:
+        text: Text to split
+
+    Returns:
+        list: (start, end) spans of non-empty sentences
+    """
+    spans = []
+    start = 0
+    for match in SENTENCE_BREAK.finditer(text):
+        spans.append((start, match.start()))
+        start = match.end()
+    spans.append((start, len(text)))
+    return [(start, end) for start, end in spans if text[start:end].strip()]
+
+def term_weights(query, texts):
+    """
+    Weight each query term by how rare it is among the texts being snippeted
+
+    Args:
+        query: Search query
+        texts: Texts of every result, so common query words count for less
+
+    Returns:
+        dict: Mapping of query term to weight
+    """
+    query_terms = set(tokenize(query))
+    if not query_terms:
+        return {}
+    document_frequency = {term: 0 for term in query_terms}
+    for text in texts:
+        for term in query_terms.intersection(tokenize(text)):
+            document_frequency[term] += 1
+    return {term: math.log(1 + (len(texts) + 1) / (count + 1)) for term, count in document_frequency.items()}
+
+def _snippet_sections(chunks, text):
+    """Get (text, page label) sections to search, from stored chunks or from plain text"""
+    if chunks:
+        return [(chunk['text'], page_label(chunk)) for chunk in chunks]
+    return [(SECTION_LABEL.sub('', text or ''), None)]
+
+def extract_snippets(weights, chunks=None, text=None, limit=SNIPPETS_PER_RESULT):
+    """
+    Pick the sentences of a document that best match a query
+
+    Sentences are scored by the weights of the distinct query terms they
+    contain, with a small bonus for repeats. Term positions come from the
+    retrieval tokenizer, so a highlight marks exactly the words the index
+    matched (including plural forms).
+
+    Args:
+        weights: Query term weights from term_weights
+        chunks: Chunk dictionaries that were sent to the model, with page information
+        text: Plain text to use when there are no chunks
+        limit: Maximum number of snippets
+
+    Returns:
+        list: Passage dictionaries with text, location (page label or None) and
+        highlights ([start, end] offsets into text), best first
+    """
+    if not weights:
+        return []
+
+    candidates = []
+    for section_index, (section_text, location) in enumerate(_snippet_sections(chunks, text)):
+        positions = [(term, start, end) for term, start, end in tokenize_with_offsets(section_text) if term in weights]
+        if not positions:
+            continue
+
+        sentences = split_sentences(section_text)
+        for index, (start, end) in enumerate(sentences):
+            # Extend a short sentence with the next one
+            if end - start < SNIPPET_MIN_CHARS and index + 1 < len(sentences):
+                next_end = sentences[index + 1][1]
+                if next_end - start <= SNIPPET_MAX_CHARS:
+                    end = next_end
+            end = min(end, start + SNIPPET_MAX_CHARS)
+
+            hits = [(term, hit_start, hit_end) for term, hit_start, hit_end in positions
+                    if start <= hit_start and hit_end <= end]
+            if not hits:
+                continue
+            distinct = {term for term, _, _ in hits}
+            score = sum(weights[term] for term in distinct) + 0.1 * (len(hits) - len(distinct))
+            candidates.append((score, section_index, section_text, location, start, end, hits))
+
+    candidates.sort(key=lambda candidate: -candidate[0])
+    snippets = []
+    taken = []
+    for score, section_index, section_text, location, start, end, hits in candidates:
+        # Skip sentences overlapping one already taken
+        if any(section == section_index and start < taken_end and taken_start < end
+               for section, taken_start, taken_end in taken):
+            continue
+        raw = section_text[start:end]
+        offset = start + len(raw) - len(raw.lstrip())
+        snippet_text = raw.strip()
+        snippets.append({
+            'text': snippet_text,
+            'location': location,
+            'highlights': [[hit_start - offset, hit_end - offset] for _, hit_start, hit_end in hits
+                           if hit_end - offset <= len(snippet_text)]
+        })
+        taken.append((section_index, start, end))
+        if len(snippets) >= limit:
+            break
+    return snippets
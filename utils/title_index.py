@@ -0,0 +1,377 @@
+"""
+In-memory title index for navigational searches and search-box autocomplete
+
+A token index and a prefix trie over each document's friendly_name, filename
+and category answer "find me this document" queries without calling Gemini.
+"""
+import os
+import re
+import time
+import logging
+import threading
+from typing import Dict, List, Any, Optional, Set, Tuple
+
+from models import db, Document
+from utils.search_cache import get_corpus_version
+
+logger = logging.getLogger(__name__)
+
+# Navigational query detection
+ENABLE_NAVIGATIONAL_SEARCH = os.environ.get("SEARCH_NAVIGATIONAL", "true").lower() != "false"
+NAVIGATIONAL_MAX_RESULTS = int(os.environ.get("SEARCH_NAVIGATIONAL_MAX_RESULTS", 3))          # More matches means a topical query
+NAVIGATIONAL_MIN_COVERAGE = float(os.environ.get("SEARCH_NAVIGATIONAL_MIN_COVERAGE", 0.6))   # Share of the title the query must name
+NAVIGATIONAL_MAX_TOKENS = int(os.environ.get("SEARCH_NAVIGATIONAL_MAX_TOKENS", 8))           # Longer queries are questions, not names
+
+# Autocomplete
+SUGGESTION_LIMIT = int(os.environ.get("SEARCH_SUGGESTION_LIMIT", 8))
+SUGGESTION_PREFIX_TERMS = 50  # Most trie completions expanded for the token being typed
+
+# Seconds between checks that the corpus has not changed since the index was built
+TITLE_INDEX_CHECK_SECONDS = float(os.environ.get("TITLE_INDEX_CHECK_SECONDS", 5))
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Words that mark a query as a question rather than a document name
+QUESTION_WORDS = frozenset([
+    'how', 'what', 'why', 'when', 'where', 'which', 'who', 'whom', 'whose', 'is', 'are', 'can',
+    'could', 'should', 'would', 'does', 'do', 'did', 'will', 'tell', 'explain', 'compare', 'list'
+])
+
+# Words ignored when matching names
+FILLER_WORDS = frozenset(['a', 'an', 'and', 'the', 'of', 'for', 'to', 'in', 'on', 'with', 'by', 'at', 'or'])
+
+# Extensions dropped from filenames before they are tokenized
+FILENAME_EXTENSION = re.compile(r'\.(pdf|docx?|txt|html?|md)$', re.IGNORECASE)
+
+def title_tokens(text):
+    """
+    Split a name into lowercase tokens
+
+    Unlike search terms, numbers and short tokens are kept so that names like
+    "Notebook March 25" match exactly; filler words are dropped.
+
+    Args:
+        text: Title, filename or category
+
+    Returns:
+        list: Tokens in order
+    """
+    if not text:
+        return []
+    text = FILENAME_EXTENSION.sub('', text)
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in FILLER_WORDS]
+
+def is_question(query):
+    """Check whether a query reads as a question or instruction rather than a document name"""
+    words = TOKEN_PATTERN.findall(query.lower())
+    return '?' in query or not words or words[0] in QUESTION_WORDS or len(words) > NAVIGATIONAL_MAX_TOKENS
+
+
+class PrefixTrie:
+    """
+    Character trie over distinct tokens for prefix completion.
+    """
+
+    END = '$'
+
+    def __init__(self):
+        self._root = {}
+
+    def add(self, token: str) -> None:
+        node = self._root
+        for char in token:
+            node = node.setdefault(char, {})
+        node[self.END] = True
+
+    def remove(self, token: str) -> None:
+        """Remove a token and prune the branches it no longer needs"""
+        path = [self._root]
+        for char in token:
+            node = path[-1].get(char)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].pop(self.END, None)
+        for depth in range(len(token), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][token[depth - 1]]
+
+    def complete(self, prefix: str, limit: int) -> List[str]:
+        """
+        Get tokens that start with a prefix, shortest first
+
+        Args:
+            prefix: Token prefix
+            limit: Maximum number of tokens
+
+        Returns:
+            list: Matching tokens
+        """
+        node = self._root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+
+        # Breadth-first so the closest completions are found first
+        tokens = []
+        frontier = [(prefix, node)]
+        while frontier and len(tokens) < limit:
+            next_frontier = []
+            for text, current in frontier:
+                if self.END in current:
+                    tokens.append(text)
+                    if len(tokens) >= limit:
+                        break
+                next_frontier.extend((text + char, child) for char, child in sorted(current.items()) if char != self.END)
+            frontier = next_frontier
+        return tokens
+
+
+class TitleIndex:
+    """
+    Token index and prefix trie over document names.
+    """
+
+    def __init__(self):
+        self._postings = {}   # dict mapping token to set of doc_ids
+        self._trie = PrefixTrie()
+        self._documents = {}  # dict mapping doc_id to {'title', 'filename', 'category', 'name_tokens', 'tokens'}
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add_document(self, doc_id: str, friendly_name: Optional[str], filename: Optional[str],
+                     category: Optional[str]) -> None:
+        """
+        Add or replace a document in the index
+
+        Args:
+            doc_id: Document ID
+            friendly_name: Display name, if any
+            filename: Original filename
+            category: Document category
+        """
+        if doc_id in self._documents:
+            self.remove_document(doc_id)
+
+        title = friendly_name or filename or ''
+        name_tokens = set(title_tokens(title))
+        tokens = name_tokens | set(title_tokens(filename)) | set(title_tokens(category))
+        for token in tokens:
+            postings = self._postings.setdefault(token, set())
+            if not postings:
+                self._trie.add(token)
+            postings.add(doc_id)
+
+        self._documents[doc_id] = {
+            'title': title,
+            'filename': filename,
+            'category': category,
+            'name_tokens': name_tokens,
+            'tokens': tokens
+        }
+
+    def remove_document(self, doc_id: str) -> bool:
+        """
+        Remove a document from the index
+
+        Args:
+            doc_id: Document ID
+
+        Returns:
+            True if the document was indexed, False otherwise
+        """
+        document = self._documents.pop(doc_id, None)
+        if document is None:
+            return False
+
+        for token in document['tokens']:
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.discard(doc_id)
+                if not postings:
+                    del self._postings[token]
+                    self._trie.remove(token)
+        return True
+
+    def _candidates(self, tokens: List[str], prefix_last: bool) -> Set[str]:
+        """Get the documents containing every token, treating the last one as a prefix if asked"""
+        matched = None
+        for position, token in enumerate(tokens):
+            if prefix_last and position == len(tokens) - 1:
+                docs = set()
+                for completion in self._trie.complete(token, SUGGESTION_PREFIX_TERMS):
+                    docs.update(self._postings.get(completion, ()))
+            else:
+                docs = self._postings.get(token, set())
+            matched = set(docs) if matched is None else matched & docs
+            if not matched:
+                return set()
+        return matched or set()
+
+    def _rank(self, doc_ids: Set[str], tokens: List[str], category: Optional[str],
+              prefix_last: bool) -> List[Tuple[str, float]]:
+        """
+        Order documents by how much of their name the query covers
+
+        Returns:
+            list: (doc_id, coverage) tuples, best first
+        """
+        query_tokens = set(tokens)
+        partial = tokens[-1] if prefix_last else None
+        ranked = []
+        for doc_id in doc_ids:
+            document = self._documents[doc_id]
+            if category and document['category'] != category:
+                continue
+            name_tokens = document['name_tokens']
+            covered = sum(1 for token in name_tokens
+                          if token in query_tokens or (partial and token.startswith(partial)))
+            ranked.append((doc_id, covered / len(name_tokens) if name_tokens else 0.0))
+        # Names that start with the query come first among equally covered ones
+        ranked.sort(key=lambda item: (-item[1], not self._documents[item[0]]['title'].lower().startswith(tokens[0]),
+                                      len(self._documents[item[0]]['title']), self._documents[item[0]]['title']))
+        return ranked
+
+    def document_info(self, doc_id: str) -> Dict[str, Any]:
+        """Get the stored names of an indexed document"""
+        document = self._documents[doc_id]
+        return {
+            'id': doc_id,
+            'title': document['title'],
+            'filename': document['filename'],
+            'category': document['category']
+        }
+
+    def navigational_matches(self, query: str, category: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Find the documents a navigational query names
+
+        A query is navigational when it is not a question, every token appears
+        in a document's name, filename or category, few documents match, and
+        the query covers most of the best match's name.
+
+        Args:
+            query: Search query
+            category: Optional category to restrict matches to
+
+        Returns:
+            list: (doc_id, coverage) tuples, best first, or an empty list for other queries
+        """
+        if is_question(query):
+            return []
+        tokens = title_tokens(query)
+        if not tokens:
+            return []
+
+        ranked = self._rank(self._candidates(tokens, False), tokens, category, False)
+        if not ranked or len(ranked) > NAVIGATIONAL_MAX_RESULTS or ranked[0][1] < NAVIGATIONAL_MIN_COVERAGE:
+            return []
+        return ranked
+
+    def suggest(self, prefix: str, category: Optional[str] = None, limit: int = SUGGESTION_LIMIT) -> List[Dict[str, Any]]:
+        """
+        Suggest documents for a partially typed query
+
+        Args:
+            prefix: Text typed so far; its last token may be incomplete
+            category: Optional category to restrict suggestions to
+            limit: Maximum number of suggestions
+
+        Returns:
+            list: Document name dictionaries, best first
+        """
+        tokens = title_tokens(prefix)
+        if not tokens:
+            return []
+        # A trailing space means the last token is complete
+        prefix_last = not prefix[-1:].isspace()
+        ranked = self._rank(self._candidates(tokens, prefix_last), tokens, category, prefix_last)
+        # Documents matched only through their category are not name suggestions
+        return [self.document_info(doc_id) for doc_id, coverage in ranked if coverage > 0][:limit]
+
+
+# Process-wide index, rebuilt when the corpus version changes
+_index = None
+_index_version = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+def _build_from_database():
+    """Build a fresh index from the names of every Document"""
+    index = TitleIndex()
+    rows = db.session.query(Document.id, Document.friendly_name, Document.filename, Document.category)
+    for row in rows.yield_per(500):
+        index.add_document(row.id, row.friendly_name, row.filename, row.category)
+    logger.info(f"Built title index with {len(index)} documents")
+    return index
+
+def get_title_index():
+    """
+    Get the shared title index, rebuilding it when documents have changed
+
+    The corpus version is checked at most every TITLE_INDEX_CHECK_SECONDS, so
+    uploads and renames in any worker are picked up shortly after they happen.
+    Must be called inside an application context.
+
+    Returns:
+        TitleIndex: The current index
+    """
+    global _index, _index_version, _index_checked_at
+
+    with _index_lock:
+        now = time.time()
+        if _index is not None and now - _index_checked_at < TITLE_INDEX_CHECK_SECONDS:
+            return _index
+
+        version = get_corpus_version()
+        _index_checked_at = now
+        if _index is None or version != _index_version:
+            _index = _build_from_database()
+            _index_version = version
+        return _index
+
+def find_navigational_documents(query, category_filter='all'):
+    """
+    Get the documents a navigational query names
+
+    Args:
+        query: Search query
+        category_filter: Category to filter by, or 'all'
+
+    Returns:
+        list: Dictionaries with the document names and 'coverage', best first; empty for other queries
+    """
+    if not ENABLE_NAVIGATIONAL_SEARCH:
+        return []
+    category = category_filter if category_filter and category_filter.lower() != 'all' else None
+
+    try:
+        index = get_title_index()
+        return [dict(index.document_info(doc_id), coverage=coverage)
+                for doc_id, coverage in index.navigational_matches(query, category)]
+    except Exception as e:
+        logger.error(f"Error matching navigational query: {str(e)}")
+        return []
+
+def suggest_documents(prefix, category_filter='all', limit=SUGGESTION_LIMIT):
+    """
+    Get autocomplete suggestions for the search box
+
+    Args:
+        prefix: Text typed so far
+        category_filter: Category to filter by, or 'all'
+        limit: Maximum number of suggestions
+
+    Returns:
+        list: Dictionaries with id, title, filename and category
+    """
+    category = category_filter if category_filter and category_filter.lower() != 'all' else None
+
+    try:
+        return get_title_index().suggest(prefix, category, limit)
+    except Exception as e:
+        logger.error(f"Error building search suggestions: {str(e)}")
+        return []
@@ -0,0 +1,593 @@
+"""
+CPU-only dense vector index for semantic candidate retrieval
+
+Each document is split into chunks and every chunk is embedded as a fixed-width
+float32 vector: hashed TF-IDF features (unigrams and bigrams) projected onto a
+latent semantic (LSA) basis fitted on the corpus. The vectors are stored as a
+single .npy matrix that workers open memory-mapped, so a query is scored with
+one matrix-vector product and no worker keeps a private copy of the index.
+"""
+import os
+import json
+import math
+import zlib
+import fcntl
+import logging
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List
+
+import numpy as np
+
+from utils.search_index import INDEX_DIR, tokenize, document_fields, load_full_documents
+
+logger = logging.getLogger(__name__)
+
+# Index files (all live next to the BM25 index)
+VECTORS_PATH = os.path.join(INDEX_DIR, 'chunk_vectors.npy')
+PROJECTION_PATH = os.path.join(INDEX_DIR, 'lsa_projection.npy')
+IDF_PATH = os.path.join(INDEX_DIR, 'hashed_idf.npy')
+METADATA_PATH = os.path.join(INDEX_DIR, 'chunk_vectors.json')
+LOCK_PATH = os.path.join(INDEX_DIR, 'chunk_vectors.lock')
+
+# Embedding configuration
+HASH_DIM = 2048        # Number of hashed TF-IDF features
+EMBEDDING_DIM = 256    # Width of the stored LSA vectors
+CHUNK_SIZE = 2000      # Characters per embedded chunk
+CHUNK_OVERLAP = 200
+BATCH_SIZE = 512       # Chunks embedded per batch while building
+
+# Refit the LSA basis once the corpus has grown this much since the last fit
+REFIT_GROWTH_FACTOR = 2.0
+
+def _hash_feature(feature):
+    """Map a feature string to a (bucket, sign) pair with a stable hash"""
+    value = zlib.crc32(feature.encode('utf-8'))
+    return value % HASH_DIM, (1.0 if (value >> 31) & 1 == 0 else -1.0)
+
+def _hashed_counts(text):
+    """
+    Compute sparse hashed term counts for a piece of text
+
+    Args:
+        text: Text to featurize
+
+    Returns:
+        dict: Mapping of hash bucket to signed count
+    """
+    terms = tokenize(text)
+    features = Counter(terms)
+    features.update(f"{a}_{b}" for a, b in zip(terms, terms[1:]))
+
+    counts = {}
+    for feature, count in features.items():
+        bucket, sign = _hash_feature(feature)
+        counts[bucket] = counts.get(bucket, 0.0) + sign * count
+    return counts
+
+def _tfidf_matrix(sparse_rows, idf):
+    """
+    Build a dense, L2-normalized TF-IDF matrix from sparse hashed counts
+
+    Args:
+        sparse_rows: List of dicts produced by _hashed_counts
+        idf: IDF weights for each hash bucket
+
+    Returns:
+        numpy.ndarray: float32 matrix of shape (len(sparse_rows), HASH_DIM)
+    """
+    matrix = np.zeros((len(sparse_rows), HASH_DIM), dtype=np.float32)
+    for row, counts in enumerate(sparse_rows):
+        for bucket, count in counts.items():
+            # Sublinear term frequency, keeping the hash sign
+            if count:
+                matrix[row, bucket] = math.copysign(1.0 + math.log(abs(count)), count)
+    matrix *= idf
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def _embed(sparse_rows, idf, projection):
+    """
+    Project sparse hashed counts onto the LSA basis
+
+    Args:
+        sparse_rows: List of dicts produced by _hashed_counts
+        idf: IDF weights for each hash bucket
+        projection: float32 matrix of shape (HASH_DIM, EMBEDDING_DIM)
+
+    Returns:
+        numpy.ndarray: L2-normalized float32 vectors of shape (len(sparse_rows), EMBEDDING_DIM)
+    """
+    if not sparse_rows:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+    vectors = _tfidf_matrix(sparse_rows, idf) @ projection
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+def _fit_model(sparse_rows):
+    """
+    Fit IDF weights and the LSA projection on a set of chunks
+
+    The projection is taken from the top eigenvectors of the feature covariance
+    matrix, which is accumulated in batches so the full TF-IDF matrix is never
+    held in memory at once.
+
+    Args:
+        sparse_rows: List of dicts produced by _hashed_counts
+
+    Returns:
+        tuple: (idf vector, projection matrix)
+    """
+    doc_freq = np.zeros(HASH_DIM, dtype=np.float64)
+    for counts in sparse_rows:
+        for bucket in counts:
+            doc_freq[bucket] += 1
+    idf = np.log((1 + len(sparse_rows)) / (1 + doc_freq)).astype(np.float32) + 1.0
+
+    covariance = np.zeros((HASH_DIM, HASH_DIM), dtype=np.float64)
+    for start in range(0, len(sparse_rows), BATCH_SIZE):
+        batch = _tfidf_matrix(sparse_rows[start:start + BATCH_SIZE], idf)
+        covariance += batch.T.astype(np.float64) @ batch
+
+    # eigh returns eigenvalues in ascending order - keep the largest components
+    _, eigenvectors = np.linalg.eigh(covariance)
+    projection = eigenvectors[:, ::-1][:, :EMBEDDING_DIM].astype(np.float32)
+    return idf, projection
+
+def _document_chunks(document):
+    """
+    Split a document into the chunks that get embedded
+
+    The first chunk holds the title and summary so short documents and
+    metadata-only matches are still represented.
+
+    Args:
+        document: Document object or dictionary
+
+    Returns:
+        list: List of chunk texts
+    """
+    # Import here to avoid circular imports
+    from utils.document_ai import split_document_into_chunks
+
+    _, _, fields = document_fields(document)
+    chunks = [f"{fields['friendly_name']}\n{fields['summary']}\n{fields['key_points']}"]
+    if fields['text']:
+        chunks.extend(split_document_into_chunks(fields['text'], chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP))
+    return chunks
+
+
+class VectorIndex:
+    """
+    Memory-mapped matrix of chunk vectors plus the model used to embed queries.
+    """
+
+    def __init__(self, vectors, rows, idf, projection, fitted_rows):
+        self.vectors = vectors          # (n_chunks, EMBEDDING_DIM) float32, usually memory-mapped
+        self.rows = rows                # list of {'doc_id', 'chunk', 'category'} per vector row
+        self.idf = idf
+        self.projection = projection
+        self.fitted_rows = fitted_rows  # Number of chunks the LSA basis was fitted on
+
+    def __len__(self):
+        return len(self.rows)
+
+    def doc_ids(self):
+        """Get the set of indexed document IDs"""
+        return {row['doc_id'] for row in self.rows}
+
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed arbitrary texts (queries, team descriptions) into the index space
+
+        Args:
+            texts: List of texts
+
+        Returns:
+            numpy.ndarray: Matrix of shape (len(texts), EMBEDDING_DIM)
+        """
+        return _embed([_hashed_counts(text) for text in texts], self.idf, self.projection)
+
+    def chunk_scores(self, query: str) -> np.ndarray:
+        """
+        Cosine similarity of a query against every chunk
+
+        Args:
+            query: Query text
+
+        Returns:
+            numpy.ndarray: One score per row
+        """
+        if len(self.rows) == 0:
+            return np.zeros(0, dtype=np.float32)
+        query_vector = self.embed_texts([query])[0]
+        return self.vectors @ query_vector
+
+    def document_scores(self, query: str, doc_ids=None) -> Dict[str, float]:
+        """
+        Best chunk similarity per document
+
+        Args:
+            query: Query text
+            doc_ids: Optional iterable restricting which documents are returned
+
+        Returns:
+            dict: Mapping of doc_id to max cosine similarity
+        """
+        allowed = set(doc_ids) if doc_ids is not None else None
+        scores = {}
+        for row, score in zip(self.rows, self.chunk_scores(query).tolist()):
+            doc_id = row['doc_id']
+            if allowed is not None and doc_id not in allowed:
+                continue
+            if score > scores.get(doc_id, float('-inf')):
+                scores[doc_id] = score
+        return scores
+
+    def best_match_scores(self, texts: List[str]) -> List[float]:
+        """
+        For each text, the similarity of its best-matching chunk in the corpus
+
+        Args:
+            texts: List of texts
+
+        Returns:
+            list: One score per text
+        """
+        if not texts or len(self.rows) == 0:
+            return [0.0] * len(texts)
+        similarities = self.embed_texts(texts) @ self.vectors.T
+        return similarities.max(axis=1).tolist()
+
+
+# Process-wide index instance, reloaded when another worker rewrites the files
+_index = None
+_index_mtime = None
+_index_lock = threading.RLock()
+_lock_file = None  # Open lock file while this process holds the index file lock
+
+# Background rebuilds: one at a time, replaying edits made while they ran
+_rebuild_lock = threading.Lock()
+_rebuild_thread = None
+_changed_during_rebuild = None  # Doc IDs edited while a rebuild is reading the database
+
+@contextmanager
+def _index_file_lock(exclusive=False):
+    """
+    Hold the index files against writers in other processes
+
+    Writers take the lock exclusively and readers shared, so nobody loads the
+    metadata of one version with the vectors of another. Nested calls from the
+    thread holding it reuse the outer lock, so a read-modify-write must take it
+    exclusively on the outside.
+    """
+    global _lock_file
+
+    with _index_lock:
+        if _lock_file is not None:
+            yield
+            return
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        with open(LOCK_PATH, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            _lock_file = lock_file
+            try:
+                yield
+            finally:
+                _lock_file = None
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _atomic_save_npy(path, array):
+    """Write a .npy file via a temporary file so readers never see a partial file"""
+    fd, tmp_path = tempfile.mkstemp(dir=INDEX_DIR, suffix='.npy.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _save_index(index):
+    """Persist the index and return the metadata file mtime used for reload checks"""
+    with _index_file_lock(exclusive=True):
+        _atomic_save_npy(VECTORS_PATH, np.asarray(index.vectors, dtype=np.float32))
+        _atomic_save_npy(PROJECTION_PATH, index.projection)
+        _atomic_save_npy(IDF_PATH, index.idf)
+
+        # Metadata is written last - its mtime marks a complete index on disk
+        fd, tmp_path = tempfile.mkstemp(dir=INDEX_DIR, suffix='.json.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'rows': index.rows, 'fitted_rows': index.fitted_rows}, f)
+        os.replace(tmp_path, METADATA_PATH)
+        return os.path.getmtime(METADATA_PATH)
+
+def _load_index():
+    """Load the index from disk with the vector matrix memory-mapped"""
+    with _index_file_lock():
+        with open(METADATA_PATH) as f:
+            metadata = json.load(f)
+        # An empty matrix cannot be memory-mapped
+        mmap_mode = 'r' if metadata['rows'] else None
+        return VectorIndex(
+            vectors=np.load(VECTORS_PATH, mmap_mode=mmap_mode),
+            rows=metadata['rows'],
+            idf=np.load(IDF_PATH),
+            projection=np.load(PROJECTION_PATH),
+            fitted_rows=metadata.get('fitted_rows', len(metadata['rows']))
+        )
+
+def _build_index(documents):
+    """
+    Fit the embedding model and embed every chunk of the given documents
+
+    Args:
+        documents: Iterable of Document objects or dictionaries
+
+    Returns:
+        VectorIndex: Newly built index
+    """
+    rows = []
+    sparse_rows = []
+    for document in documents:
+        doc_id, category, _ = document_fields(document)
+        for chunk_number, chunk in enumerate(_document_chunks(document)):
+            rows.append({'doc_id': doc_id, 'chunk': chunk_number, 'category': category})
+            sparse_rows.append(_hashed_counts(chunk))
+
+    idf, projection = _fit_model(sparse_rows)
+    vectors = np.vstack([
+        _embed(sparse_rows[start:start + BATCH_SIZE], idf, projection)
+        for start in range(0, len(sparse_rows), BATCH_SIZE)
+    ] or [np.zeros((0, EMBEDDING_DIM), dtype=np.float32)])
+    return VectorIndex(vectors, rows, idf, projection, fitted_rows=len(rows))
+
+def _record_change(doc_id):
+    """Remember a document edited while a rebuild is running so the rebuild can replay it"""
+    with _index_lock:
+        if _changed_during_rebuild is not None:
+            _changed_during_rebuild.add(doc_id)
+
+def rebuild_vector_index():
+    """
+    Rebuild the vector index from every Document in the database
+
+    The index is built without holding the index lock, so searches keep using
+    the previous index (or run without semantic scores) until it is swapped in.
+    Documents edited meanwhile are embedded again afterwards. Must be called
+    inside an application context.
+
+    Returns:
+        int: Number of chunk vectors in the index
+    """
+    global _index, _index_mtime, _changed_during_rebuild
+    from models import Document
+
+    with _rebuild_lock:
+        with _index_lock:
+            _changed_during_rebuild = set()
+        try:
+            built = _build_index(Document.query.yield_per(100))
+            with _index_file_lock(exclusive=True):
+                _index_mtime = _save_index(built)
+                _index = _load_index()
+                changed = _changed_during_rebuild
+        finally:
+            with _index_lock:
+                _changed_during_rebuild = None
+        logger.info(f"Built vector index with {len(built)} chunk vectors")
+
+        if changed:
+            documents = Document.query.filter(Document.id.in_(changed)).all()
+            update_document_vectors(documents)
+            for doc_id in changed - {document.id for document in documents}:
+                remove_document_vectors(doc_id)
+        return len(built)
+
+def start_vector_index_build(app=None):
+    """
+    Rebuild the vector index in a background thread unless one is already running
+
+    Args:
+        app: Flask application used to push an application context
+            (default: the current application)
+
+    Returns:
+        bool: True if a build was started
+    """
+    global _rebuild_thread
+    if app is None:
+        from flask import current_app, has_app_context
+        if not has_app_context():
+            logger.warning("Cannot build the vector index outside an application context")
+            return False
+        app = current_app._get_current_object()
+
+    def build():
+        try:
+            with app.app_context():
+                rebuild_vector_index()
+        except Exception as e:
+            logger.error(f"Error building vector index: {str(e)}")
+
+    with _index_lock:
+        if _rebuild_thread is not None and _rebuild_thread.is_alive():
+            return False
+        _rebuild_thread = threading.Thread(target=build, name="vector-index-build", daemon=True)
+        _rebuild_thread.start()
+        return True
+
+def get_vector_index():
+    """
+    Get the shared vector index, loading it from disk when another process rewrote it
+
+    The index is never built here; see start_vector_index_build.
+
+    Returns:
+        VectorIndex: The current index, or None until one has been built
+    """
+    global _index, _index_mtime
+
+    with _index_lock:
+        mtime = os.path.getmtime(METADATA_PATH) if os.path.exists(METADATA_PATH) else None
+
+        if mtime is None or (_index is not None and mtime == _index_mtime):
+            return _index
+
+        try:
+            _index = _load_index()
+            _index_mtime = mtime
+        except Exception as e:
+            logger.error(f"Error loading vector index: {str(e)}")
+        return _index
+
+def update_document_vectors(documents):
+    """
+    Add or refresh documents in the vector index
+
+    New chunks are embedded with the existing model. Once the corpus has grown
+    past REFIT_GROWTH_FACTOR times the size the model was fitted on, a rebuild
+    is started in the background so the LSA basis follows the corpus.
+
+    Args:
+        documents: Iterable of Document objects or dictionaries
+
+    Returns:
+        int: Number of documents embedded
+    """
+    global _index, _index_mtime
+
+    try:
+        documents = list(documents)
+        with _index_file_lock(exclusive=True):
+            updated_ids = {document_fields(document)[0] for document in documents}
+            for doc_id in updated_ids:
+                _record_change(doc_id)
+            index = get_vector_index()
+            if index is None:
+                # The build picks these documents up from the database
+                start_vector_index_build()
+                return 0
+
+            keep = [i for i, row in enumerate(index.rows) if row['doc_id'] not in updated_ids]
+            rows = [index.rows[i] for i in keep]
+            sparse_rows = []
+            for document in documents:
+                doc_id, category, _ = document_fields(document)
+                for chunk_number, chunk in enumerate(_document_chunks(document)):
+                    rows.append({'doc_id': doc_id, 'chunk': chunk_number, 'category': category})
+                    sparse_rows.append(_hashed_counts(chunk))
+
+            vectors = np.vstack([
+                np.asarray(index.vectors)[keep],
+                _embed(sparse_rows, index.idf, index.projection)
+            ])
+            _index_mtime = _save_index(VectorIndex(vectors, rows, index.idf, index.projection, index.fitted_rows))
+            _index = _load_index()
+            logger.info(f"Updated vector index for {len(documents)} document(s)")
+
+            if index.fitted_rows == 0 or len(rows) > index.fitted_rows * REFIT_GROWTH_FACTOR:
+                logger.info("Vector index has outgrown its embedding model, rebuilding in the background")
+                start_vector_index_build()
+            return len(documents)
+    except Exception as e:
+        logger.error(f"Error updating vector index: {str(e)}")
+        return 0
+
+def update_document_metadata(document):
+    """
+    Refresh a document's title chunk and category in the vector index
+
+    Use this when the name, category or summary changed but the text did not:
+    only the first chunk (title, summary and key points) is embedded again.
+    Documents that are not in the index yet are embedded in full.
+
+    Args:
+        document: Document object or dictionary
+
+    Returns:
+        bool: True if the index was updated
+    """
+    global _index, _index_mtime
+
+    try:
+        with _index_file_lock(exclusive=True):
+            doc_id, category, _ = document_fields(document)
+            _record_change(doc_id)
+            index = get_vector_index()
+            positions = [i for i, row in enumerate(index.rows) if row['doc_id'] == doc_id] if index else []
+            title_positions = [i for i in positions if index.rows[i]['chunk'] == 0]
+            if not title_positions:
+                return update_document_vectors([document]) > 0
+
+            rows = [dict(row, category=category) if row['doc_id'] == doc_id else row for row in index.rows]
+            vectors = np.array(index.vectors)
+            title_chunk = _document_chunks(document)[0]
+            vectors[title_positions[0]] = _embed([_hashed_counts(title_chunk)], index.idf, index.projection)[0]
+            _index_mtime = _save_index(VectorIndex(vectors, rows, index.idf, index.projection, index.fitted_rows))
+            _index = _load_index()
+            logger.info(f"Updated vector index metadata for document {doc_id}")
+            return True
+    except Exception as e:
+        logger.error(f"Error updating vector index metadata for document {document_fields(document)[0]}: {str(e)}")
+        return False
+
+def remove_document_vectors(doc_id):
+    """
+    Remove a deleted document's chunks from the vector index
+
+    Args:
+        doc_id: Document ID
+    """
+    global _index, _index_mtime
+
+    try:
+        with _index_file_lock(exclusive=True):
+            _record_change(doc_id)
+            index = get_vector_index()
+            if index is None:
+                return
+            keep = [i for i, row in enumerate(index.rows) if row['doc_id'] != doc_id]
+            if len(keep) == len(index.rows):
+                return
+            rows = [index.rows[i] for i in keep]
+            vectors = np.asarray(index.vectors)[keep]
+            _index_mtime = _save_index(VectorIndex(vectors, rows, index.idf, index.projection, index.fitted_rows))
+            _index = _load_index()
+            logger.info(f"Removed document {doc_id} from vector index")
+    except Exception as e:
+        logger.error(f"Error removing document {doc_id} from vector index: {str(e)}")
+
+def semantic_scores(query, documents):
+    """
+    Score a list of documents against a query by best chunk similarity
+
+    Documents that are missing from the index are embedded on the fly. Until
+    the index has been built, a background build is started and no scores are
+    returned, so retrieval runs on lexical scores alone.
+
+    Args:
+        query: Search query
+        documents: List of document dictionaries
+
+    Returns:
+        dict: Mapping of doc_id to cosine similarity, or None while the index is not ready
+    """
+    index = get_vector_index()
+    if index is None:
+        start_vector_index_build()
+        return None
+
+    indexed = index.doc_ids()
+    missing = [doc for doc in documents if doc.get('id') not in indexed]
+    if missing:
+        update_document_vectors(load_full_documents(missing))
+        index = get_vector_index()
+
+    return index.document_scores(query, doc_ids=[doc['id'] for doc in documents])